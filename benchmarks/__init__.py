@@ -0,0 +1,4 @@
+"""
+Package: benchmarks
+Micro benchmarks of the service hot paths, run with python -m benchmarks.<name>
+"""
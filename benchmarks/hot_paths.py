@@ -0,0 +1,253 @@
+"""
+Hot path benchmark
+
+Times the customer and address hot paths through the Flask test client
+against a database seeded with flask db-seed data: listing customers
+unfiltered and by every filter, reading and updating a customer, address
+CRUD, and Customer.serialize/deserialize and hash_password. The results
+are written as JSON, and compare flags the cases that got slower than a
+stored baseline.
+
+  python -m benchmarks.hot_paths run --rows 1000 100000 --output results.json
+  python -m benchmarks.hot_paths compare baseline.json results.json
+
+The database is DATABASE_URI (a SQLite file by default) and its customers
+and addresses are DELETED first, so point it at a scratch database. The
+sizes are seeded in ascending order, each one topping up the previous.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from service import create_app
+from service.common import serializer
+from service.common.loadtest import UPDATE_FIELDS
+from service.common.query_stats import query_stats
+from service.common.seed import seed
+from service.models import Address, Customer, customer_cache, db, hash_password, init_db
+
+BASE_URL = "/api/customers"
+METRICS = ("min_ms", "p50_ms", "p95_ms", "p99_ms", "mean_ms")
+
+# A value of every filter that the seeded data contains
+FILTERS = {
+    "first_name": "Mary",
+    "last_name": "Smith",
+    "email": None,  # an existing email, looked up after seeding
+    "active": "true",
+    "street": None,  # an existing street, looked up after seeding
+    "city": "Springfield",
+    "state": "IL",
+    "country": "USA",
+    "pin_code": None,  # an existing pin code, looked up after seeding
+}
+
+ADDRESS = {"street": "1 Benchmark Way", "city": "Springfield", "state": "IL", "country": "USA", "pin_code": "62701"}
+
+
+def timings(function, iterations, warmup=3):
+    """Calls function iterations times and returns its latency percentiles in ms"""
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+
+    def percentile(fraction):
+        return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+    return {
+        "iterations": iterations,
+        "min_ms": samples[0],
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "mean_ms": sum(samples) / len(samples),
+    }
+
+
+def expect(response, code):
+    """Fails the benchmark when a request did not do what it is timed for"""
+    if response.status_code != code:
+        raise AssertionError(f"{response.request.method} {response.request.path} returned "
+                             f"{response.status_code}, expected {code}")
+    return response
+
+
+def top_up(rows, seed_value):
+    """Seeds customers, with one address each, until the database holds rows"""
+    existing = db.session.query(Customer).count()
+    if existing < rows:
+        slow_query_ms, query_stats.slow_query_ms = query_stats.slow_query_ms, 0
+        try:
+            seed(rows - existing, 1, seed_value + rows)
+        finally:
+            query_stats.slow_query_ms = slow_query_ms
+    customer_cache.clear()
+
+
+def sample_filters():
+    """Returns FILTERS with the values that depend on the seeded data"""
+    address = db.session.query(Address).order_by(Address.address_id).first()
+    customer = db.session.get(Customer, address.customer_id)
+    return {**FILTERS, "email": customer.email, "street": address.street, "pin_code": address.pin_code}
+
+
+def request_cases(client, ids, page_size, rng):
+    """Returns the timed requests, by case name"""
+    cases = {"list_all": lambda: expect(client.get(BASE_URL, query_string={"limit": page_size}), 200)}
+    for name, value in sample_filters().items():
+        query = {name: value, "limit": page_size}
+        cases[f"list_by_{name}"] = lambda query=query: expect(client.get(BASE_URL, query_string=query), 200)
+
+    def get_customer():
+        expect(client.get(f"{BASE_URL}/{rng.choice(ids)}"), 200)
+
+    def put_customer():
+        customer_id = rng.choice(ids)
+        customer = expect(client.get(f"{BASE_URL}/{customer_id}"), 200).get_json()
+        # the PUT appends the addresses it is sent, so keep them out of it
+        body = {name: customer[name] for name in UPDATE_FIELDS}
+        expect(client.put(f"{BASE_URL}/{customer_id}", json={**body, "addresses": []}), 200)
+
+    def address_crud():
+        customer_id = rng.choice(ids)
+        url = f"{BASE_URL}/{customer_id}/addresses"
+        address = expect(client.post(url, json={**ADDRESS, "customer_id": customer_id}), 201).get_json()
+        expect(client.get(f"{url}/{address['address_id']}"), 200)
+        expect(client.put(f"{url}/{address['address_id']}", json=address), 200)
+        expect(client.delete(f"{url}/{address['address_id']}"), 204)
+
+    cases.update(get_customer=get_customer, get_put_customer=put_customer, address_crud=address_crud)
+    return cases
+
+
+def model_cases(customer_id):
+    """Returns the timed model helpers, by case name"""
+    customer = Customer.find(customer_id)
+    data = customer.serialize()
+    return {
+        "serialize": customer.serialize,
+        "deserialize": lambda: Customer().deserialize(data),
+        "hash_password": lambda: hash_password(data["password"]),
+    }
+
+
+def run(client, sizes, iterations, page_size=100, seed_value=0):
+    """Seeds every size in turn and returns the timings of every case"""
+    db.session.query(Address).delete()
+    db.session.query(Customer).delete()
+    db.session.commit()
+    results = []
+    for rows in sorted(sizes):
+        top_up(rows, seed_value)
+        ids = db.session.scalars(db.select(Customer.id)).all()
+        rng = random.Random(seed_value)
+        cases = {**request_cases(client, ids, page_size, rng), **model_cases(ids[0])}
+        for case, function in cases.items():
+            result = {"rows": rows, "case": case, **timings(function, iterations)}
+            results.append(result)
+            print(f"{rows:>9} {case:<20} p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms")
+        db.session.remove()
+    return results
+
+
+def compare(baseline, current, metric="p50_ms", threshold=0.2):
+    """Returns the cases of current that are more than threshold slower than baseline
+
+    Cases are matched by rows and name, cases missing from either side are
+    skipped.
+    """
+    before = {(result["rows"], result["case"]): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = before.get((result["rows"], result["case"]))
+        if old is None or not old[metric]:
+            continue
+        change = result[metric] / old[metric] - 1
+        if change > threshold:
+            regressions.append({"rows": result["rows"], "case": result["case"],
+                                "baseline": old[metric], "current": result[metric], "change": change})
+    return regressions
+
+
+def command_run(args):
+    """Runs the benchmark and writes its results"""
+    app = create_app()
+    app.logger.setLevel("WARNING")
+    init_db(app)
+    started = datetime.now(timezone.utc)
+    results = run(app.test_client(), args.rows, args.iterations, args.page_size, args.seed)
+    report = {
+        "meta": {
+            "started": started.isoformat(),
+            "database": db.engine.dialect.name,
+            "python": platform.python_version(),
+            "encoder": "orjson" if serializer.orjson is not None else "json",
+            "iterations": args.iterations,
+            "page_size": args.page_size,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            return report_regressions(json.load(file), report, args.metric, args.threshold)
+    return 0
+
+
+def command_compare(args):
+    """Compares two result files"""
+    with open(args.baseline, encoding="utf-8") as file:
+        baseline = json.load(file)
+    with open(args.results, encoding="utf-8") as file:
+        current = json.load(file)
+    return report_regressions(baseline, current, args.metric, args.threshold)
+
+
+def report_regressions(baseline, current, metric, threshold):
+    """Prints the regressions and returns the exit code, 1 if there are any"""
+    regressions = compare(baseline, current, metric, threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression['rows']:>9} {regression['case']:<20} {metric} "
+              f"{regression['baseline']:8.3f} -> {regression['current']:8.3f} ms (+{regression['change']:.0%})")
+    if not regressions:
+        print(f"No case is more than {threshold:.0%} slower than the baseline ({metric})")
+    return 1 if regressions else 0
+
+
+def main():
+    """Parses the command line"""
+    # a scratch SQLite file unless told otherwise, read by create_app()
+    os.environ.setdefault("DATABASE_URI", "sqlite:////tmp/benchmark.db")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="seed, time every case and write the results")
+    run_parser.add_argument("--rows", type=int, nargs="+", default=[1000], help="customer counts to run at")
+    run_parser.add_argument("--iterations", type=int, default=100)
+    run_parser.add_argument("--page-size", type=int, default=100, help="limit of the list requests")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default="benchmark-results.json")
+    run_parser.add_argument("--baseline", help="results to compare against after the run")
+    compare_parser = commands.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("results")
+    for command in (run_parser, compare_parser):
+        command.add_argument("--metric", choices=METRICS, default="p50_ms")
+        command.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, 0.2 is 20%%")
+    args = parser.parse_args()
+    return command_run(args) if args.command == "run" else command_compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
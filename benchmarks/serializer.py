@@ -0,0 +1,68 @@
+"""
+Serializer benchmark
+
+Measures the per-Customer cost of building a response body, comparing
+Customer.serialize() + flask-restx marshal + json.dumps with the compiled
+single-pass serializer. Only transient objects are used, no database.
+
+  python -m benchmarks.serializer --customers 1000 --addresses 2
+"""
+import argparse
+import json
+import timeit
+from flask_restx import marshal
+from service.common import serializer
+from service.models import Address, Customer
+from service.routes import customer_model, serialize_customer
+
+
+def make_customers(count, addresses):
+    """Builds transient Customers with their Addresses"""
+    customers = []
+    for number in range(count):
+        customers.append(Customer(
+            id=number, first_name=f"First{number}", last_name=f"Last{number}",
+            email=f"user{number}@example.com", password="0" * 64, active=True, version=1,
+            addresses=[Address(address_id=number * addresses + index, street=f"{index} Main St",
+                               city="Springfield", state="IL", country="USA", pin_code="62701",
+                               customer_id=number)
+                       for index in range(addresses)]))
+    return customers
+
+
+def marshalled(customers):
+    """The previous response path: serialize, marshal, then encode"""
+    return json.dumps(marshal([customer.serialize() for customer in customers], customer_model)).encode("utf-8")
+
+
+def compiled(customers):
+    """The compiled single-pass serializer"""
+    return serializer.dumps([serialize_customer(customer) for customer in customers])
+
+
+def measure(function, customers, repeat):
+    """Returns the best time per Customer in microseconds"""
+    best = min(timeit.repeat(lambda: function(customers), number=1, repeat=repeat))
+    return best / len(customers) * 1e6
+
+
+def main():
+    """Runs the benchmark and prints the cost per Customer"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--customers", type=int, default=1000)
+    parser.add_argument("--addresses", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    customers = make_customers(args.customers, args.addresses)
+    assert json.loads(marshalled(customers)) == json.loads(compiled(customers))
+    before = measure(marshalled, customers, args.repeat)
+    after = measure(compiled, customers, args.repeat)
+    encoder = "orjson" if serializer.orjson is not None else "json"
+    print(f"customers={args.customers} addresses={args.addresses} encoder={encoder}")
+    print(f"serialize + marshal: {before:8.2f} us/customer")
+    print(f"compiled serializer: {after:8.2f} us/customer ({before / after:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
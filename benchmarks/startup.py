@@ -0,0 +1,89 @@
+"""
+Startup benchmark
+
+Measures what a fresh interpreter pays to import the service package and
+to build the app, as every gunicorn worker without --preload, every flask
+CLI call and every pod cold start does: wall time, peak RSS and the number
+of modules imported, the median over fresh processes. It then measures a
+worker forked from a preloaded app, as gunicorn --preload starts them:
+from the fork to the first request served, with the post_fork hook run.
+
+  python -m benchmarks.startup --runs 10
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+# What each case runs in a fresh interpreter; it prints the number of modules loaded
+CASES = {
+    "import service": "import sys, service; print(len(sys.modules))",
+    "from service import app": "import sys; from service import app; print(len(sys.modules))",
+}
+
+
+def measure(code, env):
+    """Runs code in a fresh interpreter, returns its seconds, peak RSS in MiB and module count"""
+    start = time.perf_counter()
+    with subprocess.Popen([sys.executable, "-c", code], env=env, stdout=subprocess.PIPE) as process:
+        output = process.stdout.read()
+        # reap the child here to get its resource usage
+        _, wait_status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(wait_status)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(f"{code!r} exited with status {process.returncode}")
+    # ru_maxrss is in KiB on Linux
+    return seconds, usage.ru_maxrss / 1024, int(output)
+
+
+def forked_worker(runs):
+    """Returns the median ms from forking a preloaded app to its first request served"""
+    # pylint: disable=import-outside-toplevel
+    from service import create_app
+    spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+    gunicorn_conf = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(gunicorn_conf)
+
+    app = create_app()
+    worker = SimpleNamespace(app=SimpleNamespace(callable=app))
+    app.test_client().get("/health")
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            gunicorn_conf.post_fork(None, worker)
+            response = app.test_client().get("/health")
+            os._exit(0 if response.status_code == 200 else 1)  # pylint: disable=protected-access
+        _, wait_status = os.waitpid(pid, 0)
+        if os.waitstatus_to_exitcode(wait_status) != 0:
+            raise RuntimeError("the forked worker failed")
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    """Runs every case and prints the medians"""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", maxsplit=1)[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    env = {**os.environ, "PYTHONDONTWRITEBYTECODE": "1"}
+    # the app is built against a scratch SQLite file unless told otherwise
+    env.setdefault("DATABASE_URI", "sqlite:////tmp/startup.db")
+    for case, code in CASES.items():
+        measure(code, env)  # warm the bytecode and file caches
+        runs = [measure(code, env) for _ in range(args.runs)]
+        seconds, rss, modules = (statistics.median(values) for values in zip(*runs))
+        print(f"{case:<26} {seconds * 1000:8.1f} ms  {rss:6.1f} MiB  {modules:5.0f} modules")
+    os.environ.setdefault("DATABASE_URI", env["DATABASE_URI"])
+    print(f"{'forked preloaded worker':<26} {forked_worker(args.runs):8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Gunicorn configuration, read from the working directory when gunicorn starts
+
+Start the service with gunicorn "service:create_app()". The master builds
+the app once (preload) and forks the workers from it. The number of
+workers and threads follows the CPU and memory limits of the container,
+and every setting can be overridden from the environment:
+
+  GUNICORN_WORKER_CLASS  gthread (default), or gevent/eventlet for async workers
+  WEB_CONCURRENCY        number of workers
+  GUNICORN_THREADS       threads per gthread worker
+  GUNICORN_WORKER_CONNECTIONS  concurrent requests per async worker
+  GUNICORN_MASTER_MEMORY_MB, GUNICORN_WORKER_MEMORY_MB
+                         memory of the preloaded master and added by every worker,
+                         used to fit the workers into the memory limit
+  GUNICORN_KEEPALIVE, GUNICORN_MAX_REQUESTS, GUNICORN_MAX_REQUESTS_JITTER,
+  GUNICORN_TIMEOUT, GUNICORN_PRELOAD
+"""
+import glob
+import importlib
+import math
+import os
+
+ASYNC_WORKERS = ("gevent", "eventlet")
+
+
+def env_int(name, default):
+    """Returns the integer environment variable name, or default"""
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def cpu_limit(root="/sys/fs/cgroup"):
+    """Returns the CPUs the container may use, from its cgroup quota or the CPU affinity"""
+    quota = period = None
+    try:  # cgroup v2
+        with open(os.path.join(root, "cpu.max"), encoding="utf-8") as file:
+            quota, period = file.read().split()
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open(os.path.join(root, "cpu", "cpu.cfs_quota_us"), encoding="utf-8") as file:
+                quota = file.read().strip()
+            with open(os.path.join(root, "cpu", "cpu.cfs_period_us"), encoding="utf-8") as file:
+                period = file.read().strip()
+        except OSError:
+            pass
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    if quota not in (None, "max", "-1"):
+        cpus = min(cpus, int(quota) / int(period))
+    return cpus
+
+
+def memory_limit_mb(root="/sys/fs/cgroup"):
+    """Returns the memory limit of the container in MiB, or None when unlimited"""
+    for path in ("memory.max", os.path.join("memory", "memory.limit_in_bytes")):
+        try:
+            with open(os.path.join(root, path), encoding="utf-8") as file:
+                value = file.read().strip()
+        except OSError:
+            continue
+        # cgroup v1 reports "no limit" as a huge number
+        if value != "max" and int(value) < 2 ** 60:
+            return int(value) / 2 ** 20
+        return None
+    return None
+
+
+def pool_capacity(environ=None):
+    """Returns the connections a worker's pool may open, with the SQLAlchemy defaults"""
+    environ = os.environ if environ is None else environ
+    return int(environ.get("DB_POOL_SIZE") or 5) + int(environ.get("DB_MAX_OVERFLOW") or 10)
+
+
+def concurrency(cpus, memory_mb, environ=None):
+    """Returns the worker class, workers and threads for the given limits
+
+    CPU bound the workers to 2 * CPUs + 1, memory to what fits next to the
+    preloaded master. The service mostly waits on the database, so gthread
+    workers run several requests at once, but never more than their
+    connection pool can serve.
+    """
+    environ = os.environ if environ is None else environ
+    kind = environ.get("GUNICORN_WORKER_CLASS") or "gthread"
+    count = 2 * math.ceil(cpus) + 1
+    if memory_mb is not None:
+        master_mb = int(environ.get("GUNICORN_MASTER_MEMORY_MB") or 60)
+        worker_mb = int(environ.get("GUNICORN_WORKER_MEMORY_MB") or 20)
+        count = min(count, int((memory_mb - master_mb) // worker_mb))
+    count = max(1, int(environ.get("WEB_CONCURRENCY") or count))
+    if kind in ASYNC_WORKERS:
+        return kind, count, 1
+    return kind, count, max(1, min(int(environ.get("GUNICORN_THREADS") or 4), pool_capacity(environ)))
+
+
+######################################################################
+# Settings
+######################################################################
+CPUS = cpu_limit()
+MEMORY_MB = memory_limit_mb()
+worker_class, workers, threads = concurrency(CPUS, MEMORY_MB)
+if worker_class in ASYNC_WORKERS:
+    # more requests in flight than pooled connections would only queue for one
+    worker_connections = env_int("GUNICORN_WORKER_CONNECTIONS", pool_capacity())
+
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', '8080')}")
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() in ("true", "1", "yes")
+# longer than the idle timeout of the load balancer in front, so it closes first
+keepalive = env_int("GUNICORN_KEEPALIVE", 75)
+# recycle workers now and then, staggered so they do not restart together
+max_requests = env_int("GUNICORN_MAX_REQUESTS", 1000)
+max_requests_jitter = env_int("GUNICORN_MAX_REQUESTS_JITTER", 100)
+timeout = env_int("GUNICORN_TIMEOUT", 30)
+graceful_timeout = timeout
+# the worker heartbeat files, on tmpfs so a slow disk cannot stall them
+if os.path.isdir("/dev/shm"):
+    worker_tmp_dir = "/dev/shm"  # pylint: disable=invalid-name
+
+
+######################################################################
+# Server hooks
+######################################################################
+def on_starting(server):
+    """Empties the Prometheus multiprocess directory left by the last run"""
+    server.log.info("Using %d %s worker(s) with %d thread(s) for %.2f CPU(s) and %s MiB",
+                    workers, worker_class, threads, CPUS,
+                    "unlimited" if MEMORY_MB is None else f"{MEMORY_MB:.0f}")
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for path in glob.glob(os.path.join(directory, "*.db")):
+            os.remove(path)
+
+
+def child_exit(server, worker):  # pylint: disable=unused-argument
+    """Drops the live gauges of a worker that exited"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess  # pylint: disable=import-outside-toplevel
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    """Gives the worker its own database connections
+
+    The pools a preloaded master handed down are dropped without closing
+    the master's connections, and the pool counters start over. Async
+    workers also need psycopg2 made cooperative, when psycogreen is
+    installed.
+    """
+    # pylint: disable=import-outside-toplevel
+    app = worker.app.callable  # only set in the master when preloading
+    if app is not None:
+        from service.models import dispose_engines, pool_stats
+        dispose_engines(app)
+        pool_stats.reset()
+    if worker_class in ASYNC_WORKERS:
+        try:
+            importlib.import_module(f"psycogreen.{worker_class}").patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen is not installed, database calls block the %s worker", worker_class)
@@ -1,26 +1,18 @@
 """
 Package: service
 Package for the application models and service routes
-This module creates and configures the Flask app and sets up the logging
-and SQL database
+create_app() creates and configures the Flask app and sets up the logging
+and SQL database. Importing the package only defines the Swagger API;
+service.app, used by FLASK_APP=service:app and the tests, is created by
+create_app() on first access.
 """
-import sys
 from flask import Flask
 from flask_restx import Api
-from service import config
-from service.common import log_handlers
-
-# Create Flask application
-app = Flask(__name__)
-app.url_map.strict_slashes = False
-app.config.from_object(config)
-app.config['ERROR_404_HELP'] = False
 
 ######################################################################
-# Configure Swagger before initializing it
+# Configure Swagger, it is bound to the app in create_app()
 ######################################################################
 api = Api(
-        app,
         version='1.0.0',
         title='Customers REST API Service',
         description='This is the Customers microservice server.',
@@ -30,24 +22,68 @@ api = Api(
         prefix='/api',
     )
 
-# Dependencies require we import the routes AFTER the Flask app is created
-# pylint: disable=wrong-import-position, wrong-import-order
-from service import routes, models  # noqa: E402, E261
-# pylint: disable=wrong-import-position
-from service.common import error_handlers, cli_commands  # noqa: F401, E402
+# The app of FLASK_APP=service:app, gunicorn service:app and the tests,
+# created by create_app() when first accessed, see __getattr__()
+app: Flask
+
+
+def create_app(config=None):
+    """Creates the Flask app
+
+    The settings of service/config.py are overridden by the config mapping,
+    if given. Nothing connects to the database here: every worker opens its
+    connections on first use, and the tables are only created when
+    DB_CREATE_SCHEMA is set.
+    """
+    # pylint: disable=import-outside-toplevel, redefined-outer-name
+    from service import models, routes
+    from service.common import cli_commands, error_handlers, log_handlers  # noqa: F401 pylint: disable=unused-import
+    from service.common.compression import compression
+    from service.common.metrics import metrics
+    from service.common.query_stats import query_stats
+    from service.common.static_assets import static_assets
+
+    app = Flask(__name__)
+    app.url_map.strict_slashes = False
+    app.config.from_object("service.config")
+    app.config['ERROR_404_HELP'] = False
+    if config:
+        app.config.from_mapping(config)
+
+    # the routes are declared on api when service.routes is imported
+    api.init_app(app)
+    routes.init_app(app)
+    cli_commands.init_app(app)
+
+    # Set up logging for production
+    log_handlers.init_logging(app, "gunicorn.error")
+
+    # Count the queries of every request, see service/common/query_stats.py
+    query_stats.init_app(app)
+
+    # Prometheus metrics served at /metrics, see service/common/metrics.py
+    metrics.init_app(app, models.pool_stats, models.customer_cache, models.customer_flights)
+
+    # Compressed responses, and the static files precompressed in memory,
+    # see service/common/compression.py and service/common/static_assets.py
+    compression.init_app(app)
+    static_assets.init_app(app)
 
-# Set up logging for production
-log_handlers.init_logging(app, "gunicorn.error")
+    models.configure(app)
+    if app.config['DB_CREATE_SCHEMA']:
+        with app.app_context():
+            models.db.create_all()  # make our SQLAlchemy tables
 
-app.logger.info(70 * "*")
-app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
-app.logger.info(70 * "*")
+    app.logger.info(70 * "*")
+    app.logger.info("  S E R V I C E   R U N N I N G  ".center(70, "*"))
+    app.logger.info(70 * "*")
+    app.logger.info("Service initialized!")
+    return app
 
-try:
-    models.init_db(app)  # make our SQLAlchemy tables
-except Exception as error:  # pylint: disable=broad-except
-    app.logger.critical("%s: Cannot continue", error)
-    # gunicorn requires exit code 4 to stop spawning workers when they die
-    sys.exit(4)
 
-app.logger.info("Service initialized!")
+def __getattr__(name):
+    """Creates service.app on first access"""
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,8 +1,13 @@
 """
 Flask CLI Command Extensions
+
+The commands import what only they need when they run, so that the
+workers serving requests never load it.
 """
-from service import app
-from service.models import db
+from http.client import HTTPException
+import click
+from flask.cli import with_appcontext
+from service.models import db, create_indexes
 
 
 ######################################################################
@@ -10,7 +15,8 @@ from service.models import db
 # Usage:
 #   flask db-create
 ######################################################################
-@app.cli.command("db-create")
+@click.command("db-create")
+@with_appcontext
 def db_create():
     """
     Recreates a local database. You probably should not use this on
@@ -19,3 +25,98 @@ def db_create():
     db.drop_all()
     db.create_all()
     db.session.commit()
+
+
+######################################################################
+# Command to add missing indexes to an existing database
+# Usage:
+#   flask db-indexes
+######################################################################
+@click.command("db-indexes")
+@with_appcontext
+def db_indexes():
+    """
+    Creates the declared indexes that are missing. This is safe to run
+    on a live database: PostgreSQL builds them CONCURRENTLY.
+    """
+    created = create_indexes()
+    for name in created:
+        click.echo(f"Created index {name}")
+    click.echo(f"{len(created)} index(es) created")
+
+
+######################################################################
+# Command to fill the database with synthetic data for load testing
+# Usage:
+#   flask db-seed --customers 1000000 --addresses-per-customer 2 --seed 42
+######################################################################
+@click.command("db-seed")
+@with_appcontext
+@click.option("--customers", type=click.IntRange(min=0), default=1000, show_default=True,
+              help="Number of customers to create")
+@click.option("--addresses-per-customer", type=click.IntRange(min=0), default=1, show_default=True,
+              help="Number of addresses of every customer")
+@click.option("--seed", "seed_value", type=int, default=0, show_default=True,
+              help="Seed of the generator, the same seed creates the same data")
+@click.option("--batch-size", type=click.IntRange(min=1), default=10000, show_default=True,
+              help="Customers inserted and committed per batch")
+def db_seed(customers, addresses_per_customer, seed_value, batch_size):
+    """
+    Inserts deterministic synthetic customers and addresses in bulk.
+    Ids continue after the existing customers.
+    """
+    from service.common.seed import seed  # pylint: disable=import-outside-toplevel
+
+    def progress(done):
+        click.echo(f"{done}/{customers} customers")
+
+    created, addresses = seed(customers, addresses_per_customer, seed_value, batch_size, progress)
+    click.echo(f"Seeded {created} customers and {addresses} addresses")
+
+
+######################################################################
+# Command to drive load against a running instance
+# Usage:
+#   flask loadtest --url http://localhost:8080 --workers 16 --duration 60
+######################################################################
+@click.command("loadtest")
+@click.option("--url", default="http://localhost:8080", show_default=True,
+              help="Base URL of the running service")
+@click.option("--workers", type=click.IntRange(min=1), default=8, show_default=True,
+              help="Number of concurrent workers")
+@click.option("--duration", type=click.FloatRange(min=0), default=30.0, show_default=True,
+              help="Seconds to run for")
+@click.option("--operations", type=click.IntRange(min=1), default=None,
+              help="Stop after this many operations instead of after --duration")
+@click.option("--mix", default=None,
+              help="Weights of the operations, e.g. get=40,list=10,list_filtered=15,create=5,"
+                   "update=10,activate=5,address_crud=15")
+@click.option("--seed", "seed_value", type=int, default=0, show_default=True,
+              help="Seed of the operation picks")
+def loadtest(url, workers, duration, operations, mix, seed_value):  # pylint: disable=too-many-arguments
+    """
+    Sends a weighted mix of requests from concurrent workers and reports
+    the throughput and the latency percentiles of every endpoint.
+    """
+    from service.common.loadtest import LoadTest, parse_mix  # pylint: disable=import-outside-toplevel
+    try:
+        weights = parse_mix(mix) if mix else None
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint="--mix") from error
+    try:
+        report = LoadTest(url, weights, workers, duration, operations, seed_value).run()
+    except (OSError, HTTPException) as error:
+        raise click.ClickException(f"Cannot load test {url}: {error}") from error
+    click.echo(f"{'endpoint':<30} {'requests':>9} {'errors':>7} {'req/s':>9} "
+               f"{'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for row in report["endpoints"] + [report["total"]]:
+        latencies = " ".join(f"{row[name]:9.2f}" if row[name] is not None else f"{'-':>9}"
+                             for name in ("p50_ms", "p90_ms", "p99_ms", "max_ms"))
+        click.echo(f"{row['endpoint']:<30} {row['requests']:>9} {row['errors']:>7} {row['rps']:9.1f} {latencies}")
+    click.echo(f"{workers} workers, {report['elapsed']:.1f}s")
+
+
+def init_app(app):
+    """Adds the commands to the flask CLI of app"""
+    for command in (db_create, db_indexes, db_seed, loadtest):
+        app.cli.add_command(command)
@@ -0,0 +1,147 @@
+"""
+Compression
+
+This module compresses the responses of the service with brotli, when the
+brotli package is installed, or gzip, whichever the client prefers in its
+Accept-Encoding. Responses of text types at least min_size bytes long are
+compressed whole, streamed responses chunk by chunk as they are sent. A
+strong ETag gets the encoding appended, as every encoding is its own
+representation.
+"""
+import gzip
+import zlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# The types worth compressing besides text/*
+COMPRESSIBLE_TYPES = {
+    "application/json", "application/x-ndjson", "application/javascript", "application/xml", "image/svg+xml",
+}
+
+
+def available_encodings():
+    """Returns the encodings this process can produce, preferred first"""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate(encodings):
+    """Returns the encoding of encodings the client accepts most, or None"""
+    return request.accept_encodings.best_match(encodings)
+
+
+def compress(data, encoding, level):
+    """Compresses data whole, level is the gzip level or the brotli quality"""
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    # mtime=0 gives the same bytes for the same content
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def compress_stream(chunks, encoding, level):
+    """Compresses an iterable of chunks, flushing after every chunk
+
+    Each chunk reaches the client as soon as it is produced, as it would
+    uncompressed, at the cost of a few bytes per flush. chunks is closed
+    when the stream ends or is abandoned.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        process, finish = compressor.compress, compressor.flush
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+    try:
+        for chunk in chunks:
+            yield process(chunk.encode("utf-8") if isinstance(chunk, str) else chunk) + flush()
+        yield finish()
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+
+
+def encoded_etag(etag, encoding):
+    """Returns the ETag of the encoding of the representation tagged etag"""
+    return f"{etag}-{encoding}"
+
+
+def etag_variants(etag):
+    """Returns etag and the ETags of its encoded representations, for If-Match and If-None-Match"""
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ("br", "gzip")]
+
+
+def compressible(mimetype):
+    """Tells whether content of mimetype is worth compressing"""
+    mimetype = mimetype or ""
+    return mimetype.startswith("text/") or mimetype in COMPRESSIBLE_TYPES
+
+
+class Compression:
+    """Compresses the responses of an app by the Accept-Encoding of the request"""
+
+    def __init__(self):
+        self.enabled = True
+        self.min_size = 1024
+        self.levels = {"gzip": 6, "br": 4}
+
+    def init_app(self, app):
+        """Reads the settings and hooks the compression into app"""
+        self.enabled = app.config.get("COMPRESS_RESPONSES", True)
+        self.min_size = app.config.get("COMPRESS_MIN_SIZE", 1024)
+        self.levels = {"gzip": app.config.get("COMPRESS_GZIP_LEVEL", 6),
+                       "br": app.config.get("COMPRESS_BROTLI_QUALITY", 4)}
+        app.after_request(self.compress_response)
+
+    def compress_response(self, response):
+        """Compresses response when the client accepts an encoding we produce"""
+        if response.status_code == 304:
+            return self.tag_not_modified(response)
+        if not self.enabled or not compressible(response.mimetype) or response.direct_passthrough \
+                or "Content-Encoding" in response.headers \
+                or response.status_code < 200 or response.status_code in (204, 304):
+            return response
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(available_encodings())
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = compress_stream(response.response, encoding, self.levels[encoding])
+            response.headers.pop("Content-Length", None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            response.set_data(compress(data, encoding, self.levels[encoding]))
+        response.headers["Content-Encoding"] = encoding
+        # other bytes than the identity body, so another strong validator
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(encoded_etag(etag, encoding))
+        return response
+
+    def tag_not_modified(self, response):
+        """Gives a 304 the ETag of the encoded representation it revalidates
+
+        The 200 the client holds was tagged with the encoding appended, so
+        when If-None-Match names that ETag the 304 carries it too, and
+        caches keep their validator.
+        """
+        etag, weak = response.get_etag()
+        if not self.enabled or not etag or weak:
+            return response
+        response.vary.add("Accept-Encoding")
+        for encoding in available_encodings():
+            if request.if_none_match.contains(encoded_etag(etag, encoding)):
+                response.set_etag(encoded_etag(etag, encoding))
+                break
+        return response
+
+
+# Response compression, hooked into the app in service/__init__.py
+compression = Compression()
@@ -0,0 +1,263 @@
+"""
+Load Test
+
+This module drives a weighted mix of the documented endpoints against a
+running instance of the service from a pool of worker threads, and
+reports the throughput and the latency percentiles of every endpoint.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlencode, urlsplit
+
+BASE_PATH = "/api/customers"
+
+# The operations a worker picks from, and their default weights
+DEFAULT_MIX = {
+    "list": 10,
+    "list_filtered": 15,
+    "get": 40,
+    "create": 5,
+    "update": 10,
+    "activate": 5,
+    "address_crud": 15,
+}
+
+# The fields of a customer an update sends back
+UPDATE_FIELDS = ("first_name", "last_name", "email", "password", "active")
+
+# Filters that match customers of the flask db-seed data
+FILTERS = (
+    {"city": "Springfield"}, {"state": "IL"}, {"last_name": "Smith"}, {"first_name": "Mary"}, {"active": "true"},
+)
+
+ADDRESS = {"street": "1 Load Test Way", "city": "Springfield", "state": "IL", "country": "USA", "pin_code": "62701"}
+
+
+def parse_mix(text):
+    """Parses a mix like "get=40,list=10" into weights by operation
+
+    Operations left out are not run. Raises ValueError on unknown
+    operations and on weights that are not positive integers.
+    """
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"unknown operation '{name}', use {', '.join(DEFAULT_MIX)}")
+        if not weight.strip().isdigit() or int(weight) <= 0:
+            raise ValueError(f"the weight of '{name}' must be a positive integer")
+        mix[name] = int(weight)
+    return mix
+
+
+def percentile(samples, fraction):
+    """Returns the fraction percentile of sorted samples"""
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))]
+
+
+class Recorder:
+    """Collects the latency and the outcome of every request, by endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.errors = {}
+
+    def record(self, endpoint, seconds, ok):
+        """Records one request"""
+        with self._lock:
+            self.samples.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def report(self, elapsed):
+        """Returns the throughput and latency of every endpoint, and of all of them"""
+        with self._lock:
+            rows = [self._summary(endpoint, samples, self.errors.get(endpoint, 0), elapsed)
+                    for endpoint, samples in sorted(self.samples.items())]
+            every = list(itertools.chain.from_iterable(self.samples.values()))
+            total = self._summary("total", every, sum(self.errors.values()), elapsed)
+        return {"elapsed": elapsed, "endpoints": rows, "total": total}
+
+    @staticmethod
+    def _summary(endpoint, samples, errors, elapsed):
+        samples = sorted(samples)
+        if not samples:
+            return {"endpoint": endpoint, "requests": 0, "errors": errors, "rps": 0.0,
+                    "p50_ms": None, "p90_ms": None, "p99_ms": None, "max_ms": None}
+        return {
+            "endpoint": endpoint,
+            "requests": len(samples),
+            "errors": errors,
+            "rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(samples, 0.50) * 1000,
+            "p90_ms": percentile(samples, 0.90) * 1000,
+            "p99_ms": percentile(samples, 0.99) * 1000,
+            "max_ms": samples[-1] * 1000,
+        }
+
+
+class Client:
+    """A keep-alive HTTP connection to the service, reopened after failures"""
+
+    def __init__(self, base_url, timeout=10.0):
+        url = urlsplit(base_url)
+        self._connection_class = HTTPSConnection if url.scheme == "https" else HTTPConnection
+        self._netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.timeout = timeout
+        self._connection = None
+
+    def request(self, method, path, params=None, body=None):
+        """Sends a request and returns its status and decoded JSON body
+
+        Raises OSError or HTTPException when the request fails.
+        """
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        if self._connection is None:
+            self._connection = self._connection_class(self._netloc, timeout=self.timeout)
+        try:
+            self._connection.request(method, self.prefix + path,
+                                     json.dumps(body) if body is not None else None, headers)
+            response = self._connection.getresponse()
+            data = response.read()
+        except (OSError, HTTPException):
+            self.close()
+            raise
+        return response.status, json.loads(data) if data else None
+
+    def close(self):
+        """Closes the connection"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class LoadTest:  # pylint: disable=too-many-instance-attributes
+    """A load test of a running instance
+
+    Every worker thread keeps its own keep-alive connection and picks the
+    next operation at random by the weights of the mix, until the duration
+    is over or, when given, the number of operations has been run. The
+    customers to read and update are the first page of the instance plus
+    the ones the test creates.
+    """
+
+    def __init__(self, base_url, mix=None, workers=8, duration=10.0, operations=None, seed_value=0, timeout=10.0):
+        self.base_url = base_url
+        self.mix = mix or DEFAULT_MIX
+        self.workers = workers
+        self.duration = duration
+        self.operations = operations
+        self.seed_value = seed_value
+        self.timeout = timeout
+        self.recorder = Recorder()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._deadline = None
+        self._ids = []
+
+    def run(self):
+        """Runs the load test and returns the report of Recorder.report()"""
+        client = Client(self.base_url, self.timeout)
+        try:
+            code, customers = client.request("GET", BASE_PATH, {"limit": 1000, "fields": "id"})
+        finally:
+            client.close()
+        if code != 200:
+            raise HTTPException(f"GET {BASE_PATH} returned {code}")
+        self._ids = [customer["id"] for customer in customers]
+        start = time.perf_counter()
+        self._deadline = start + self.duration
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # result() raises the exception of a worker that failed
+            for future in [executor.submit(self._worker, number) for number in range(self.workers)]:
+                future.result()
+        return self.recorder.report(time.perf_counter() - start)
+
+    def _next(self):
+        with self._lock:
+            if self.operations is not None:
+                if self._started >= self.operations:
+                    return False
+            elif time.perf_counter() >= self._deadline:
+                return False
+            self._started += 1
+            return True
+
+    def _worker(self, number):
+        rng = random.Random(self.seed_value * 1000 + number)
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        client = Client(self.base_url, self.timeout)
+        try:
+            while self._next():
+                name = rng.choices(names, weights)[0]
+                if name not in ("list", "list_filtered", "create") and not self._ids:
+                    name = "create"
+                getattr(self, f"_{name}")(client, rng)
+        finally:
+            client.close()
+
+    def _call(self, client, endpoint, method, path, expected, **kwargs):
+        """Sends one request and records it, returns its body or None on failure"""
+        start = time.perf_counter()
+        try:
+            code, data = client.request(method, path, **kwargs)
+        except (OSError, HTTPException, ValueError):
+            code, data = None, None
+        ok = code == expected
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        return data if ok else None
+
+    def _list(self, client, _rng):
+        self._call(client, "GET /customers", "GET", BASE_PATH, 200, params={"limit": 100})
+
+    def _list_filtered(self, client, rng):
+        params = {**rng.choice(FILTERS), "limit": 100}
+        self._call(client, "GET /customers?filter", "GET", BASE_PATH, 200, params=params)
+
+    def _get(self, client, rng):
+        self._call(client, "GET /customers/{id}", "GET", f"{BASE_PATH}/{rng.choice(self._ids)}", 200)
+
+    def _create(self, client, rng):
+        body = {
+            "first_name": "Load", "last_name": f"Test{rng.randrange(1000000)}",
+            "email": f"load.{uuid.uuid4().hex}@example.com", "password": "load-test", "active": True,
+            "addresses": [],
+        }
+        customer = self._call(client, "POST /customers", "POST", BASE_PATH, 201, body=body)
+        if customer is not None:
+            self._ids.append(customer["id"])
+
+    def _update(self, client, rng):
+        path = f"{BASE_PATH}/{rng.choice(self._ids)}"
+        customer = self._call(client, "GET /customers/{id}", "GET", path, 200)
+        if customer is not None:
+            # the posted addresses would be added again, the rest is read-only
+            body = {name: customer[name] for name in UPDATE_FIELDS}
+            self._call(client, "PUT /customers/{id}", "PUT", path, 200, body={**body, "addresses": []})
+
+    def _activate(self, client, rng):
+        path = f"{BASE_PATH}/{rng.choice(self._ids)}/activate"
+        self._call(client, "PUT /customers/{id}/activate", "PUT", path, 200)
+
+    def _address_crud(self, client, rng):
+        customer_id = rng.choice(self._ids)
+        path = f"{BASE_PATH}/{customer_id}/addresses"
+        address = self._call(client, "POST /addresses", "POST", path, 201, body={**ADDRESS, "customer_id": customer_id})
+        if address is None:
+            return
+        address_path = f"{path}/{address['address_id']}"
+        self._call(client, "GET /addresses/{id}", "GET", address_path, 200)
+        self._call(client, "PUT /addresses/{id}", "PUT", address_path, 200, body=address)
+        self._call(client, "DELETE /addresses/{id}", "DELETE", address_path, 204)
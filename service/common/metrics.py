@@ -0,0 +1,135 @@
+"""
+Metrics
+
+This module keeps the Prometheus metrics of the service: request counts,
+latency histograms per flask-restx resource and method, requests in
+flight, and the connection pool, customer cache and coalesced reads of
+every worker.
+
+Under gunicorn set PROMETHEUS_MULTIPROC_DIR to an empty directory shared
+by the workers; every worker then writes its values to memory-mapped
+files there and /metrics aggregates them, whichever worker serves it.
+gunicorn.conf.py empties the directory at startup and drops the live
+gauges of workers that exit.
+"""
+import os
+import time
+from contextvars import ContextVar
+from flask import request
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess, REGISTRY)
+
+# When the request being handled started
+_started = ContextVar("request_started", default=None)
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests handled", ["endpoint", "method", "status"])
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Time spent handling HTTP requests", ["endpoint", "method"])
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled", multiprocess_mode="livesum")
+
+POOL = Gauge(
+    "db_pool_connections", "Connections of the primary pool by state", ["state"], multiprocess_mode="livesum")
+POOL_EVENTS = Counter(
+    "db_pool_events_total", "Connection pool checkouts, timeouts, connects and invalidations", ["event"])
+POOL_CHECKOUT_SECONDS = Counter(
+    "db_pool_checkout_seconds_total", "Time spent waiting to check out connections")
+CACHE_SIZE = Gauge(
+    "customer_cache_entries", "Entries in the customer cache", multiprocess_mode="livesum")
+CACHE_EVENTS = Counter(
+    "customer_cache_events_total", "Customer cache hits, misses, evictions and expirations", ["event"])
+SINGLE_FLIGHT_EVENTS = Counter(
+    "single_flight_events_total", "Customer reads run, coalesced into a running one, failed and invalidated",
+    ["event"])
+
+POOL_COUNTERS = ("checkouts", "timeouts", "connects", "invalidations")
+CACHE_COUNTERS = ("hits", "misses", "evictions", "expirations")
+SINGLE_FLIGHT_COUNTERS = ("executions", "coalesced", "errors", "invalidations")
+
+
+class Metrics:
+    """Records every request and syncs the worker's pool, cache and single flight stats"""
+
+    def __init__(self):
+        self.pool_stats = None
+        self.cache = None
+        self.flights = None
+        self._last = {}
+
+    def init_app(self, app, pool_stats, cache, flights=None):
+        """Hooks the request metrics into app"""
+        self.pool_stats = pool_stats
+        self.cache = cache
+        self.flights = flights
+        app.before_request(self.start)
+        app.after_request(self.record)
+        app.teardown_request(self.finish)
+
+    @staticmethod
+    def start():
+        """Starts timing the current request"""
+        _started.set(time.perf_counter())
+        IN_PROGRESS.inc()
+
+    def record(self, response):
+        """Counts and times the current request"""
+        started = _started.get()
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            REQUESTS.labels(endpoint, request.method, response.status_code).inc()
+            LATENCY.labels(endpoint, request.method).observe(time.perf_counter() - started)
+        self.sync()
+        return response
+
+    @staticmethod
+    def finish(_=None):
+        """Ends the current request"""
+        if _started.get() is not None:
+            _started.set(None)
+            IN_PROGRESS.dec()
+
+    def sync(self):
+        """Copies the pool, cache and single flight stats of this worker into the metrics
+
+        Their counters only ever grow, so the metrics are advanced by the
+        growth since the last sync and stay correct when summed over workers.
+        """
+        if self.pool_stats is not None:
+            pool = self.pool_stats.stats()
+            for state in ("size", "in_use", "idle", "overflow"):
+                if pool[state] is not None:
+                    POOL.labels(state).set(pool[state])
+            for name in POOL_COUNTERS:
+                self._advance(POOL_EVENTS.labels(name), ("pool", name), pool[name])
+            self._advance(POOL_CHECKOUT_SECONDS, ("pool", "seconds"), self.pool_stats.checkout_seconds)
+        if self.cache is not None:
+            cache = self.cache.stats()
+            CACHE_SIZE.set(cache["size"])
+            for name in CACHE_COUNTERS:
+                self._advance(CACHE_EVENTS.labels(name), ("cache", name), cache[name])
+        if self.flights is not None:
+            flights = self.flights.stats()
+            for name in SINGLE_FLIGHT_COUNTERS:
+                self._advance(SINGLE_FLIGHT_EVENTS.labels(name), ("single_flight", name), flights[name])
+
+    def _advance(self, counter, key, value):
+        last = self._last.get(key, 0)
+        if value > last:
+            counter.inc(value - last)
+        # a reset of the source counter starts the growth over from zero
+        self._last[key] = value
+
+
+def exposition():
+    """Returns the metrics in the Prometheus text format and its content type"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+# Request metrics of this worker, hooked into the app in service/__init__.py
+metrics = Metrics()
@@ -0,0 +1,92 @@
+"""
+Pool Stats
+
+This module counts how the SQLAlchemy connection pool of a worker is used:
+how long checkouts wait, how many time out, and how many connections are
+opened and invalidated.
+"""
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+
+class PoolStats:
+    """Connection pool telemetry of one engine
+
+    Checkout latency is measured around Engine.raw_connection, which every
+    Connection goes through, so it covers waiting for a free connection,
+    opening a new one and the pre-ping. The pool listeners are carried
+    over when Engine.dispose() replaces the pool.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.engine = None
+        self.reset()
+
+    def reset(self):
+        """Zeroes the counters"""
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_seconds = 0.0
+            self.checkout_max_seconds = 0.0
+            self.timeouts = 0
+            self.connects = 0
+            self.invalidations = 0
+
+    def attach(self, engine):
+        """Starts counting the checkouts of engine"""
+        if getattr(engine, "pool_stats", None) is self:
+            return
+        raw_connection = engine.raw_connection
+
+        def timed_raw_connection():
+            start = self._clock()
+            try:
+                connection = raw_connection()
+            except PoolTimeoutError:
+                with self._lock:
+                    self.timeouts += 1
+                raise
+            self._record(self._clock() - start)
+            return connection
+
+        engine.raw_connection = timed_raw_connection
+        engine.pool_stats = self
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "invalidate", self._on_invalidate)
+        self.engine = engine
+
+    def _record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.checkout_seconds += seconds
+            self.checkout_max_seconds = max(self.checkout_max_seconds, seconds)
+
+    def _on_connect(self, *_):
+        with self._lock:
+            self.connects += 1
+
+    def _on_invalidate(self, *_):
+        with self._lock:
+            self.invalidations += 1
+
+    def stats(self):
+        """Returns the counters and the current state of the pool"""
+        with self._lock:
+            data = {
+                "checkouts": self.checkouts,
+                "checkout_ms_avg": self.checkout_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                "checkout_ms_max": self.checkout_max_seconds * 1000,
+                "timeouts": self.timeouts,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+            }
+        pool = self.engine.pool if self.engine is not None else None
+        data["pool"] = type(pool).__name__ if pool is not None else None
+        # only QueuePool keeps a size and overflow, the other pools report None
+        for name, method in (("size", "size"), ("in_use", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow")):
+            data[name] = getattr(pool, method)() if hasattr(pool, method) else None
+        return data
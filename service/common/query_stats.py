@@ -0,0 +1,143 @@
+"""
+Query Stats
+
+This module counts the SQL statements and the database time of every
+request, reports them in a Server-Timing header, logs slow statements and
+checks the query budgets that routes declare with query_budget().
+"""
+import logging
+import time
+from contextvars import ContextVar
+from functools import wraps
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("flask.app")
+
+# The queries of the request being handled, None outside of requests
+_current = ContextVar("query_stats", default=None)
+
+
+class QueryBudgetExceeded(Exception):
+    """Raised when a route issues more statements than its budget allows"""
+
+
+class RequestQueries:  # pylint: disable=too-few-public-methods
+    """The statements issued while handling one request"""
+
+    __slots__ = ("count", "seconds", "started")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.started = time.perf_counter()
+
+
+class QueryStats:
+    """Counts statements per request on every engine
+
+    The listeners are registered on the Engine class, so the primary and
+    the read replicas are all counted, and statements that take longer than
+    slow_query_ms are logged with their duration.
+    """
+
+    def __init__(self):
+        self.slow_query_ms = 500.0
+        self.enforce_budgets = False
+        self._listening = False
+
+    def init_app(self, app):
+        """Reads the settings and hooks the counting into app"""
+        self.slow_query_ms = app.config.get("SLOW_QUERY_MS", 500.0)
+        self.enforce_budgets = app.config.get("QUERY_BUDGET_ENFORCE", False)
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            event.listen(Engine, "handle_error", self._handle_error)
+            self._listening = True
+        app.before_request(self.start)
+        app.after_request(self.add_server_timing)
+        app.teardown_request(self.stop)
+
+    @staticmethod
+    def start():
+        """Starts counting the queries of the current request"""
+        _current.set(RequestQueries())
+
+    @staticmethod
+    def stop(_=None):
+        """Stops counting, queries of a streamed response are no longer counted"""
+        _current.set(None)
+
+    @staticmethod
+    def current():
+        """Returns the queries of the current request, or None"""
+        return _current.get()
+
+    @staticmethod
+    def add_server_timing(response):
+        """Reports the statement count and the database time of the request"""
+        queries = _current.get()
+        if queries is not None:
+            total = (time.perf_counter() - queries.started) * 1000
+            noun = "query" if queries.count == 1 else "queries"
+            response.headers.add(
+                "Server-Timing", f'db;desc="{queries.count} {noun}";dur={queries.seconds * 1000:.2f}')
+            response.headers.add("Server-Timing", f"total;dur={total:.2f}")
+        return response
+
+    def check_budget(self, budget):
+        """Logs, or raises when enforcing, if the request went over budget"""
+        queries = _current.get()
+        if queries is None or queries.count <= budget:
+            return
+        message = f"{request.method} {request.path} issued {queries.count} queries, its budget is {budget}"
+        logger.warning(message)
+        if self.enforce_budgets:
+            raise QueryBudgetExceeded(message)
+
+    @staticmethod
+    def _before_cursor_execute(conn, *_):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @staticmethod
+    def _handle_error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started and context.statement is not None:
+            started.pop()
+
+    def _after_cursor_execute(self, conn, _cursor, statement, *_):
+        seconds = time.perf_counter() - conn.info["query_started"].pop()
+        queries = _current.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += seconds
+        if self.slow_query_ms and seconds * 1000 >= self.slow_query_ms:
+            logger.warning("Slow query (%.1f ms): %s", seconds * 1000, statement)
+
+
+# Query counting of this worker, hooked into the app in service/__init__.py
+query_stats = QueryStats()
+
+
+def query_budget(budget, **extra):
+    """Declares the most statements a route may issue
+
+    extra allows more statements for the boolean query arguments that add
+    a query, e.g. query_budget(2, count=1) allows a third one with
+    ?count=true. Going over budget is logged, and raises
+    QueryBudgetExceeded when QUERY_BUDGET_ENFORCE is set, as the tests do.
+    The route keeps (budget, extra) as query_budget, which the README
+    table of budgets is checked against.
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            query_stats.check_budget(budget + sum(
+                more for name, more in extra.items() if request.args.get(name, "").lower() in ("true", "1", "on")))
+            return result
+        wrapper.query_budget = (budget, extra)
+        return wrapper
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Replicas
+
+This module routes the reads of a block of code to one of the read
+replicas, round-robin, skipping the replicas that recently failed.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger("flask.app")
+
+# The replica the reads of the current context go to, see ReplicaRouter.reading()
+_replica = ContextVar("replica", default=None)
+
+
+class ReplicaRouter:
+    """Spreads reads over the read replicas, round-robin
+
+    A replica that raises an OperationalError (refused connection, lost
+    connection, replica not ready) is ejected for eject_seconds, then gets
+    the next read again. When no replica is healthy reads use the primary.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.engines = []
+        self.eject_seconds = 30.0
+        self._next = 0
+        self._ejected_until = {}
+        self._counts = {}
+
+    def configure(self, uris, eject_seconds=30.0, **engine_options):
+        """Replaces the replicas with engines for the given URIs"""
+        self.dispose()
+        engines = [create_engine(uri, **engine_options) for uri in uris]
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error)
+        with self._lock:
+            self.engines = engines
+            self.eject_seconds = eject_seconds
+            self._next = 0
+            self._ejected_until = {}
+            self._counts = {engine: {"reads": 0, "errors": 0} for engine in engines}
+
+    def dispose(self, close=True):
+        """Closes the pooled connections of every replica
+
+        With close=False they are dropped without being closed, as a forked
+        process must do with the connections of its parent.
+        """
+        for engine in self.engines:
+            engine.dispose(close=close)
+
+    def choose(self):
+        """Returns the next healthy replica, or None to read from the primary"""
+        now = self._clock()
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = self.engines[self._next % len(self.engines)]
+                self._next += 1
+                if self._ejected_until.get(engine, 0) <= now:
+                    self._counts[engine]["reads"] += 1
+                    return engine
+        return None
+
+    def eject(self, engine):
+        """Takes a replica out of the rotation for eject_seconds"""
+        logger.warning("Ejecting read replica %s for %ss", engine.url, self.eject_seconds)
+        with self._lock:
+            self._ejected_until[engine] = self._clock() + self.eject_seconds
+            self._counts.setdefault(engine, {"reads": 0, "errors": 0})["errors"] += 1
+
+    def _on_error(self, context):
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, OperationalError):
+            self.eject(context.engine)
+
+    def reading(self):
+        """Sends the reads of the block to the next healthy replica
+
+        Writes, flushes and DML statements still go to the primary.
+        """
+        return self.using(self.choose())
+
+    @staticmethod
+    @contextmanager
+    def using(engine):
+        """Sends the reads of the block to engine, or to the primary when None"""
+        token = _replica.set(engine)
+        try:
+            yield
+        finally:
+            _replica.reset(token)
+
+    @staticmethod
+    def current():
+        """Returns the replica the reads of the current context go to, if any"""
+        return _replica.get()
+
+    def stats(self):
+        """Returns the health and read counts of every replica"""
+        now = self._clock()
+        with self._lock:
+            return [
+                {
+                    "url": engine.url.render_as_string(hide_password=True),
+                    "healthy": self._ejected_until.get(engine, 0) <= now,
+                    **self._counts[engine],
+                }
+                for engine in self.engines
+            ]
@@ -0,0 +1,130 @@
+"""
+Seed
+
+This module generates deterministic synthetic customers and addresses and
+loads them with multi-row INSERTs, for building large databases to load
+test against.
+"""
+import hashlib
+import random
+from sqlalchemy import func, select, text
+from service.models import Address, Customer, db
+
+FIRST_NAMES = (
+    "James", "Mary", "Robert", "Patricia", "John", "Jennifer", "Michael", "Linda", "David", "Elizabeth",
+    "William", "Barbara", "Richard", "Susan", "Joseph", "Jessica", "Thomas", "Sarah", "Charles", "Karen",
+    "Aarav", "Ananya", "Wei", "Mei", "Hiroshi", "Yuki", "Carlos", "Sofia", "Mateo", "Lucia",
+    "Omar", "Fatima", "Ivan", "Olga", "Kwame", "Amara", "Liam", "Emma", "Noah", "Olivia",
+)
+LAST_NAMES = (
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez",
+    "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson", "Thomas", "Taylor", "Moore", "Jackson", "Martin",
+    "Patel", "Sharma", "Wang", "Li", "Zhang", "Tanaka", "Sato", "Kim", "Nguyen", "Silva",
+    "Ivanov", "Kowalski", "Mensah", "Okafor", "Cohen", "Rossi", "Muller", "Dubois", "Haddad", "Khan",
+)
+EMAIL_DOMAINS = ("example.com", "example.org", "example.net", "mail.example.com")
+STREET_NAMES = (
+    "Main", "Oak", "Pine", "Maple", "Cedar", "Elm", "Washington", "Lake", "Hill", "Park",
+    "Jackson", "Broadway", "Sunset", "Church", "Mill", "River", "Highland", "Spring", "Center", "Union",
+)
+STREET_SUFFIXES = ("St", "Ave", "Blvd", "Rd", "Ln", "Dr", "Way", "Ct")
+# city, state, country and the first digits of its postal codes
+PLACES = (
+    ("New York", "NY", "USA", "100"), ("Brooklyn", "NY", "USA", "112"), ("Los Angeles", "CA", "USA", "900"),
+    ("San Francisco", "CA", "USA", "941"), ("Chicago", "IL", "USA", "606"), ("Springfield", "IL", "USA", "627"),
+    ("Houston", "TX", "USA", "770"), ("Austin", "TX", "USA", "787"), ("Seattle", "WA", "USA", "981"),
+    ("Boston", "MA", "USA", "021"), ("Miami", "FL", "USA", "331"), ("Denver", "CO", "USA", "802"),
+    ("Toronto", "ON", "Canada", "M5V"), ("Vancouver", "BC", "Canada", "V6B"), ("Mumbai", "MH", "India", "400"),
+    ("Bengaluru", "KA", "India", "560"), ("London", "LDN", "United Kingdom", "EC1"), ("Berlin", "BE", "Germany", "101"),
+)
+
+
+def generate_customers(rng, first_id, count):
+    """Returns count customer rows with ids from first_id, drawn column by column"""
+    ids = range(first_id, first_id + count)
+    first_names = rng.choices(FIRST_NAMES, k=count)
+    last_names = rng.choices(LAST_NAMES, k=count)
+    domains = rng.choices(EMAIL_DOMAINS, k=count)
+    active = [rng.random() < 0.9 for _ in ids]
+    return [
+        {
+            "id": customer_id,
+            "first_name": first,
+            "last_name": last,
+            "email": f"{first.lower()}.{last.lower()}.{customer_id}@{domain}",
+            "password": hashlib.sha256(f"password-{customer_id}".encode("UTF-8")).hexdigest(),
+            "active": is_active,
+            "version": 1,
+        }
+        for customer_id, first, last, domain, is_active in zip(ids, first_names, last_names, domains, active)
+    ]
+
+
+def generate_addresses(rng, customer_ids, per_customer):
+    """Returns per_customer address rows for every customer id"""
+    owners = [customer_id for customer_id in customer_ids for _ in range(per_customer)]
+    count = len(owners)
+    numbers = rng.choices(range(1, 10000), k=count)
+    streets = rng.choices(STREET_NAMES, k=count)
+    suffixes = rng.choices(STREET_SUFFIXES, k=count)
+    places = rng.choices(PLACES, k=count)
+    tails = rng.choices(range(100), k=count)
+    return [
+        {
+            "street": f"{number} {street} {suffix}",
+            "city": city,
+            "state": state,
+            "country": country,
+            "pin_code": f"{prefix}{tail:02d}",
+            "customer_id": customer_id,
+        }
+        for customer_id, number, street, suffix, (city, state, country, prefix), tail
+        in zip(owners, numbers, streets, suffixes, places, tails)
+    ]
+
+
+def seed(customers, addresses_per_customer=1, seed_value=0, batch_size=10000, progress=None):
+    """Inserts generated customers and their addresses, batch by batch
+
+    Ids continue after the highest existing customer id, so the data of a
+    seed is the same on every run against an empty table. Every batch is
+    one executemany of each table, which SQLAlchemy sends as multi-row
+    INSERTs, and commits on its own.
+
+    :param customers: the number of customers to create
+    :type customers: int
+    :param addresses_per_customer: the number of addresses of every customer
+    :type addresses_per_customer: int
+    :param seed_value: the seed of the random generator
+    :type seed_value: int
+    :param batch_size: the number of customers inserted per batch
+    :type batch_size: int
+    :param progress: called with the number of customers inserted so far
+    :type progress: function
+
+    :return: the number of customers and of addresses created
+    :rtype: tuple
+
+    """
+    rng = random.Random(seed_value)
+    first_id = (db.session.scalar(select(func.max(Customer.id))) or 0) + 1
+    created = 0
+    addresses = 0
+    while created < customers:
+        count = min(batch_size, customers - created)
+        rows = generate_customers(rng, first_id + created, count)
+        db.session.execute(Customer.__table__.insert(), rows)
+        if addresses_per_customer:
+            address_rows = generate_addresses(rng, [row["id"] for row in rows], addresses_per_customer)
+            db.session.execute(Address.__table__.insert(), address_rows)
+            addresses += len(address_rows)
+        db.session.commit()
+        created += count
+        if progress:
+            progress(created)
+    if db.engine.dialect.name == "postgresql":
+        # the ids were given explicitly, move the sequence past them
+        db.session.execute(text(
+            "SELECT setval(pg_get_serial_sequence('customer', 'id'), (SELECT max(id) FROM customer))"))
+        db.session.commit()
+    return created, addresses
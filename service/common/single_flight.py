@@ -0,0 +1,104 @@
+"""
+Single Flight
+
+This module coalesces identical reads that run at the same time in a
+worker: the first caller of a key runs the read, the callers that arrive
+while it runs wait for it and share its result, or its exception.
+"""
+import threading
+
+
+class _Flight:  # pylint: disable=too-few-public-methods
+    """A read in progress and, once it finished, its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs at most one read per key at a time and shares its result
+
+    Keys are tuples whose first item names the group of the key, such as
+    ("customer", 42). Nothing is kept once a read finished, so this only
+    merges reads that overlap; the callers that need a read to start
+    after a write, invalidate its key or group when writing. Every worker
+    process coalesces on its own.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.reset()
+
+    def reset(self):
+        """Zeroes the counters"""
+        with self._lock:
+            self.calls = 0
+            self.executions = 0
+            self.coalesced = 0
+            self.errors = 0
+            self.invalidations = 0
+
+    def do(self, key, function):
+        """Returns function(), or the result of the call of key already running"""
+        if not self.enabled:
+            return function()
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.executions += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = function()
+            return flight.result
+        except Exception as error:
+            flight.error = error
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                # an invalidation may already have replaced the flight
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, key):
+        """Lets the next call of key start a read of its own"""
+        with self._lock:
+            if self._flights.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def invalidate_group(self, group):
+        """Lets the next call of every key of group start a read of its own"""
+        with self._lock:
+            keys = [key for key in self._flights if key[0] == group]
+            for key in keys:
+                del self._flights[key]
+            self.invalidations += len(keys)
+
+    def stats(self):
+        """Returns the counters and the share of the calls that were coalesced"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "in_flight": len(self._flights),
+                "calls": self.calls,
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "errors": self.errors,
+                "invalidations": self.invalidations,
+                "coalesced_ratio": self.coalesced / self.calls if self.calls else 0.0,
+            }
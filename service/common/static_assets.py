@@ -0,0 +1,112 @@
+"""
+Static Assets
+
+This module serves the files of the static folder from memory. When the
+app is created, every file is read once, given a fingerprinted name that
+holds a hash of its content, and compressed ahead of time with gzip and,
+when the brotli package is installed, brotli. The references of the HTML
+pages are rewritten to the fingerprinted names, which are cached by the
+browsers for a year; the plain names keep working and are revalidated.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from flask import Response, abort, request
+from service.common import status
+from service.common.compression import available_encodings, compress, compressible, encoded_etag, negotiate
+
+# A year, the longest max-age caches honour
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class Asset:  # pylint: disable=too-few-public-methods
+    """One static file with its precompressed bodies, keyed by encoding"""
+
+    def __init__(self, data, mimetype):
+        self.bodies = {None: data}
+        self.mimetype = mimetype
+        self.digest = hashlib.sha256(data).hexdigest()[:12]
+
+
+def fingerprint(name, digest):
+    """Returns name with digest before its extension, css/app.css -> css/app.<digest>.css"""
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{digest}{extension}"
+
+
+class StaticAssets:
+    """The static files of an app, fingerprinted and precompressed in memory"""
+
+    def __init__(self):
+        # (asset, Cache-Control) by the names they are served under
+        self.assets = {}
+        self.manifest = {}
+
+    def init_app(self, app):
+        """Builds the assets of the static folder and serves them for app"""
+        self.build(app.static_folder, app.config.get("STATIC_COMPRESS_MIN_SIZE", 256),
+                   {"gzip": app.config.get("STATIC_GZIP_LEVEL", 9),
+                    "br": app.config.get("STATIC_BROTLI_QUALITY", 9)})
+        # replaces the view of the static route Flask added
+        app.view_functions["static"] = self.send
+
+    def build(self, folder, min_size, levels):
+        """Reads, fingerprints and compresses every file of folder"""
+        self.assets = {}
+        self.manifest = {}
+        pages = []
+        for root, _, files in os.walk(folder):
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                name = os.path.relpath(path, folder).replace(os.sep, "/")
+                with open(path, "rb") as handle:
+                    data = handle.read()
+                if name.endswith(".html"):
+                    pages.append((name, data))
+                    continue
+                self._add(name, data, min_size, levels)
+        # the pages point at the other files, so they come last
+        for name, data in pages:
+            self._add(name, self.rewrite(data), min_size, levels)
+
+    def _add(self, name, data, min_size, levels):
+        mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        asset = Asset(data, mimetype)
+        if len(data) >= min_size and compressible(mimetype):
+            for encoding in available_encodings():
+                body = compress(data, encoding, levels[encoding])
+                if len(body) < len(data):
+                    asset.bodies[encoding] = body
+        self.assets[name] = (asset, "no-cache")
+        if not name.endswith(".html"):
+            self.manifest[name] = fingerprint(name, asset.digest)
+            self.assets[self.manifest[name]] = (asset, IMMUTABLE)
+
+    def rewrite(self, page):
+        """Points the static/ references of an HTML page at the fingerprinted names"""
+        if not self.manifest:
+            return page
+        names = sorted(self.manifest, key=len, reverse=True)
+        pattern = re.compile(rb"static/(" + b"|".join(re.escape(name.encode("utf-8")) for name in names) + rb")")
+        return pattern.sub(lambda match: b"static/" + self.manifest[match.group(1).decode("utf-8")].encode("utf-8"), page)
+
+    def send(self, filename):
+        """Serves a static file in the encoding the client accepts most"""
+        if filename not in self.assets:
+            abort(status.HTTP_404_NOT_FOUND)
+        asset, cache_control = self.assets[filename]
+        encoding = negotiate([encoding for encoding in available_encodings() if encoding in asset.bodies])
+        response = Response(asset.bodies[encoding], mimetype=asset.mimetype)
+        if len(asset.bodies) > 1:
+            response.vary.add("Accept-Encoding")
+        if encoding is not None:
+            response.headers["Content-Encoding"] = encoding
+        response.headers["Cache-Control"] = cache_control
+        # every encoding is its own representation, with its own ETag
+        response.set_etag(encoded_etag(asset.digest, encoding) if encoding else asset.digest)
+        return response.make_conditional(request)
+
+
+# The static files of the app, built in service/__init__.py
+static_assets = StaticAssets()
@@ -12,5 +12,82 @@ DATABASE_URI = os.getenv(
 SQLALCHEMY_DATABASE_URI = DATABASE_URI
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Create the missing tables when the app is created. Off by default so
+# that workers start without touching the database; turn it on for local
+# development or run flask db-create once.
+DB_CREATE_SCHEMA = os.getenv("DB_CREATE_SCHEMA", "false").lower() in ("true", "1", "yes")
+
+# Connection pool of every worker. Pre-ping replaces connections that died
+# with a Postgres failover before they are handed out, and recycle retires
+# connections before server or proxy idle timeouts do. The size, overflow
+# and timeout only apply to a QueuePool (PostgreSQL, SQLite files), so they
+# are left to the SQLAlchemy defaults (5, 10, 30s) unless set.
+SQLALCHEMY_ENGINE_OPTIONS = {
+    "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "true").lower() in ("true", "1", "yes"),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+}
+if os.getenv("DB_POOL_SIZE"):
+    SQLALCHEMY_ENGINE_OPTIONS["pool_size"] = int(os.getenv("DB_POOL_SIZE"))
+if os.getenv("DB_MAX_OVERFLOW"):
+    SQLALCHEMY_ENGINE_OPTIONS["max_overflow"] = int(os.getenv("DB_MAX_OVERFLOW"))
+if os.getenv("DB_POOL_TIMEOUT"):
+    SQLALCHEMY_ENGINE_OPTIONS["pool_timeout"] = float(os.getenv("DB_POOL_TIMEOUT"))
+
+# Optional read replicas, comma separated. Read-only routes spread their
+# queries over them round-robin, writes stay on DATABASE_URI. A replica
+# that fails is skipped for REPLICA_EJECT_SECONDS.
+DATABASE_REPLICA_URIS = [uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()]
+REPLICA_EJECT_SECONDS = float(os.getenv("REPLICA_EJECT_SECONDS", "30"))
+
+# Statements slower than this are logged, 0 turns the log off. Routes
+# declare the most statements they may issue; going over is logged, and
+# raises instead when QUERY_BUDGET_ENFORCE is set (as in the tests).
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+QUERY_BUDGET_ENFORCE = os.getenv("QUERY_BUDGET_ENFORCE", "false").lower() in ("true", "1", "yes")
+
 # Secret for session management
 SECRET_KEY = os.getenv("SECRET_KEY", "s3cr3t-key-shhhh")
+
+# Keyset pagination of the customer list
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# Rows fetched per round trip when streaming the customer list
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+# Read-through cache of serialized customers, a size of 0 disables it.
+# Each worker has its own cache, so the TTL bounds how long a write made
+# through another worker can go unnoticed.
+CUSTOMER_CACHE_SIZE = int(os.getenv("CUSTOMER_CACHE_SIZE", "1024"))
+CUSTOMER_CACHE_TTL = float(os.getenv("CUSTOMER_CACHE_TTL", "30"))
+
+# Cache of the /customers/stats aggregates. Writes through a worker clear
+# its cache, the TTL bounds how long the writes of other workers go unseen.
+ROLLUP_CACHE_SIZE = int(os.getenv("ROLLUP_CACHE_SIZE", "128"))
+ROLLUP_CACHE_TTL = float(os.getenv("ROLLUP_CACHE_TTL", "300"))
+
+# Identical customer reads and JSON lists running at the same time in a
+# worker share one query and one encoded result (single flight)
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("true", "1", "yes")
+
+# Bulk customer creation: the largest batch accepted, the number of
+# customers flushed per multi-row INSERT, and whether a batch is
+# all-or-nothing (true) or committed chunk by chunk (false)
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "10000"))
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "500"))
+BATCH_ATOMIC = os.getenv("BATCH_ATOMIC", "true").lower() in ("true", "1", "yes")
+
+# Responses of text types are compressed with brotli (when installed) or
+# gzip, by the Accept-Encoding of the client, once they are at least
+# COMPRESS_MIN_SIZE bytes; streamed responses are compressed as they go
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "true").lower() in ("true", "1", "yes")
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# The static files are compressed once when the app is created, with
+# stronger settings. Brotli 11 would add seconds to every start for a few
+# percent smaller files.
+STATIC_COMPRESS_MIN_SIZE = int(os.getenv("STATIC_COMPRESS_MIN_SIZE", "256"))
+STATIC_GZIP_LEVEL = int(os.getenv("STATIC_GZIP_LEVEL", "9"))
+STATIC_BROTLI_QUALITY = int(os.getenv("STATIC_BROTLI_QUALITY", "9"))
@@ -3,10 +3,26 @@ Models for Customer
 
 All of the models are stored in this module
 """
+# pylint: disable=too-many-lines
+import base64
+import binascii
 import hashlib
+import heapq
+import json
 import logging
+from datetime import datetime, timezone
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import (DDL, DateTime, TypeDecorator, and_, case, delete, distinct, event, func, insert, inspect, literal,
+                        or_, select, text, tuple_, update)
+from sqlalchemy.schema import CreateIndex
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import load_only, selectinload, undefer
+from service.common.cache import LRUCache
+from service.common.pool_stats import PoolStats
+from service.common.replicas import ReplicaRouter
+from service.common.single_flight import SingleFlight
 
 logger = logging.getLogger("flask.app")
 
@@ -16,10 +32,77 @@ def hash_password(password):
     return hashlib.sha256(password.encode("UTF-8")).hexdigest()
 
 
-# Create the SQLAlchemy object to be initialized later in init_db()
-db = SQLAlchemy()
+class RoutingSession(Session):  # pylint: disable=too-few-public-methods
+    """A session that runs the reads of a ReplicaRouter.reading() block on a replica"""
 
-# Function to initialize the database
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        replica = ReplicaRouter.current()
+        if replica is not None and bind is None and not self._flushing and not getattr(clause, "is_dml", False):
+            return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+# Create the SQLAlchemy object to be initialized later in configure()
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+
+# Read replicas, configured from DATABASE_REPLICA_URIS in configure()
+replicas = ReplicaRouter()
+
+# Serialized Customers keyed by id, sized from the config in configure()
+customer_cache = LRUCache()
+
+# Concurrent identical Customer reads of this worker, run once and shared
+customer_flights = SingleFlight()
+
+# Customer.rollup() results, dropped on every write, sized in configure()
+rollup_cache = LRUCache()
+
+# Connection pool telemetry of this worker, attached in configure()
+pool_stats = PoolStats()
+
+# Functions to initialize the database
+
+
+def configure(app):
+    """ Binds the database, the replicas and the caches to app without connecting """
+    customer_cache.configure(app.config.get("CUSTOMER_CACHE_SIZE", 1024),
+                             app.config.get("CUSTOMER_CACHE_TTL", 30.0))
+    customer_flights.enabled = app.config.get("SINGLE_FLIGHT", True)
+    rollup_cache.configure(app.config.get("ROLLUP_CACHE_SIZE", 128),
+                           app.config.get("ROLLUP_CACHE_TTL", 300.0))
+    # This is where we initialize SQLAlchemy from the Flask app, once
+    if "sqlalchemy" not in app.extensions:
+        db.init_app(app)
+    with app.app_context():
+        pool_stats.attach(db.engine)
+    replicas.configure(app.config.get("DATABASE_REPLICA_URIS", []),
+                       app.config.get("REPLICA_EJECT_SECONDS", 30.0),
+                       **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}))
+
+
+def customers_changed(*customer_ids):
+    """ Forgets what the cache and the reads in flight hold for changed Customers
+
+    Called after every committed write. The lists and the rollups are
+    dropped whatever changed, since any write can change what they count.
+    """
+    for customer_id in customer_ids:
+        customer_cache.invalidate(customer_id)
+        customer_flights.invalidate(("customer", customer_id))
+    customer_flights.invalidate_group("list")
+    customer_flights.invalidate_group("rollup")
+    rollup_cache.clear()
+
+
+def dispose_engines(app):
+    """ Drops the pooled connections of the primary and the replicas
+
+    A worker forked from a preloaded master calls this first, so that it
+    never shares a connection of the master's pools.
+    """
+    with app.app_context():
+        db.engine.dispose(close=False)
+    replicas.dispose(close=False)
 
 
 def init_db(app):
@@ -27,10 +110,112 @@ def init_db(app):
     Customer.init_db(app)
 
 
+def create_indexes():
+    """ Creates the declared indexes that are missing from the database
+
+    On PostgreSQL the indexes are built CONCURRENTLY, outside of a
+    transaction, so the tables stay writable while they are built.
+
+    :return: the names of the indexes that were created
+    :rtype: list
+    """
+    created = []
+    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        online = conn.dialect.name == "postgresql"
+        for table in db.metadata.sorted_tables:
+            existing = _index_names(conn, table.name)
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in existing:
+                    continue
+                logger.info("Creating index %s on %s ...", index.name, table.name)
+                index.dialect_options["postgresql"]["concurrently"] = online
+                try:
+                    conn.execute(CreateIndex(index, if_not_exists=True))
+                finally:
+                    index.dialect_options["postgresql"]["concurrently"] = False
+                created.append(index.name)
+    return created
+
+
+def _index_names(conn, table_name):
+    """ Returns the names of the indexes that exist on a table """
+    if conn.dialect.name == "sqlite":
+        # SQLite reflection skips expression indexes, so ask the catalog
+        rows = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+            {"table": table_name})
+        return {row.name for row in rows}
+    return {index["name"] for index in inspect(conn).get_indexes(table_name)}
+
+
+def _rollup_counts(customers, active):
+    """ Returns the counts of one rollup row """
+    return {"customers": customers, "active_customers": active,
+            "active_ratio": active / customers if customers else 0.0}
+
+
 class DataValidationError(Exception):
     """ Used for an data validation errors when deserializing """
 
 
+class UTCDateTime(TypeDecorator):  # pylint: disable=too-many-ancestors, abstract-method
+    """ A timestamp stored as UTC without a zone and read back as an aware UTC datetime
+
+    SQLite keeps no time zone, so the zone is left out everywhere and every
+    database returns the same values.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        return value if value is None else value.replace(tzinfo=timezone.utc)
+
+
+def utcnow():
+    """ Returns the current time in UTC """
+    return datetime.now(timezone.utc)
+
+
+def next_change():
+    """ Takes the next number of the changes feed in the current transaction
+
+    The counter row stays locked until the transaction ends, so concurrent
+    writers get their numbers in the order they commit and a reader that
+    sees a number also sees every smaller one. The price is that commits
+    of writes run one at a time from here on. Writers call this after
+    every other statement, right before committing, so the lock is held
+    briefly and always taken after the customer rows, never before them.
+    """
+    stmt = (update(ChangeSequence).where(ChangeSequence.id == 1)
+            .values(value=ChangeSequence.value + 1).returning(ChangeSequence.value))
+    return db.session.execute(stmt).scalar_one()
+
+
+def _encode_cursor(sort, values):
+    """ Packs the sort and the last seen key values into an opaque cursor """
+    payload = json.dumps({"s": sort or "", "k": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("UTF-8")).decode("ascii")
+
+
+def _decode_cursor(cursor, sort):
+    """ Unpacks a cursor made by _encode_cursor for the same sort """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        values = payload["k"]
+        cursor_sort = payload["s"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as error:
+        raise DataValidationError("Invalid cursor: " + cursor) from error
+    if cursor_sort != (sort or "") or not isinstance(values, list):
+        raise DataValidationError("Invalid cursor: does not match the sort keys")
+    return values
+
+
 class Address(db.Model):
     """
     Class that represents a Address
@@ -42,17 +227,24 @@ class Address(db.Model):
 
     # Table Schema
     address_id = db.Column(db.Integer, primary_key=True)
-    street = db.Column(db.String(255), nullable=False)
-    city = db.Column(db.String(255), nullable=False)
-    state = db.Column(db.String(255), nullable=False)
+    street = db.Column(db.String(255), nullable=False, index=True)
+    city = db.Column(db.String(255), nullable=False, index=True)
+    state = db.Column(db.String(255), nullable=False, index=True)
+    # country lookups use the leading column of ix_address_country_state_city_customer_id
     country = db.Column(db.String(255), nullable=False)
-    pin_code = db.Column(db.String(255), nullable=False)
+    pin_code = db.Column(db.String(255), nullable=False, index=True)
     customer_id = db.Column(
         db.Integer,
         db.ForeignKey(
             'customer.id',
             ondelete="CASCADE"),
-        nullable=False)
+        nullable=False,
+        index=True)
+
+    # Covers the GROUP BY of Customer.rollup() without reading the table
+    __table_args__ = (
+        db.Index("ix_address_country_state_city_customer_id", "country", "state", "city", "customer_id"),
+    )
 
     def __repr__(self):
         return f"<Address {self.street} address_id=[{self.address_id}] customer[{self.customer_id}]>"
@@ -101,7 +293,10 @@ class Address(db.Model):
         logger.info('Creating %s', self.street)
         if not self.address_id:
             db.session.add(self)
+        db.session.flush()
+        Customer.bump_version(self.customer_id)
         db.session.commit()
+        customers_changed(self.customer_id)
         logger.info("Address is saved successfully")
 
     def update(self):
@@ -111,13 +306,17 @@ class Address(db.Model):
         logger.info("Updating/Saving %s, %s", self.street, self.city)
         if not self.address_id:
             raise DataValidationError("Update called with empty ID field")
+        Customer.bump_version(self.customer_id)
         db.session.commit()
+        customers_changed(self.customer_id)
 
     def delete(self):
         """ Removes a Address from the database """
         logger.info("Deleting %s, %s", self.street, self.city)
         db.session.delete(self)
+        Customer.bump_version(self.customer_id)
         db.session.commit()
+        customers_changed(self.customer_id)
 
     @classmethod
     def find_by_street(cls, street):
@@ -128,9 +327,7 @@ class Address(db.Model):
             street (string): the street of the Addresses you want to match
         """
         logger.info('Street query under progress for: %s ...', street)
-        addresses = cls.query.filter(cls.street == street)
-        return list({Customer.find(address.customer_id)
-                    for address in addresses})
+        return Customer.find_by_address(cls.street == street)
 
     @classmethod
     def find_by_city(cls, city):
@@ -141,9 +338,7 @@ class Address(db.Model):
             city (string): The addressess corresponding to the city you want to list
         """
         logger.info('City query under progress for: %s ...', city)
-        addresses = cls.query.filter(cls.city == city)
-        return list({Customer.find(address.customer_id)
-                    for address in addresses})
+        return Customer.find_by_address(cls.city == city)
 
     @classmethod
     def find_by_state(cls, state):
@@ -154,9 +349,7 @@ class Address(db.Model):
             state (string): The addresses corresponding to the state you want to list
         """
         logger.info('State query under progress for: %s ...', state)
-        addresses = cls.query.filter(cls.state == state)
-        return list({Customer.find(address.customer_id)
-                    for address in addresses})
+        return Customer.find_by_address(cls.state == state)
 
     @classmethod
     def find_by_pin_code(cls, pin_code):
@@ -167,9 +360,7 @@ class Address(db.Model):
             pin_code (string): the pin_code of the Addresses you want to match
         """
         logger.info('Pincode query under progress for: %s ...', pin_code)
-        addresses = cls.query.filter(cls.pin_code == pin_code)
-        return list({Customer.find(address.customer_id)
-                    for address in addresses})
+        return Customer.find_by_address(cls.pin_code == pin_code)
 
     @classmethod
     def find_by_country(cls, country):
@@ -180,9 +371,7 @@ class Address(db.Model):
             country (string): the country of the Addresses you want to match
         """
         logger.info('Country query under progress for: %s ...', country)
-        addresses = cls.query.filter(cls.country == country)
-        return list({Customer.find(address.customer_id)
-                    for address in addresses})
+        return Customer.find_by_address(cls.country == country)
 
     @classmethod
     def find(cls, address_id):
@@ -206,7 +395,7 @@ class Address(db.Model):
         return cls.query.get_or_404(address_id)
 
 
-class Customer(db.Model):
+class Customer(db.Model):  # pylint: disable=too-many-public-methods, too-many-instance-attributes
     """
     Class that represents a Customer
     """
@@ -221,11 +410,46 @@ class Customer(db.Model):
     email = db.Column(db.String(255), nullable=False)
     password = db.Column(db.String(255), nullable=False)
     active = db.Column(db.Boolean, nullable=False, default=True)
+    # Row version, bumped on every change to the customer or its addresses
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+    # pylint: disable=not-callable
+    created_at = db.Column(UTCDateTime, nullable=False, default=utcnow, server_default=func.now())
+    updated_at = db.Column(UTCDateTime, nullable=False, default=utcnow, server_default=func.now())
+    # pylint: enable=not-callable
+    # Position of the last change in the changes feed, see next_change()
+    change_seq = db.Column(db.BigInteger, nullable=False, default=0, server_default="0")
     addresses = db.relationship(
         "Address",
         backref="customer",
         passive_deletes=True)
 
+    # Lookup columns are indexed together with the id so that an equality
+    # filter can also walk the keyset pagination order from the index
+    __table_args__ = (
+        db.Index("ix_customer_first_name_id", "first_name", "id"),
+        db.Index("ix_customer_last_name_id", "last_name", "id"),
+        db.Index("ix_customer_active_id", "active", "id"),
+        db.Index("ix_customer_email_lower", func.lower(email)),
+        db.Index("ix_customer_change_seq_id", "change_seq", "id"),
+    )
+
+    # Columns that the list can be sorted and paged by
+    SORTABLE = ("id", "first_name", "last_name", "email", "active")
+
+    # Fields a response can be narrowed to, in serialization order
+    FIELDS = ("id", "first_name", "last_name", "email", "password", "active", "version", "created_at", "updated_at",
+              "addresses")
+
+    # Query arguments that filter on Customer columns and on Address columns
+    CUSTOMER_FILTERS = ("first_name", "last_name", "email", "active")
+    ADDRESS_FILTERS = ("street", "city", "state", "country", "pin_code")
+
+    # Columns the Customers can be counted by
+    GROUPABLE = ("active", "first_name", "last_name", "street", "city", "state", "country", "pin_code")
+
+    # Columns the rollups can be grouped by
+    ROLLUP_DIMENSIONS = ("country", "state", "city", "active")
+
     ###############
     # Instance Methods
     ##############
@@ -242,8 +466,12 @@ class Customer(db.Model):
         self.id = None  # pylint: disable=invalid-name
         # hash PWDs
         self.password = hash_password(self.password)
+        self.created_at = self.updated_at = utcnow()
         db.session.add(self)
+        # flushes the INSERT first, see next_change()
+        self.change_seq = next_change()
         db.session.commit()
+        customers_changed()
 
     def update(self, original_password=None):
         """
@@ -257,27 +485,34 @@ class Customer(db.Model):
         if original_password is not None and not original_password == self.password:
             self.password = hash_password(self.password)
 
+        self.version = Customer.version + 1
+        self.updated_at = utcnow()
+        # flushes the UPDATE first, see next_change()
+        self.change_seq = next_change()
         db.session.commit()
+        customers_changed(self.id)
 
     def delete(self):
         """ Removes a Customer from the data store """
         logger.info("Deleting %s, %s", self.last_name, self.first_name)
         db.session.delete(self)
+        CustomerTombstone.record([self.id])
         db.session.commit()
+        customers_changed(self.id)
 
-    def serialize(self):
-        """ Serializes a Customer into a dictionary """
-        customer = {
-            "id": self.id,
-            "first_name": self.first_name,
-            "last_name": self.last_name,
-            "email": self.email,
-            "password": self.password,
-            "active": self.active,
-            "addresses": [],
-        }
-        for address in self.addresses:
-            customer["addresses"].append(address.serialize())
+    def serialize(self, fields=None):
+        """ Serializes a Customer, or only the given fields, into a dictionary
+
+        Timestamps are written in ISO 8601, as the API models format them.
+        """
+        if fields is None:
+            fields = self.FIELDS
+        customer = {name: getattr(self, name) for name in fields if name != "addresses"}
+        for name in ("created_at", "updated_at"):
+            if customer.get(name) is not None:
+                customer[name] = customer[name].isoformat()
+        if "addresses" in fields:
+            customer["addresses"] = [address.serialize() for address in self.addresses]
         return customer
 
     def deserialize(self, data):
@@ -321,14 +556,71 @@ class Customer(db.Model):
 
     @classmethod
     def init_db(cls, app: Flask):
-        """ Initializes the database session """
+        """ Initializes the database session for scripts and the tests
+
+        Unlike create_app() it pushes an app context for the rest of the
+        process and creates the missing tables.
+        """
         logger.info("Initializing database")
         cls.app = app
-        # This is where we initialize SQLAlchemy from the Flask app
-        db.init_app(app)
+        configure(app)
         app.app_context().push()
         db.create_all()  # make our sqlalchemy tables
 
+    @classmethod
+    def bulk_create(cls, customers, chunk_size=500, atomic=True):
+        """
+        Creates many deserialized Customers with batched multi-row INSERTs
+
+        Passwords are hashed up front and every chunk of customers is
+        flushed at once, so the customers and then their addresses go out
+        as a few multi-row INSERT statements instead of one per row.
+
+        Args:
+            customers (list): new Customers, e.g. from deserialize()
+            chunk_size (int): the number of Customers flushed together
+            atomic (bool): commit all Customers at once or nothing at all,
+                otherwise every chunk is committed on its own
+
+        Returns:
+            tuple: the ids of the Customers, None for the ones not created,
+                and the error message of every Customer, None for the created ones
+        """
+        logger.info("Creating %d customers in chunks of %d ...", len(customers), chunk_size)
+        ids = [None] * len(customers)
+        errors = [None] * len(customers)
+        # hash every distinct password once
+        hashes = {password: hash_password(password) for password in {customer.password for customer in customers}}
+        now = utcnow()
+        for customer in customers:
+            customer.id = None
+            customer.password = hashes[customer.password]
+            customer.created_at = customer.updated_at = now
+        for start in range(0, len(customers), chunk_size):
+            chunk = customers[start:start + chunk_size]
+            try:
+                db.session.add_all(chunk)
+                db.session.flush()
+                # read before the commit expires them, which would reload every Customer
+                chunk_ids = [customer.id for customer in chunk]
+                if not atomic:
+                    cls.stamp_changes(chunk_ids, chunk_size)
+                    db.session.commit()
+                ids[start:start + len(chunk)] = chunk_ids
+            except SQLAlchemyError as error:
+                db.session.rollback()
+                logger.warning("Batch insert failed at %d: %s", start, error)
+                message = str(getattr(error, "orig", None) or error)
+                if atomic:
+                    raise DataValidationError("Batch rejected: " + message) from error
+                errors[start:start + len(chunk)] = [message] * len(chunk)
+        if atomic:
+            # after the last flush, so the counter is locked only for the commit
+            cls.stamp_changes(ids, chunk_size)
+        db.session.commit()
+        customers_changed()
+        return ids, errors
+
     @classmethod
     def all(cls):
         """ Returns all of the Customer in the database """
@@ -341,6 +633,98 @@ class Customer(db.Model):
         logger.info("Processing lookup for id %s ...", customer_id)
         return cls.query.get(customer_id)
 
+    @classmethod
+    def bump_version(cls, customer_id):
+        """Increments the version of a Customer in the current transaction
+
+        Used by the Address writes, which change the Customer representation
+        without touching the customer row itself. The Customer is also moved
+        to the end of the changes feed.
+        """
+        db.session.execute(
+            update(cls).where(cls.id == customer_id).values(version=cls.version + 1, updated_at=utcnow()),
+            execution_options={"synchronize_session": False})
+        cls.stamp_changes([customer_id])
+
+    @classmethod
+    def stamp_changes(cls, customer_ids, chunk_size=500):
+        """Moves Customers to the end of the changes feed in the current transaction
+
+        Takes one number from next_change() for all of them, so it must be
+        the last write before the commit.
+        """
+        change_seq = next_change()
+        for start in range(0, len(customer_ids), chunk_size):
+            db.session.execute(
+                update(cls).where(cls.id.in_(customer_ids[start:start + chunk_size])).values(change_seq=change_seq),
+                execution_options={"synchronize_session": False})
+        return change_seq
+
+    @classmethod
+    def find_for_update(cls, customer_id):
+        """Finds a Customer by it's ID and locks the row until the next commit
+
+        Callers that check a precondition such as If-Match before writing use
+        this so no other writer can slip in between the check and the write.
+        """
+        logger.info("Processing locked lookup for id %s ...", customer_id)
+        return cls.query.filter(cls.id == customer_id).with_for_update().populate_existing().first()
+
+    @classmethod
+    def find_version(cls, customer_id, fresh=False):
+        """Returns the current version of a Customer without loading it
+
+        :param customer_id: the id of the Customer
+        :type customer_id: int
+        :param fresh: skip the cache, for reads that must see the latest writes
+        :type fresh: bool
+
+        :return: the version, or None if not found
+        :rtype: int
+
+        """
+        data = None if fresh else customer_cache.get(customer_id)
+        if data is not None:
+            return data["version"]
+        return db.session.query(cls.version).filter(cls.id == customer_id).scalar()
+
+    @classmethod
+    def find_serialized(cls, customer_id, fresh=False):
+        """Returns a serialized Customer through the read-through cache
+
+        On a miss, concurrent lookups of the same Customer share a single
+        query. The returned dictionary is shared with the cache and the
+        other callers and must not be modified.
+
+        :param customer_id: the id of the Customer to find
+        :type customer_id: int
+        :param fresh: skip the cache, for reads that must see the latest writes
+        :type fresh: bool
+
+        :return: the serialized Customer, or None if not found
+        :rtype: dict
+
+        """
+        if fresh:
+            return cls._load_serialized(customer_id)
+        data = customer_cache.get(customer_id)
+        if data is None:
+            data = customer_flights.do(("customer", customer_id), lambda: cls._load_serialized(customer_id))
+        return data
+
+    @classmethod
+    def _load_serialized(cls, customer_id):
+        # a write committed while this reads must not be cached over
+        generation = customer_cache.generation
+        customer = cls.find(customer_id)
+        if not customer:
+            return None
+        data = customer.serialize()
+        # a lagging replica must not fill the cache the primary reads share
+        if ReplicaRouter.current() is None:
+            customer_cache.set(customer_id, data, generation)
+        return data
+
     @classmethod
     def find_by_first_name(cls, first_name):
         """Returns all Customers with the given first_name
@@ -373,11 +757,14 @@ class Customer(db.Model):
     def find_by_email(cls, email):
         """Returns the Customer with the given email
 
+        Emails match case-insensitively, which lets the lookup use the
+        lower(email) index.
+
         Args:
             email (string): the email of the Customer you want to match
         """
         logger.info("Processing email query for %s ...", email)
-        return cls.query.filter(cls.email == email)
+        return cls.query.filter(cls._criterion("email", email))
 
     @classmethod
     def find_by_active(cls, active):
@@ -389,6 +776,491 @@ class Customer(db.Model):
         logger.info("Processing active query for %s ...", active)
         return cls.query.filter(cls.active == active)
 
+    @classmethod
+    def find_by_filters(cls, fields=None, **filters):
+        """Returns the Customers matching every one of the given filters
+
+        Customer filters apply to the customer row and address filters must
+        all hold for the same Address, so any combination runs as one SQL
+        statement with at most a single join.
+
+        :param fields: the fields to load, see project
+        :type fields: tuple
+        :param filters: values keyed by the names in CUSTOMER_FILTERS and ADDRESS_FILTERS
+        :type filters: dict
+
+        :return: a query of the Customers matching all the filters
+        :rtype: sqlalchemy.orm.Query
+
+        """
+        logger.info("Processing filter query for %s ...", filters)
+        cls._check_filters(filters)
+        customer_criteria = [cls._criterion(name, filters[name])
+                             for name in cls.CUSTOMER_FILTERS if filters.get(name) is not None]
+        address_criteria = [getattr(Address, name) == filters[name]
+                            for name in cls.ADDRESS_FILTERS if filters.get(name) is not None]
+        if address_criteria:
+            query = cls._join_addresses(*address_criteria)
+        else:
+            query = cls.query
+        return cls.project(query.filter(*customer_criteria), fields)
+
+    @classmethod
+    def parse_fields(cls, fields):
+        """Turns a fields string like 'id,email' into a tuple of FIELDS
+
+        :param fields: comma separated field names, None or empty for all of them
+        :type fields: str
+
+        :return: the requested fields in serialization order, or None for all
+        :rtype: tuple
+
+        """
+        names = {name.strip() for name in (fields or "").split(",") if name.strip()}
+        if not names:
+            return None
+        unknown = names - set(cls.FIELDS)
+        if unknown:
+            raise DataValidationError("Invalid field: " + ", ".join(sorted(unknown)))
+        return tuple(name for name in cls.FIELDS if name in names)
+
+    @classmethod
+    def project(cls, query, fields=None):
+        """Loads only the columns of the given fields
+
+        The SELECT lists just the requested columns (plus the primary key)
+        and the addresses are fetched in one extra round trip only when
+        they are part of the fields.
+
+        :param query: the Customer query to narrow
+        :type query: sqlalchemy.orm.Query
+        :param fields: names from FIELDS, None for all of them
+        :type fields: tuple
+
+        :return: the query with its loader options
+        :rtype: sqlalchemy.orm.Query
+
+        """
+        if fields is None:
+            return query.options(selectinload(cls.addresses))
+        columns = [getattr(cls, name) for name in fields if name != "addresses"]
+        query = query.options(load_only(*columns or [cls.id]))
+        if "addresses" in fields:
+            query = query.options(selectinload(cls.addresses))
+        return query
+
+    @classmethod
+    def _check_filters(cls, filters):
+        """Rejects filters on anything but the filterable columns"""
+        unknown = set(filters) - set(cls.CUSTOMER_FILTERS) - set(cls.ADDRESS_FILTERS)
+        if unknown:
+            raise DataValidationError("Invalid filter: " + ", ".join(sorted(unknown)))
+
+    @classmethod
+    def _filter_criteria(cls, filters, joined=False):
+        """Builds the WHERE criteria of the filters on customer alone
+
+        Address filters must all hold for the same Address and become an
+        id IN (SELECT customer_id ...) semi-join, so every Customer matches
+        at most once whatever the number of its Addresses. With joined, the
+        statement joins address and they filter the joined Addresses
+        instead, so the other Addresses of a Customer are left out.
+        """
+        cls._check_filters(filters)
+        criteria = [cls._criterion(name, filters[name])
+                    for name in cls.CUSTOMER_FILTERS if filters.get(name) is not None]
+        address_criteria = [getattr(Address, name) == filters[name]
+                            for name in cls.ADDRESS_FILTERS if filters.get(name) is not None]
+        if joined:
+            criteria.extend(address_criteria)
+        elif address_criteria:
+            criteria.append(cls.id.in_(select(Address.customer_id).where(*address_criteria)))
+        return criteria
+
+    @classmethod
+    def count(cls, **filters):
+        """Counts the Customers matching the filters with one SELECT COUNT(*)
+
+        :param filters: the same filters as find_by_filters
+
+        :return: the number of matching Customers
+        :rtype: int
+
+        """
+        logger.info("Processing count for %s ...", filters)
+        # pylint: disable=not-callable
+        stmt = select(func.count()).select_from(cls).where(*cls._filter_criteria(filters))
+        return db.session.execute(stmt).scalar_one()
+
+    @classmethod
+    def count_by(cls, dimension, limit=None, **filters):
+        """Counts the Customers matching the filters for every value of dimension
+
+        A Customer column counts every Customer once. An Address column
+        counts every Customer once per distinct value among its Addresses
+        matching the address filters, so a Customer with Addresses in two
+        cities counts in both, and Customers without Addresses are left out.
+
+        :param dimension: a name from GROUPABLE
+        :type dimension: str
+        :param limit: the most groups to return, the largest first
+        :type limit: int
+        :param filters: the same filters as find_by_filters
+
+        :return: (value, count) pairs, the largest counts first
+        :rtype: list
+
+        """
+        logger.info("Processing count by %s for %s ...", dimension, filters)
+        # pylint: disable=not-callable
+        if dimension not in cls.GROUPABLE:
+            raise DataValidationError(f"Invalid group_by: {dimension}")
+        joined = dimension in cls.ADDRESS_FILTERS
+        if joined:
+            column = getattr(Address, dimension)
+            count = func.count(distinct(Address.customer_id))
+            stmt = select(column, count).select_from(cls).join(cls.addresses)
+        else:
+            column = getattr(cls, dimension)
+            count = func.count()
+            stmt = select(column, count).select_from(cls)
+        stmt = stmt.where(*cls._filter_criteria(filters, joined)).group_by(column).order_by(count.desc(), column)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return [tuple(row) for row in db.session.execute(stmt).all()]
+
+    @classmethod
+    def rollup(cls, group_by=(), limit=None, fresh=False, **filters):
+        """Aggregates the Customers matching the filters, through a cache
+
+        Counts the Customers, the active ones and their share, the number
+        of Customers having 0, 1, 2... Addresses and, when group_by names
+        columns of ROLLUP_DIMENSIONS, the same counts for every combination
+        of their values. A Customer counts once in every group its
+        Addresses fall into. Results are cached until the next write and
+        concurrent misses share one computation. The returned dictionary
+        is shared and must not be modified.
+
+        :param group_by: the columns to group by, in order
+        :type group_by: tuple
+        :param limit: the most groups to return, the largest first
+        :type limit: int
+        :param fresh: skip the cache, for reads that must see the latest writes
+        :type fresh: bool
+        :param filters: the same filters as find_by_filters
+
+        :return: the aggregates
+        :rtype: dict
+
+        """
+        unknown = [name for name in group_by if name not in cls.ROLLUP_DIMENSIONS]
+        if unknown:
+            raise DataValidationError("Invalid group_by: " + ", ".join(unknown))
+        cls._check_filters(filters)
+        key = (tuple(group_by), limit, tuple(sorted((name, value) for name, value in filters.items() if value is not None)))
+        if fresh:
+            return cls._load_rollup(key, group_by, limit, filters)
+        data = rollup_cache.get(key)
+        if data is None:
+            data = customer_flights.do(("rollup",) + key, lambda: cls._load_rollup(key, group_by, limit, filters))
+        return data
+
+    @classmethod
+    def _load_rollup(cls, key, group_by, limit, filters):
+        generation = rollup_cache.generation
+        # pylint: disable=not-callable
+        criteria = cls._filter_criteria(filters)
+        per_customer = (
+            select(cls.active, func.count(Address.address_id).label("addresses"))
+            .select_from(cls).outerjoin(cls.addresses).where(*criteria).group_by(cls.id, cls.active)
+            .subquery()
+        )
+        active = func.sum(case((per_customer.c.active.is_(True), 1), else_=0))
+        distribution = db.session.execute(
+            select(per_customer.c.addresses, func.count(), active)
+            .group_by(per_customer.c.addresses).order_by(per_customer.c.addresses)).all()
+        customers = sum(row[1] for row in distribution)
+        data = _rollup_counts(customers, sum(row[2] for row in distribution))
+        data["addresses_per_customer"] = [{"addresses": row[0], "customers": row[1]} for row in distribution]
+        if group_by:
+            data["group_by"] = list(group_by)
+            data["groups"] = cls._rollup_groups(group_by, limit, filters)
+        # a lagging replica must not fill the cache the primary reads share
+        if ReplicaRouter.current() is None:
+            rollup_cache.set(key, data, generation)
+        return data
+
+    @classmethod
+    def _rollup_groups(cls, group_by, limit, filters):
+        """Runs the GROUP BY of rollup() and returns its groups
+
+        Grouped by an Address column, only the Addresses matching the
+        address filters place a Customer in a group.
+        """
+        # pylint: disable=not-callable
+        columns = [cls.active if name == "active" else getattr(Address, name) for name in group_by]
+        customers = func.count(distinct(cls.id))
+        stmt = select(*columns, customers, func.count(distinct(case((cls.active.is_(True), cls.id)))))
+        stmt = stmt.select_from(cls)
+        joined = any(name in cls.ADDRESS_FILTERS for name in group_by)
+        if joined:
+            stmt = stmt.join(cls.addresses)
+        stmt = stmt.where(*cls._filter_criteria(filters, joined)).group_by(*columns).order_by(customers.desc(), *columns)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return [{**dict(zip(group_by, row[:-2])), **_rollup_counts(row[-2], row[-1])}
+                for row in db.session.execute(stmt).all()]
+
+    @classmethod
+    def _where(cls, ids=None, **filters):
+        """Builds the WHERE criteria of a set-based statement on customer
+
+        Address filters become an id IN (SELECT customer_id ...) semi-join
+        because UPDATE and DELETE cannot join.
+        """
+        criteria = cls._filter_criteria(filters)
+        if ids is not None:
+            criteria.append(cls.id.in_(ids))
+        if not criteria:
+            raise DataValidationError("Refusing to change every Customer: give ids or a filter")
+        return criteria
+
+    @classmethod
+    def bulk_set_active(cls, state, ids=None, **filters):
+        """Activates or deactivates every matching Customer with one UPDATE
+
+        :param state: the new active state
+        :type state: bool
+        :param ids: the ids of the Customers to change
+        :type ids: list
+        :param filters: the same filters as find_by_filters
+
+        :return: the number of Customers that changed
+        :rtype: int
+
+        """
+        logger.info("Processing bulk active=%s for ids %s and %s ...", state, ids, filters)
+        stmt = (
+            update(cls)
+            .where(*cls._where(ids, **filters), cls.active != state)
+            .values(active=state, version=cls.version + 1, updated_at=utcnow())
+            .returning(cls.id)
+        )
+        changed = db.session.execute(stmt, execution_options={"synchronize_session": False}).scalars().all()
+        if changed:
+            cls.stamp_changes(changed)
+        db.session.commit()
+        customers_changed(*changed)
+        return len(changed)
+
+    @classmethod
+    def bulk_delete(cls, ids=None, **filters):
+        """Deletes every matching Customer and their Addresses in one transaction
+
+        The matching ids are locked and staged as tombstones of change 0
+        first, since deleting the Addresses would otherwise change what the
+        address filters match. Both DELETEs then select from the staged
+        rows in the database, however many Customers match, and the
+        tombstones get their change last, see next_change().
+
+        :param ids: the ids of the Customers to delete
+        :type ids: list
+        :param filters: the same filters as find_by_filters
+
+        :return: the number of Customers and of Addresses deleted
+        :rtype: tuple
+
+        """
+        logger.info("Processing bulk delete for ids %s and %s ...", ids, filters)
+        matching = (select(cls.id, literal(STAGED, db.BigInteger), literal(utcnow(), UTCDateTime))
+                    .where(*cls._where(ids, **filters)).with_for_update())
+        db.session.execute(insert(CustomerTombstone).from_select(
+            ["customer_id", "change_seq", "deleted_at"], matching))
+        staged = select(CustomerTombstone.customer_id).where(CustomerTombstone.change_seq == STAGED)
+        options = {"synchronize_session": False}
+        addresses = db.session.execute(
+            delete(Address).where(Address.customer_id.in_(staged)), execution_options=options).rowcount
+        deleted = db.session.execute(
+            delete(cls).where(cls.id.in_(staged)).returning(cls.id), execution_options=options).scalars().all()
+        if deleted:
+            db.session.execute(
+                update(CustomerTombstone).where(CustomerTombstone.change_seq == STAGED).values(change_seq=next_change()),
+                execution_options=options)
+        db.session.commit()
+        customers_changed(*deleted)
+        return len(deleted), addresses
+
+    @classmethod
+    def _criterion(cls, name, value):
+        """Builds the match of one Customer column in the shape its index expects"""
+        if name == "email":
+            return func.lower(cls.email) == value.lower()
+        return getattr(cls, name) == value
+
+    @classmethod
+    def find_by_address(cls, *criteria):
+        """Returns the distinct Customers having an Address that matches
+
+        The match runs as a single customer-join-address query and the
+        addresses of every matching customer are loaded eagerly in one
+        extra round trip instead of one lazy load per customer.
+
+        :param criteria: SQL expressions over the Address columns
+        :type criteria: sqlalchemy.sql.ColumnElement
+
+        :return: a query of the distinct Customers matching the criteria
+        :rtype: sqlalchemy.orm.Query
+
+        """
+        logger.info("Processing address query with %d criteria ...", len(criteria))
+        return cls._join_addresses(*criteria).options(selectinload(cls.addresses))
+
+    @classmethod
+    def _join_addresses(cls, *criteria):
+        """Builds the distinct customer-join-address query without loader options"""
+        return cls.query.join(cls.addresses).filter(*criteria).distinct()
+
+    @classmethod
+    def stream(cls, query, batch_size):
+        """Iterates over a Customer query through a server-side cursor
+
+        Rows are fetched batch_size at a time, with the addresses of each
+        batch loaded in one extra query when the query asks for them (see
+        project), so memory stays flat no matter how many Customers the
+        query matches.
+
+        :param query: the Customer query to iterate over
+        :type query: sqlalchemy.orm.Query
+        :param batch_size: the number of rows fetched per round trip
+        :type batch_size: int
+
+        :return: the Customers matching the query
+        :rtype: iterator
+
+        """
+        logger.info("Processing stream in batches of %s ...", batch_size)
+        return query.yield_per(batch_size)
+
+    @classmethod
+    def paginate(cls, query, sort=None, limit=None, cursor=None):
+        """Returns one keyset page of a Customer query
+
+        Rows are ordered by the requested sort keys with the id as the
+        final tie-breaker, and a page resumes strictly after the last row
+        of the previous one, so deep pages cost the same as the first.
+
+        :param query: the Customer query to page through
+        :type query: sqlalchemy.orm.Query
+        :param sort: comma separated columns, prefixed with '-' for descending
+        :type sort: str
+        :param limit: the maximum number of Customers on the page
+        :type limit: int
+        :param cursor: the opaque cursor returned with the previous page
+        :type cursor: str
+
+        :return: the Customers on the page and the cursor of the next page
+        :rtype: tuple
+
+        """
+        logger.info("Processing page of %s sorted by %s ...", limit, sort)
+        keys = cls._parse_sort(sort)
+        order = [getattr(cls, name).desc() if desc else getattr(cls, name).asc()
+                 for name, desc in keys]
+        # the cursor is built from the sort keys, load them even if projected away
+        query = query.order_by(None).order_by(*order).options(*[undefer(getattr(cls, name)) for name, _ in keys])
+        if cursor:
+            query = query.filter(cls._after(keys, _decode_cursor(cursor, sort)))
+        if limit is None:
+            return query.all(), None
+        customers = query.limit(limit + 1).all()
+        if len(customers) <= limit:
+            return customers, None
+        customers = customers[:limit]
+        last = customers[-1]
+        return customers, _encode_cursor(sort, [getattr(last, name) for name, _ in keys])
+
+    @classmethod
+    def changes(cls, cursor=None, limit=100):
+        """Returns the changes to the Customers after a cursor, oldest first
+
+        Every write moves the Customers it touches to the end of the feed
+        and every delete leaves a CustomerTombstone there, so a reader that
+        follows the cursors sees the last state of every Customer exactly
+        once per change. The feed is ordered by the change sequence rather
+        than updated_at, because timestamps are taken before the commit and
+        a slow transaction would otherwise commit behind a cursor.
+
+        :param cursor: the cursor returned with the previous page, None to start
+        :type cursor: str
+        :param limit: the most changes to return
+        :type limit: int
+
+        :return: the Customers and CustomerTombstones, the cursor to resume
+            from and whether more changes are waiting
+        :rtype: tuple
+
+        """
+        logger.info("Processing changes after %s ...", cursor)
+        after = _decode_cursor(cursor, "changes") if cursor else [0, 0]
+        if len(after) != 2 or not all(isinstance(value, int) for value in after):
+            raise DataValidationError("Invalid cursor: does not match the sort keys")
+        customers = (cls.query.options(selectinload(cls.addresses))
+                     .filter(tuple_(cls.change_seq, cls.id) > tuple_(*map(literal, after)))
+                     .order_by(cls.change_seq, cls.id).limit(limit + 1).all())
+        tombstones = (CustomerTombstone.query
+                      .filter(tuple_(CustomerTombstone.change_seq, CustomerTombstone.customer_id)
+                              > tuple_(*map(literal, after)))
+                      .order_by(CustomerTombstone.change_seq, CustomerTombstone.customer_id)
+                      .limit(limit + 1).all())
+        entries = list(heapq.merge(((customer.change_seq, customer.id, customer) for customer in customers),
+                                   ((tombstone.change_seq, tombstone.customer_id, tombstone) for tombstone in tombstones),
+                                   key=lambda entry: entry[:2]))
+        page = entries[:limit]
+        if not page:
+            return [], cursor, False
+        return [entry[2] for entry in page], _encode_cursor("changes", list(page[-1][:2])), len(entries) > limit
+
+    @classmethod
+    def _parse_sort(cls, sort):
+        """Turns a sort string like 'last_name,-id' into (column, descending) pairs"""
+        keys = []
+        for token in (sort or "").split(","):
+            token = token.strip()
+            if not token:
+                continue
+            name = token.lstrip("-+")
+            if name not in cls.SORTABLE:
+                raise DataValidationError(f"Invalid sort key: {name}")
+            if name not in [key for key, _ in keys]:
+                keys.append((name, token.startswith("-")))
+        if "id" not in [key for key, _ in keys]:
+            keys.append(("id", False))
+        return keys
+
+    @classmethod
+    def _after(cls, keys, values):
+        """Builds the keyset predicate that selects the rows after values"""
+        if len(values) != len(keys):
+            raise DataValidationError("Invalid cursor: does not match the sort keys")
+        columns = [getattr(cls, name) for name, _ in keys]
+        for column, value in zip(columns, values):
+            # a tampered cursor must not reach the database as a wrong type
+            expected = column.type.python_type
+            if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+                raise DataValidationError("Invalid cursor: does not match the sort keys")
+        # bind explicitly so that booleans compare like any other value
+        values = [literal(value, column.type) for column, value in zip(columns, values)]
+        if len({desc for _, desc in keys}) == 1:
+            # a single direction can use a row value comparison
+            if keys[0][1]:
+                return tuple_(*columns) < tuple_(*values)
+            return tuple_(*columns) > tuple_(*values)
+        clauses = []
+        for i, (column, value) in enumerate(zip(columns, values)):
+            step = column < value if keys[i][1] else column > value
+            clauses.append(and_(*[columns[j] == values[j] for j in range(i)], step))
+        return or_(*clauses)
+
     @classmethod
     def find_or_404(cls, customer_id: int):
         """Find a Customer by it's id
@@ -402,3 +1274,49 @@ class Customer(db.Model):
         """
         logger.info("Processing lookup or 404 for id %s ...", customer_id)
         return cls.query.get_or_404(customer_id)
+
+
+class ChangeSequence(db.Model):  # pylint: disable=too-few-public-methods
+    """
+    The counter that numbers the changes feed, a single row, see next_change()
+    """
+
+    __tablename__ = "change_sequence"
+
+    id = db.Column(db.Integer, primary_key=True)  # pylint: disable=invalid-name
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# The counter row exists as soon as its table does
+event.listen(ChangeSequence.__table__, "after_create",
+             DDL("INSERT INTO change_sequence (id, value) VALUES (1, 0)"))
+
+
+# The change of the tombstones bulk_delete() staged in its transaction
+STAGED = 0
+
+
+class CustomerTombstone(db.Model):
+    """
+    Class that represents a deleted Customer in the changes feed
+    """
+
+    customer_id = db.Column(db.Integer, primary_key=True)
+    # a reused id is deleted again under a later change
+    change_seq = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    deleted_at = db.Column(UTCDateTime, nullable=False, default=utcnow)
+
+    __table_args__ = (
+        db.Index("ix_customer_tombstone_change_seq_customer_id", "change_seq", "customer_id"),
+    )
+
+    def __repr__(self):
+        return f"<CustomerTombstone id=[{self.customer_id}], change=[{self.change_seq}]>"
+
+    @classmethod
+    def record(cls, customer_ids):
+        """Records the deletion of Customers in the current transaction"""
+        change_seq = next_change()
+        deleted_at = utcnow()
+        db.session.execute(insert(cls), [{"customer_id": customer_id, "deleted_at": deleted_at, "change_seq": change_seq}
+                                         for customer_id in customer_ids])
@@ -7,6 +7,10 @@ Paths:
 ------
 GET / - Displays a UI for Selenium testing
 GET /customers - Lists a list all of Customers
+HEAD /customers - Counts the Customers a list would return in X-Total-Count
+GET /customers/count - Counts the Customers, optionally grouped by a column
+GET /customers/stats - Aggregates the Customers by country, state, city and active
+GET /customers/changes - Lists the Customers changed or deleted since a cursor, oldest first
 GET /customers/{customer_id} - Reads the Customer with given Customer ID
 POST /customers - Creates a new Customer in the database
 PUT /customers/{customer_id} - Updates a Customer with given customer ID
@@ -20,15 +24,28 @@ PUT /customers/{customer_id}/activate - Activates a Customer with given Customer
 PUT /customers/{customer_id}/deactivate - Deactivates a Customer with given Customer ID
 
 """
-# pylint: disable=cyclic-import
-from flask import jsonify
+# pylint: disable=cyclic-import, too-many-lines
+from functools import lru_cache, wraps
+from flask import current_app, jsonify, request, Response, stream_with_context
 # from flask_restx import Api, Resource
 from flask_restx import fields, reqparse, inputs, Resource
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Query
+from werkzeug.http import quote_etag
 from service.common import status  # HTTP Status Codes
-from service.models import Customer, Address
+from service.common.compression import etag_variants
+from service.common.metrics import exposition
+from service.common.query_stats import query_budget
+from service.common.serializer import compile_serializer, dumps
+from service.common.static_assets import static_assets
+from service.models import (Customer, Address, DataValidationError, customer_cache, customer_flights, db, pool_stats,
+                            replicas, rollup_cache)
 
-# Import Flask application
-from . import app, api
+# Import the Swagger API, bound to the app in create_app()
+from . import api
+
+# Media type of the streamed customer list
+NDJSON = 'application/x-ndjson'
 
 create_address_model = api.model('Address', {
     'street': fields.String(required=True, description='The address street'),
@@ -64,40 +81,203 @@ customer_model = api.inherit(
     create_customer_model,
     {
         'id': fields.Integer(readOnly=True, description='The unique id assigned internally by service'),
+        'version': fields.Integer(readOnly=True, description='The row version, also served as the ETag'),
+        'created_at': fields.DateTime(readOnly=True, description='When the customer was created, in UTC'),
+        'updated_at': fields.DateTime(readOnly=True, description='When the customer or its addresses last changed, in UTC'),
     }
 )
 
+# Builds the customer_model shape straight from a Customer row, see customer_serializer
+serialize_customer = compile_serializer(customer_model)
+
 # query string arguments
-customer_args = reqparse.RequestParser()
-customer_args.add_argument('first_name', type=str, location='args', required=False, help='Find Customers by First Name')
-customer_args.add_argument('last_name', type=str, location='args', required=False, help='Find Customers by Last Name')
-customer_args.add_argument('email', type=str, location='args', required=False, help='Find Customers by Email')
-customer_args.add_argument('active', type=inputs.boolean, location='args', required=False, help='Is the Customer active?')
-customer_args.add_argument('street', type=str, location='args', required=False, help='Find Customers by Address street')
-customer_args.add_argument('city', type=str, location='args', required=False, help='Find Customers by Address city')
-customer_args.add_argument('state', type=str, location='args', required=False, help='Find Customers by Address state')
-customer_args.add_argument('country', type=str, location='args', required=False, help='Find Customers by Address country')
-customer_args.add_argument('pin_code', type=str, location='args', required=False, help='Find Customers by Address Pin Code')
+filter_args = reqparse.RequestParser()
+filter_args.add_argument('first_name', type=str, location='args', required=False, help='Find Customers by First Name')
+filter_args.add_argument('last_name', type=str, location='args', required=False, help='Find Customers by Last Name')
+filter_args.add_argument('email', type=str, location='args', required=False, help='Find Customers by Email')
+filter_args.add_argument('active', type=inputs.boolean, location='args', required=False, help='Is the Customer active?')
+filter_args.add_argument('street', type=str, location='args', required=False, help='Find Customers by Address street')
+filter_args.add_argument('city', type=str, location='args', required=False, help='Find Customers by Address city')
+filter_args.add_argument('state', type=str, location='args', required=False, help='Find Customers by Address state')
+filter_args.add_argument('country', type=str, location='args', required=False, help='Find Customers by Address country')
+filter_args.add_argument('pin_code', type=str, location='args', required=False, help='Find Customers by Address Pin Code')
+
+field_args = reqparse.RequestParser()
+field_args.add_argument('fields', type=str, location='args', required=False,
+                        help='Comma separated fields to return (e.g. id,email,active), all of them by default')
+
+customer_args = filter_args.copy()
+customer_args.add_argument(field_args.args[0])
+customer_args.add_argument('sort', type=str, location='args', required=False,
+                           help='Comma separated sort keys, prefix with - for descending (e.g. last_name,-id)')
+customer_args.add_argument('limit', type=inputs.positive, location='args', required=False, help='Maximum Customers per page')
+customer_args.add_argument('cursor', type=str, location='args', required=False, help='Cursor of the page to return')
+customer_args.add_argument('count', type=inputs.boolean, location='args', required=False,
+                           help='Add an X-Total-Count header with the number of matching Customers')
+
+count_args = filter_args.copy()
+count_args.add_argument('group_by', type=str, location='args', required=False, choices=Customer.GROUPABLE,
+                        help='Count the Customers of every value of this column, the largest groups first')
+count_args.add_argument('limit', type=inputs.positive, location='args', required=False, help='Maximum groups returned')
+
+rollup_args = filter_args.copy()
+rollup_args.add_argument('group_by', type=str, action='split', location='args', required=False,
+                         help='Comma separated columns to group by, any of ' + ', '.join(Customer.ROLLUP_DIMENSIONS))
+rollup_args.add_argument('limit', type=inputs.positive, location='args', required=False, help='Maximum groups returned')
+
+change_args = reqparse.RequestParser()
+change_args.add_argument('since', type=str, location='args', required=False,
+                         help='The next cursor of the previous page, from the beginning when left out')
+change_args.add_argument('limit', type=inputs.positive, location='args', required=False, help='Maximum changes per page')
+
+bulk_args = filter_args.copy()
+bulk_args.add_argument('ids', type=int, action='split', location='args', required=False,
+                       help='Comma separated ids of the Customers to change, may also be posted as {"ids": [...]}')
+
+batch_args = reqparse.RequestParser()
+batch_args.add_argument('atomic', type=inputs.boolean, location='args', required=False,
+                        help='Create all Customers or none (default), false commits chunk by chunk')
+
+batch_result_model = api.model('BatchResult', {
+    'index': fields.Integer(description='The position of the Customer in the posted list'),
+    'status': fields.Integer(description='The HTTP status of this Customer'),
+    'id': fields.Integer(description='The id of the created Customer'),
+    'location': fields.String(description='The URL of the created Customer'),
+    'error': fields.String(description='Why the Customer was not created'),
+})
+
+batch_model = api.model('BatchResponse', {
+    'created': fields.Integer(description='The number of Customers created'),
+    'failed': fields.Integer(description='The number of Customers not created'),
+    'results': fields.List(fields.Nested(batch_result_model, skip_none=True), description='The outcome of every Customer'),
+})
+
+bulk_ids_model = api.model('BulkIds', {
+    'ids': fields.List(fields.Integer, description='The ids of the Customers to change'),
+})
+
+bulk_active_model = api.model('BulkActiveResponse', {
+    'affected': fields.Integer(description='The number of Customers whose active state changed'),
+})
+
+count_group_model = api.model('CustomerCountGroup', {
+    'value': fields.Raw(description='The value of the group_by column'),
+    'count': fields.Integer(description='The number of matching Customers with this value'),
+})
+
+count_model = api.model('CustomerCount', {
+    'count': fields.Integer(description='The number of matching Customers'),
+    'group_by': fields.String(description='The column the groups are counted by'),
+    'groups': fields.List(fields.Nested(count_group_model), description='The count of every value, largest first'),
+})
+
+rollup_model = api.model('CustomerRollup', {
+    'customers': fields.Integer(description='The number of matching Customers'),
+    'active_customers': fields.Integer(description='The number of them that are active'),
+    'active_ratio': fields.Float(description='active_customers / customers'),
+    'addresses_per_customer': fields.List(fields.Raw, description='The number of Customers having each number of Addresses'),
+    'group_by': fields.List(fields.String, description='The columns the groups are keyed by'),
+    'groups': fields.List(fields.Raw, description='The group_by values and the same counts of every group, largest first'),
+})
+
+change_model = api.model('CustomerChange', {
+    'op': fields.String(description='upsert or delete'),
+    'id': fields.Integer(description='The id of the changed Customer'),
+    'change': fields.Integer(description='The position of the change in the feed'),
+    'customer': fields.Nested(customer_model, allow_null=True, description='The Customer as it is now, for upserts'),
+    'deleted_at': fields.DateTime(description='When the Customer was deleted, for deletes'),
+})
+
+change_feed_model = api.model('CustomerChanges', {
+    'changes': fields.List(fields.Nested(change_model), description='The changes, oldest first'),
+    'next': fields.String(description='The cursor to pass as since for the next changes'),
+    'more': fields.Boolean(description='Whether more changes are waiting right now'),
+})
+
+bulk_delete_model = api.model('BulkDeleteResponse', {
+    'customers': fields.Integer(description='The number of Customers deleted'),
+    'addresses': fields.Integer(description='The number of Addresses deleted with them'),
+})
+
+######################################################################
+# Read replica routing, see ReplicaRouter in service/models.py
+######################################################################
+
+
+def read_your_writes():
+    """Tells whether the request must see the writes committed before it"""
+    return request.headers.get('X-Read-Your-Writes', '').lower() in ('true', '1')
+
+
+def replica_read(function):
+    """Runs a read-only route on a read replica
+
+    Requests sent with X-Read-Your-Writes: true stay on the primary and skip
+    the customer cache, which another worker's writes leave stale. A read
+    that fails on a replica is retried once on the primary, the replica
+    having been ejected by the router.
+    """
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        if not replicas.engines or read_your_writes():
+            return function(*args, **kwargs)
+        try:
+            with replicas.reading():
+                return function(*args, **kwargs)
+        except OperationalError as error:
+            current_app.logger.warning('Read replica failed, retrying on the primary: %s', error)
+            db.session.rollback()
+            return function(*args, **kwargs)
+    return wrapper
 
 ############################################################
 # Health Endpoint
 ############################################################
 
 
-@app.route("/health")
 def health():
     """Health Status"""
     return jsonify(dict(status="OK")), status.HTTP_200_OK
 
 
+############################################################
+# Stats Endpoint
+############################################################
+
+
+def stats():
+    """Internal counters used to size the caches and the connection pool"""
+    return jsonify(customer_cache=customer_cache.stats(), rollup_cache=rollup_cache.stats(),
+                   single_flight=customer_flights.stats(), db_pool=pool_stats.stats(),
+                   replicas=replicas.stats()), status.HTTP_200_OK
+
+
+############################################################
+# Prometheus Metrics
+############################################################
+
+
+def prometheus_metrics():
+    """Request, connection pool and cache metrics of every worker"""
+    data, content_type = exposition()
+    return Response(data, status.HTTP_200_OK, content_type=content_type)
+
+
 ######################################################################
 # GET INDEX
 ######################################################################
-@app.route('/')
 def index():
     """Root URL response"""
-    app.logger.info("Request for Root URL")
-    return app.send_static_file('index.html')
+    current_app.logger.info("Request for Root URL")
+    return static_assets.send('index.html')
+
+
+def init_app(app):
+    """Adds the routes outside of the REST API to app"""
+    app.add_url_rule("/health", view_func=health)
+    app.add_url_rule("/stats", view_func=stats)
+    app.add_url_rule("/metrics", view_func=prometheus_metrics)
+    app.add_url_rule("/", view_func=index)
 
 
 ######################################################################
@@ -123,19 +303,33 @@ class CustomerResource(Resource):
     # ------------------------------------------------------------------
 
     @api.doc('get_customers')
+    @api.expect(field_args, validate=True)
     @api.response(404, 'Customer not found')
-    @api.marshal_with(customer_model)
+    @api.response(304, 'Customer not modified since the If-None-Match ETag')
+    @api.response(200, 'Success', customer_model)
+    @replica_read
+    @query_budget(2)
     def get(self, customer_id):
         """
         Retrieve a single Customer
         This endpoint will return a Customer based on its ID.
         """
-        app.logger.info("Request to Retrieve a Customer with id [%s]", customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info("Request to Retrieve a Customer with id [%s]", customer_id)
+        selected = Customer.parse_fields(field_args.parse_args()['fields'])
+        if request.if_none_match:
+            version = Customer.find_version(customer_id, read_your_writes())
+            if version is not None and any(request.if_none_match.contains_weak(etag)
+                                           for etag in etag_variants(str(version))):
+                current_app.logger.info('Customer with id [%s] not modified', customer_id)
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=etag_header(version))
+        customer = Customer.find_serialized(customer_id, read_your_writes())
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
-        app.logger.info('Returning customer: %s', customer.id)
-        return customer.serialize(), status.HTTP_200_OK
+        current_app.logger.info('Returning customer: %s', customer['id'])
+        headers = etag_header(customer['version'])
+        if selected is not None:
+            customer = {name: customer[name] for name in selected}
+        return json_response(customer, status.HTTP_200_OK, headers)
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING CUSTOMER
@@ -144,6 +338,7 @@ class CustomerResource(Resource):
     @api.doc('update_customers')
     @api.response(404, 'Customer not found')
     @api.response(400, 'The posted Customer data was not valid')
+    @api.response(412, 'The Customer changed since the If-Match ETag')
     @api.expect(customer_model)
     @api.marshal_with(customer_model)
     def put(self, customer_id):
@@ -151,20 +346,21 @@ class CustomerResource(Resource):
         Update a Customer
         This endpoint will update a Customer based on the body that is posted.
         """
-        app.logger.info('Request to Update a Customer with id [%s]', customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info('Request to Update a Customer with id [%s]', customer_id)
+        customer = Customer.find_for_update(customer_id)
         original_password = None
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
         else:
+            check_if_match(customer_id, customer.version)
             original_password = customer.password
-        app.logger.debug('Payload = %s', api.payload)
+        current_app.logger.debug('Payload = %s', api.payload)
         data = api.payload
         customer.deserialize(data)
         customer.id = customer_id
         customer.update(original_password)
-        app.logger.info('Customer with ID [%s] updated.', customer.id)
-        return customer.serialize(), status.HTTP_200_OK
+        current_app.logger.info('Customer with ID [%s] updated.', customer.id)
+        return customer.serialize(), status.HTTP_200_OK, etag_header(customer.version)
 
     # ------------------------------------------------------------------
     # DELETE A CUSTOMER
@@ -172,16 +368,19 @@ class CustomerResource(Resource):
 
     @api.doc('delete_customers')
     @api.response(204, 'Customer deleted')
+    @api.response(412, 'The Customer changed since the If-Match ETag')
+    @query_budget(4)
     def delete(self, customer_id):
         """
         Delete a Customer
         This endpoint will delete a Customer based on the ID specified in the path.
         """
-        app.logger.info('Request to Delete a Customer with id [%s]', customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info('Request to Delete a Customer with id [%s]', customer_id)
+        customer = Customer.find_for_update(customer_id)
+        check_if_match(customer_id, customer.version if customer else None)
         if customer:
             customer.delete()
-            app.logger.info('Customer with id [%s] was deleted', customer_id)
+            current_app.logger.info('Customer with id [%s] was deleted', customer_id)
         return '', status.HTTP_204_NO_CONTENT
 
 ######################################################################
@@ -198,49 +397,60 @@ class CustomerCollection(Resource):
 
     @api.doc('list_customers')
     @api.expect(customer_args, validate=True)
-    @api.marshal_list_with(customer_model)
+    @api.produces(['application/json', NDJSON])
+    @api.response(200, 'Success', [customer_model])
+    @replica_read
+    @query_budget(2, count=1)
     def get(self):
         """
         Lists all of the Customers
         This endpoint will list all the customers.
+        With an Accept of application/x-ndjson the list is streamed one Customer per line.
+        Identical JSON lists requested at the same time are queried and encoded once.
+        With count=true the X-Total-Count header holds the number of Customers matching the filters.
         """
-        app.logger.info('Request to list customers...')
-        customers = []
+        current_app.logger.info('Request to list customers...')
         args = customer_args.parse_args()
-        if args['first_name']:
-            app.logger.info('Filtering by first name: %s', args['first_name'])
-            customers = Customer.find_by_first_name(args['first_name'])
-        elif args['last_name']:
-            app.logger.info('Filtering by last name: %s', args['last_name'])
-            customers = Customer.find_by_last_name(args['last_name'])
-        elif args['active'] is not None:
-            app.logger.info('Filtering by active state: %s', args['active'])
-            customers = Customer.find_by_active(args['active'])
-        elif args['email']:
-            app.logger.info('Filtering by email: %s', args['email'])
-            customers = Customer.find_by_email(args['email'])
-        elif args['street']:
-            app.logger.info('Filtering by street: %s', args['street'])
-            customers = Address.find_by_street(args['street'])
-        elif args['city']:
-            app.logger.info('Filtering by city: %s', args['city'])
-            customers = Address.find_by_city(args['city'])
-        elif args['state']:
-            app.logger.info('Filtering by state: %s', args['state'])
-            customers = Address.find_by_state(args['state'])
-        elif args['country']:
-            app.logger.info('Filtering by country: %s', args['country'])
-            customers = Address.find_by_country(args['country'])
-        elif args['pin_code']:
-            app.logger.info('Filtering by pin code: %s', args['pin_code'])
-            customers = Address.find_by_pin_code(args['pin_code'])
+        filters = customer_filters(args)
+        if filters:
+            current_app.logger.info('Filtering by: %s', filters)
         else:
-            app.logger.info('Returning unfiltered list.')
-            customers = Customer.all()
+            current_app.logger.info('Returning unfiltered list.')
+        selected = Customer.parse_fields(args['fields'])
+        if request.accept_mimetypes.best_match(['application/json', NDJSON]) == NDJSON:
+            customers, headers = paginate(Customer.find_by_filters(selected, **filters), args)
+            if args['count']:
+                headers['X-Total-Count'] = Customer.count(**filters)
+            return ndjson_response(customers, headers, selected)
+
+        if read_your_writes():
+            # a list in flight may run on a lagging replica, never join it
+            body, headers = list_body(filters, selected, args)
+        else:
+            # the Link header holds the host, so it is part of the key
+            key = ('list', request.host_url,
+                   tuple(sorted((name, value) for name, value in args.items() if value is not None)))
+            body, headers = customer_flights.do(key, lambda: list_body(filters, selected, args))
+        return Response(body, status.HTTP_200_OK, headers, mimetype='application/json')
 
-        # app.logger.info('[%s] Customers returned', len(customers))
-        results = [customer.serialize() for customer in customers]
-        return results, status.HTTP_200_OK
+    # ------------------------------------------------------------------
+    # COUNT THE CUSTOMERS OF A LIST
+    # ------------------------------------------------------------------
+
+    @api.doc('count_customers_head')
+    @api.expect(filter_args, validate=True)
+    @api.response(200, 'The X-Total-Count header holds the number of matching Customers')
+    @replica_read
+    @query_budget(1)
+    def head(self):
+        """
+        Counts the Customers of a list
+        This endpoint returns no body, only the X-Total-Count header with the
+        number of Customers the same filters would list.
+        """
+        filters = customer_filters(filter_args.parse_args())
+        current_app.logger.info('Request to count customers by: %s', filters)
+        return Response(status=status.HTTP_200_OK, headers={'X-Total-Count': Customer.count(**filters)})
 
     # ------------------------------------------------------------------
     # ADD A NEW CUSTOMER
@@ -255,19 +465,240 @@ class CustomerCollection(Resource):
         Creates a Customer
         This endpoint will create a Customer based on the data in the body that is posted.
         """
-        app.logger.info('Request to Create a Customer')
+        current_app.logger.info('Request to Create a Customer')
         customer = Customer()
-        app.logger.debug('Payload = %s', api.payload)
+        current_app.logger.debug('Payload = %s', api.payload)
         customer.deserialize(api.payload)
         customer.create()
-        app.logger.info('Customer with new id [%s] created!', customer.id)
+        current_app.logger.info('Customer with new id [%s] created!', customer.id)
         location_url = api.url_for(CustomerResource, customer_id=customer.id, _external=True)
         return customer.serialize(), status.HTTP_201_CREATED, {'Location': location_url}
 
+    # ------------------------------------------------------------------
+    # DELETE MANY CUSTOMERS
+    # ------------------------------------------------------------------
+
+    @api.doc('delete_customers')
+    @api.expect(bulk_args, bulk_ids_model, validate=False)
+    @api.response(400, 'Neither ids nor a filter were given')
+    @api.marshal_with(bulk_delete_model)
+    @query_budget(5)
+    def delete(self):
+        """
+        Deletes many Customers
+        This endpoint deletes every Customer matching the ids and filters, and
+        their Addresses, with one DELETE statement per table.
+        """
+        current_app.logger.info('Request to Delete many Customers')
+        ids, filters = bulk_selector(bulk_args.parse_args())
+        customers, addresses = Customer.bulk_delete(ids, **filters)
+        current_app.logger.info('%d Customers and %d Addresses deleted', customers, addresses)
+        return {'customers': customers, 'addresses': addresses}, status.HTTP_200_OK
+
+######################################################################
+#  PATH: /customers/count
+######################################################################
+
+
+@api.route('/customers/count', strict_slashes=False)
+class CustomerCountResource(Resource):
+    """ Counts Customers without listing them """
+
+    @api.doc('count_customers')
+    @api.expect(count_args, validate=True)
+    @api.response(400, 'The filters or group_by were not valid')
+    @api.marshal_with(count_model, skip_none=True)
+    @replica_read
+    @query_budget(2)
+    def get(self):
+        """
+        Counts the Customers
+        This endpoint returns the number of Customers matching the filters and,
+        with group_by, the number for every value of that column.
+        """
+        args = count_args.parse_args()
+        filters = customer_filters(args)
+        current_app.logger.info('Request to count customers by %s: %s', args['group_by'], filters)
+        result = {'count': Customer.count(**filters)}
+        if args['group_by']:
+            limit = min(args['limit'] or current_app.config['DEFAULT_PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+            groups = Customer.count_by(args['group_by'], limit, **filters)
+            result.update(group_by=args['group_by'], groups=[{'value': value, 'count': count} for value, count in groups])
+        return result, status.HTTP_200_OK
+
+######################################################################
+#  PATH: /customers/stats
+######################################################################
+
+
+@api.route('/customers/stats', strict_slashes=False)
+class CustomerRollupResource(Resource):
+    """ Aggregates of the Customers for reporting """
+
+    @api.doc('customer_stats')
+    @api.expect(rollup_args, validate=True)
+    @api.response(400, 'The filters or group_by were not valid')
+    @api.response(200, 'Success', rollup_model)
+    @replica_read
+    @query_budget(2)
+    def get(self):
+        """
+        Aggregates the Customers
+        This endpoint returns the number of Customers, of active ones and of
+        Customers by number of Addresses, grouped by group_by when given.
+        Results are cached until the next write.
+        """
+        args = rollup_args.parse_args()
+        filters = customer_filters(args)
+        group_by = tuple(name.strip() for name in args['group_by'] or () if name.strip())
+        current_app.logger.info('Request for customer stats by %s: %s', group_by, filters)
+        limit = min(args['limit'] or current_app.config['DEFAULT_PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+        return json_response(Customer.rollup(group_by, limit, fresh=read_your_writes(), **filters), status.HTTP_200_OK)
+
+######################################################################
+#  PATH: /customers/changes
+######################################################################
+
+
+@api.route('/customers/changes', strict_slashes=False)
+class CustomerChangesResource(Resource):
+    """ The feed of the changes to the Customers """
+
+    @api.doc('customer_changes')
+    @api.expect(change_args, validate=True)
+    @api.response(400, 'The since cursor was not valid')
+    @api.response(200, 'Success', change_feed_model)
+    @replica_read
+    @query_budget(3)
+    def get(self):
+        """
+        Lists the changes to the Customers
+        This endpoint returns the Customers created or updated and the ones
+        deleted after the since cursor, oldest first, with the cursor of the
+        next page. Polling with the last next cursor returns the new changes.
+        """
+        args = change_args.parse_args()
+        current_app.logger.info('Request for customer changes since %s', args['since'])
+        limit = min(args['limit'] or current_app.config['DEFAULT_PAGE_SIZE'], current_app.config['MAX_PAGE_SIZE'])
+        entries, cursor, more = Customer.changes(args['since'], limit)
+        changes = []
+        for entry in entries:
+            if isinstance(entry, Customer):
+                changes.append({'op': 'upsert', 'id': entry.id, 'change': entry.change_seq,
+                                'customer': serialize_customer(entry)})
+            else:
+                changes.append({'op': 'delete', 'id': entry.customer_id, 'change': entry.change_seq,
+                                'deleted_at': entry.deleted_at})
+        return json_response({'changes': changes, 'next': cursor, 'more': more}, status.HTTP_200_OK)
+
+######################################################################
+#  PATH: /customers/batch
+######################################################################
+
+
+@api.route('/customers/batch', strict_slashes=False)
+class CustomerBatchResource(Resource):
+    """ Creates many Customers in one request """
+
+    @api.doc('create_customers_batch')
+    @api.expect(batch_args, [create_customer_model], validate=False)
+    @api.response(400, 'The posted data was not valid')
+    @api.response(413, 'Too many Customers in one batch')
+    @api.response(207, 'Some of the Customers were not created', batch_model)
+    @api.marshal_with(batch_model, code=201, skip_none=True)
+    def post(self):
+        """
+        Creates a batch of Customers
+        This endpoint validates every posted Customer before inserting any and
+        creates the valid ones with batched multi-row INSERTs. By default the
+        batch is all-or-nothing; with atomic=false every chunk commits on its own
+        and invalid Customers are skipped.
+        """
+        current_app.logger.info('Request to Create a batch of Customers')
+        args = batch_args.parse_args()
+        atomic = current_app.config['BATCH_ATOMIC'] if args['atomic'] is None else args['atomic']
+        payload = api.payload
+        if not isinstance(payload, list):
+            raise DataValidationError('Invalid batch: body of request must be a list of Customers')
+        if len(payload) > current_app.config['BATCH_MAX_SIZE']:
+            abort(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                  f"Batch of {len(payload)} Customers exceeds {current_app.config['BATCH_MAX_SIZE']}.")
+
+        customers, results = deserialize_batch(payload)
+        failed = [result for result in results if 'error' in result]
+        if failed and atomic:
+            current_app.logger.info('Batch rejected: %d of %d Customers are invalid', len(failed), len(payload))
+            for result in results:
+                result.setdefault('status', status.HTTP_424_FAILED_DEPENDENCY)
+                result.setdefault('error', 'Not created: another Customer of the batch is invalid')
+            return batch_response(results, status.HTTP_400_BAD_REQUEST)
+
+        ids, errors = Customer.bulk_create(customers, current_app.config['BATCH_CHUNK_SIZE'], atomic)
+        pending = [result for result in results if 'error' not in result]
+        for result, customer_id, error in zip(pending, ids, errors):
+            if error:
+                result.update(status=status.HTTP_400_BAD_REQUEST, error=error)
+            else:
+                result.update(status=status.HTTP_201_CREATED, id=customer_id,
+                              location=api.url_for(CustomerResource, customer_id=customer_id, _external=True))
+        response = batch_response(results, status.HTTP_201_CREATED)
+        current_app.logger.info('Batch created %d of %d Customers', response[0]['created'], len(payload))
+        return response
+
 ######################################################################
 # Activate / Deactivate Customer
 ######################################################################
 
+######################################################################
+#  PATH: /customers/activate
+######################################################################
+
+
+@api.route('/customers/activate')
+class BulkActivateResource(Resource):
+    """ Activates many Customers at once """
+
+    @api.doc('activate_many_customers')
+    @api.expect(bulk_args, bulk_ids_model, validate=False)
+    @api.response(400, 'Neither ids nor a filter were given')
+    @api.marshal_with(bulk_active_model)
+    @query_budget(3)
+    def put(self):
+        """
+        Activate many Customers
+        This endpoint activates every Customer matching the ids and filters with one UPDATE.
+        """
+        current_app.logger.info('Request to Activate many Customers')
+        ids, filters = bulk_selector(bulk_args.parse_args())
+        affected = Customer.bulk_set_active(True, ids, **filters)
+        current_app.logger.info('%d Customers have been activated!', affected)
+        return {'affected': affected}, status.HTTP_200_OK
+
+######################################################################
+#  PATH: /customers/deactivate
+######################################################################
+
+
+@api.route('/customers/deactivate')
+class BulkDeactivateResource(Resource):
+    """ Deactivates many Customers at once """
+
+    @api.doc('deactivate_many_customers')
+    @api.expect(bulk_args, bulk_ids_model, validate=False)
+    @api.response(400, 'Neither ids nor a filter were given')
+    @api.marshal_with(bulk_active_model)
+    @query_budget(3)
+    def put(self):
+        """
+        Deactivate many Customers
+        This endpoint deactivates every Customer matching the ids and filters with one UPDATE.
+        """
+        current_app.logger.info('Request to Deactivate many Customers')
+        ids, filters = bulk_selector(bulk_args.parse_args())
+        affected = Customer.bulk_set_active(False, ids, **filters)
+        current_app.logger.info('%d Customers have been deactivated!', affected)
+        return {'affected': affected}, status.HTTP_200_OK
+
 ######################################################################
 #  PATH: /customers/{customer_id}/activate
 ######################################################################
@@ -285,14 +716,14 @@ class ActivateResource(Resource):
         Activate a Customer
         This endpoint will activate a Customer.
         """
-        app.logger.info(f'Request to Activate a Customer with ID: {customer_id}')
+        current_app.logger.info(f'Request to Activate a Customer with ID: {customer_id}')
         customer = Customer.find(customer_id)
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f'Customer with id [{customer_id}] was not found.')
         customer.id = customer_id
         customer.active = True
         customer.update()
-        app.logger.info('Customer with id [%s] has been activated!', customer.id)
+        current_app.logger.info('Customer with id [%s] has been activated!', customer.id)
         return customer.serialize(), status.HTTP_200_OK
 
 ######################################################################
@@ -312,14 +743,14 @@ class DeactivateResource(Resource):
         Deactivate a Customer
         This endpoint will deactivate a Customer.
         """
-        app.logger.info(f'Request to Deactivate a Customer with ID: {customer_id}')
+        current_app.logger.info(f'Request to Deactivate a Customer with ID: {customer_id}')
         customer = Customer.find(customer_id)
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f'Customer with id [{customer_id}] was not found.')
         customer.id = customer_id
         customer.active = False
         customer.update()
-        app.logger.info('Customer with id [%s] has been deactivated!', customer.id)
+        current_app.logger.info('Customer with id [%s] has been deactivated!', customer.id)
         return customer.serialize(), status.HTTP_200_OK
 
 ######################################################################
@@ -346,26 +777,28 @@ class AddressResource(Resource):
     @api.doc('get_addresses')
     @api.marshal_with(address_model)
     @api.response(404, 'Address not found')
+    @replica_read
+    @query_budget(2)
     def get(self, address_id, customer_id):
         """
         Retrieve an address
         This endpoint will return an address from a customer based on its ID.
         """
-        app.logger.info('Request to retrieve an Address %s from Customer with id: %s', address_id, customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info('Request to retrieve an Address %s from Customer with id: %s', address_id, customer_id)
+        customer = Customer.find_serialized(customer_id, read_your_writes())
         if not customer:
             abort(
                 status.HTTP_404_NOT_FOUND,
                 f"Customer with id '{customer_id}' was not found.",
             )
-        address = Address.find(address_id)
-        if not address or address.customer_id != customer.id:
+        address = next((addr for addr in customer['addresses'] if addr['address_id'] == address_id), None)
+        if not address:
             abort(
                 status.HTTP_404_NOT_FOUND,
-                f"Address with id '{address_id}' could not be found for the customer with id {customer.id}.",
+                f"Address with id '{address_id}' could not be found for the customer with id {customer_id}.",
             )
-        app.logger.info('Returning address: %s', address.address_id)
-        return address.serialize(), status.HTTP_200_OK
+        current_app.logger.info('Returning address: %s', address['address_id'])
+        return address, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
     # UPDATE AN EXISTING ADDRESS
@@ -381,7 +814,7 @@ class AddressResource(Resource):
         This endpoint will update an Address based on the body that is posted.
         """
 
-        app.logger.info('Request to Address with address_id [%s] and customer_id [%s] ...', address_id, customer_id)
+        current_app.logger.info('Request to Address with address_id [%s] and customer_id [%s] ...', address_id, customer_id)
         customer = Customer.find(customer_id)
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
@@ -402,7 +835,7 @@ class AddressResource(Resource):
         addr_to_update.customer_id = customer_id
         addr_to_update.update()
 
-        app.logger.info('Address with address_id [%s] and customer_id [%s] updated.', address_id, customer.id)
+        current_app.logger.info('Address with address_id [%s] and customer_id [%s] updated.', address_id, customer.id)
         return addr_to_update.serialize(), status.HTTP_200_OK
 
     # ------------------------------------------------------------------
@@ -411,17 +844,19 @@ class AddressResource(Resource):
 
     @api.doc('delete_addresses')
     @api.response(204, 'Address deleted')
+    @query_budget(5)
     def delete(self, address_id, customer_id):
         """
         Delete an address from a customer
         This endpoint will delete an Address based on the ID specified in the path.
         """
-        app.logger.info('Request to delete address with address_id [%s] and customer_id [%s] ...', address_id, customer_id)
+        current_app.logger.info('Request to delete address with address_id [%s] and customer_id [%s] ...',
+                                address_id, customer_id)
 
         address = Address.find(address_id)
         if address and address.customer_id == customer_id:
             address.delete()
-            app.logger.info('Address with ID [%s] and customer ID [%s] delete completed.', address_id, customer_id)
+            current_app.logger.info('Address with ID [%s] and customer ID [%s] delete completed.', address_id, customer_id)
         return '', status.HTTP_204_NO_CONTENT
 
 
@@ -438,18 +873,20 @@ class AddressCollection(Resource):
 
     @api.doc('list_addresses')
     @api.marshal_list_with(address_model)
+    @replica_read
+    @query_budget(2)
     def get(self, customer_id):
         """
         List all of the addresses of a Customer
         This endpoint will list all addresses of a Customer.
         """
-        app.logger.info('Request to list Addresses for Customer with id: %s', customer_id)
-        customer = Customer.find(customer_id)
+        current_app.logger.info('Request to list Addresses for Customer with id: %s', customer_id)
+        customer = Customer.find_serialized(customer_id, read_your_writes())
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
 
-        results = [address.serialize() for address in customer.addresses]
-        app.logger.info("Returning %d addresses", len(results))
+        results = customer['addresses']
+        current_app.logger.info("Returning %d addresses", len(results))
         return results, status.HTTP_200_OK
 
     # ------------------------------------------------------------------
@@ -465,7 +902,7 @@ class AddressCollection(Resource):
         Create an address for a customer
         This endpoint will add a new address for a customer.
         """
-        app.logger.info('Request to create an address for customer with id: %s', customer_id)
+        current_app.logger.info('Request to create an address for customer with id: %s', customer_id)
         customer = Customer.find(customer_id)
         if not customer:
             abort(status.HTTP_404_NOT_FOUND, f"Customer with id '{customer_id}' was not found.")
@@ -481,7 +918,7 @@ class AddressCollection(Resource):
                                    customer_id=address.customer_id,
                                    address_id=address.address_id,
                                    _external=True)
-        app.logger.info('Address with ID [%s] created for Customer: [%s].', address.address_id, customer.id)
+        current_app.logger.info('Address with ID [%s] created for Customer: [%s].', address.address_id, customer.id)
         return address.serialize(), status.HTTP_201_CREATED, {"Location": location_url}
 
 
@@ -489,7 +926,121 @@ class AddressCollection(Resource):
 #  U T I L I T Y   F U N C T I O N S
 ######################################################################
 
+def customer_filters(args):
+    """Picks the filter arguments that were given out of the parsed query string"""
+    return {name: args[name] for name in Customer.CUSTOMER_FILTERS + Customer.ADDRESS_FILTERS
+            if args.get(name) is not None and args.get(name) != ''}
+
+
+def bulk_selector(args):
+    """Returns the ids and filters that select the Customers of a bulk change"""
+    ids = args['ids']
+    body = request.get_json(silent=True) or {}
+    if not isinstance(body, dict):
+        raise DataValidationError('Invalid request: body must be an object like {"ids": [...]}')
+    if body.get('ids') is not None:
+        if not isinstance(body['ids'], list) or \
+                not all(isinstance(i, int) and not isinstance(i, bool) for i in body['ids']):
+            raise DataValidationError('Invalid ids: must be a list of integers')
+        ids = (ids or []) + body['ids']
+    return ids, customer_filters(args)
+
+
+def paginate(query, args):
+    """Applies the sort, limit and cursor arguments to a Customer query"""
+    if not (args['sort'] or args['limit'] or args['cursor']):
+        return query, {}
+    limit = args['limit']
+    if limit is None and args['cursor']:
+        limit = current_app.config['DEFAULT_PAGE_SIZE']
+    if limit is not None:
+        limit = min(limit, current_app.config['MAX_PAGE_SIZE'])
+    customers, next_cursor = Customer.paginate(query, args['sort'], limit, args['cursor'])
+    if not next_cursor:
+        return customers, {}
+    params = request.args.to_dict()
+    params.update(cursor=next_cursor, limit=limit)
+    next_url = api.url_for(CustomerCollection, _external=True, **params)
+    return customers, {'Link': f'<{next_url}>; rel="next"', 'X-Next-Cursor': next_cursor}
+
+
+@lru_cache(maxsize=64)
+def customer_serializer(selected=None):
+    """Returns the serializer of the customer_model narrowed to the selected fields"""
+    if selected is None:
+        return serialize_customer
+    return compile_serializer(customer_model, selected)
+
+
+def json_response(data, code, headers=None):
+    """Returns data encoded as JSON without a second marshalling pass"""
+    return Response(dumps(data), code, headers, mimetype='application/json')
+
+
+def list_body(filters, selected, args):
+    """Returns the page of Customers encoded as a JSON list, and its headers"""
+    serialize = customer_serializer(selected)
+    customers, headers = paginate(Customer.find_by_filters(selected, **filters), args)
+    if args['count']:
+        headers['X-Total-Count'] = Customer.count(**filters)
+    return dumps([serialize(customer) for customer in customers]), headers
+
+
+def ndjson_response(customers, headers, selected=None):
+    """Returns the Customers as a stream of NDJSON lines"""
+    serialize = customer_serializer(selected)
+    current_app.logger.info('Streaming customers as %s', NDJSON)
+    if isinstance(customers, Query):
+        customers = Customer.stream(customers, current_app.config['STREAM_BATCH_SIZE'])
+    # the rows are only fetched while streaming, after the route returned
+    replica = replicas.current()
+
+    def generate():
+        with replicas.using(replica):
+            for customer in customers:
+                yield dumps(serialize(customer)) + b"\n"
+
+    return Response(stream_with_context(generate()), status.HTTP_200_OK, headers, mimetype=NDJSON)
+
+
+def etag_header(version):
+    """Returns the ETag header for a Customer version"""
+    return {'ETag': quote_etag(str(version))}
+
+
+def check_if_match(customer_id, version):
+    """Aborts with 412 when the request's If-Match does not hold the current version"""
+    matches = version is not None and any(request.if_match.contains(etag) for etag in etag_variants(str(version)))
+    if request.if_match and not matches:
+        abort(status.HTTP_412_PRECONDITION_FAILED,
+              f"Customer with id '{customer_id}' does not match the If-Match ETag.")
+
+
+def deserialize_batch(payload):
+    """Validates every posted Customer before any of them is created"""
+    customers = []
+    results = []
+    for position, data in enumerate(payload):
+        try:
+            customer = Customer().deserialize(data)
+            if not isinstance(customer.password, str):
+                raise DataValidationError('Invalid Customer: password must be a string')
+            customers.append(customer)
+            results.append({'index': position})
+        except DataValidationError as error:
+            results.append({'index': position, 'status': status.HTTP_400_BAD_REQUEST, 'error': str(error)})
+    return customers, results
+
+
+def batch_response(results, code):
+    """Summarizes the per-Customer results of a batch"""
+    failed = sum(1 for result in results if 'error' in result)
+    if failed and code == status.HTTP_201_CREATED:
+        code = status.HTTP_207_MULTI_STATUS
+    return {'created': len(results) - failed, 'failed': failed, 'results': results}, code
+
+
 def abort(error_code: int, message: str):
     """Logs errors before aborting"""
-    app.logger.error(message)
+    current_app.logger.error(message)
     api.abort(error_code, message)
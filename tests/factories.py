@@ -35,3 +35,14 @@ class AddressFactory(factory.Factory):
     country = factory.Faker("country")
     pin_code = FuzzyChoice(["11101", "68420"])
     customer_id = None
+
+
+def create_customers_in_city(count, city, **fields):
+    """Creates count Customers, the first of them with one Address in city"""
+    customers = CustomerFactory.create_batch(count, **fields)
+    for customer in customers:
+        customer.create()
+    address = AddressFactory(customer_id=customers[0].id, city=city)
+    address.address_id = None
+    address.create()
+    return customers
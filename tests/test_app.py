@@ -0,0 +1,73 @@
+"""
+Test cases for the application factory
+
+Each case runs in a fresh interpreter, as the other test modules have
+already imported and created the app.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Forks a worker from a preloaded app and runs the gunicorn post_fork hook in it
+PRELOAD_SCRIPT = """
+import importlib.util
+import os
+from types import SimpleNamespace
+from service import create_app
+from service.models import db
+
+spec = importlib.util.spec_from_file_location("gunicorn_conf", "gunicorn.conf.py")
+gunicorn_conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gunicorn_conf)
+
+app = create_app({"DB_CREATE_SCHEMA": True})
+assert app.test_client().get("/api/customers").status_code == 200
+with app.app_context():
+    pool = db.engine.pool
+assert pool.checkedin() == 1
+pid = os.fork()
+if pid == 0:
+    gunicorn_conf.post_fork(None, SimpleNamespace(app=SimpleNamespace(callable=app)))
+    with app.app_context():
+        fresh = db.engine.pool is not pool and db.engine.pool.checkedin() == 0
+    served = app.test_client().get("/api/customers").status_code == 200
+    os._exit(0 if fresh and served else 1)
+_, wait_status = os.waitpid(pid, 0)
+assert os.waitstatus_to_exitcode(wait_status) == 0
+"""
+
+
+def run(code, **env):
+    """Runs code in a fresh interpreter from the repository root"""
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=False,
+                          cwd=ROOT, env={**os.environ, **env})
+
+
+class TestCreateApp(TestCase):
+    """Test Cases for create_app()"""
+
+    def test_import(self):
+        """It should not load the models or SQLAlchemy when the package is imported"""
+        result = run("import sys, service; print('sqlalchemy' in sys.modules, 'service.models' in sys.modules)")
+        self.assertEqual(result.stdout.strip(), "False False", result.stderr)
+
+    def test_no_connection(self):
+        """It should not touch the database unless asked to create the schema"""
+        database = {"DATABASE_URI": "sqlite:////nonexistent/customers.db"}
+        result = run("from service import create_app; print(create_app({'MAX_PAGE_SIZE': 7}).config['MAX_PAGE_SIZE'])",
+                     **database)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "7")
+        result = run("from service import app", DB_CREATE_SCHEMA="true", **database)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("unable to open database file", result.stderr)
+
+    def test_preload(self):
+        """It should give a worker forked from a preloaded app its own connections"""
+        with tempfile.TemporaryDirectory() as directory:
+            result = run(PRELOAD_SCRIPT, DATABASE_URI=f"sqlite:///{directory}/customers.db")
+        self.assertEqual(result.returncode, 0, result.stderr)
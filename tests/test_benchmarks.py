@@ -0,0 +1,51 @@
+"""
+Test cases for the hot path benchmark
+"""
+import logging
+import os
+import tempfile
+from unittest import TestCase
+from benchmarks.hot_paths import compare, run
+from service import create_app
+from service.models import Address, Customer, db
+
+
+def report(*results):
+    """Returns a benchmark report of (rows, case, p50_ms) results"""
+    return {"meta": {}, "results": [{"rows": rows, "case": case, "p50_ms": p50} for rows, case, p50 in results]}
+
+
+class TestHotPaths(TestCase):
+    """Test Cases for the hot path benchmark"""
+
+    def test_compare(self):
+        """It should flag only the cases slower than the threshold"""
+        baseline = report((1000, "list_all", 2.0), (1000, "get_customer", 1.0), (1000, "serialize", 0.0))
+        current = report((1000, "list_all", 2.2), (1000, "get_customer", 1.5),
+                         (1000, "serialize", 1.0), (1000, "new_case", 9.0), (100000, "list_all", 9.0))
+        regressions = compare(baseline, current)
+        self.assertEqual([(item["rows"], item["case"]) for item in regressions], [(1000, "get_customer")])
+        self.assertAlmostEqual(regressions[0]["change"], 0.5)
+        self.assertEqual(compare(baseline, current, threshold=0.6), [])
+
+    def test_run(self):
+        """It should time every case at every size"""
+        # run() empties the tables, so it gets a database of its own
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{os.path.join(directory, 'benchmark.db')}",
+                              "DB_CREATE_SCHEMA": True})
+            app.logger.setLevel(logging.WARN)
+            with app.app_context():
+                try:
+                    results = run(app.test_client(), [12, 5], iterations=1, page_size=3)
+                    self.assertEqual(db.session.query(Customer).count(), 12)
+                    self.assertEqual(db.session.query(Address).count(), 12)
+                finally:
+                    db.session.remove()
+                    db.engine.dispose()
+        self.assertEqual({result["rows"] for result in results}, {5, 12})
+        cases = [result["case"] for result in results if result["rows"] == 5]
+        self.assertIn("list_by_pin_code", cases)
+        self.assertIn("address_crud", cases)
+        self.assertEqual(cases, [result["case"] for result in results if result["rows"] == 12])
+        self.assertTrue(all(result["min_ms"] <= result["p50_ms"] <= result["p99_ms"] for result in results))
@@ -4,15 +4,15 @@ CLI Command Extensions for Flask
 import os
 from unittest import TestCase
 from unittest.mock import patch, MagicMock
-from click.testing import CliRunner
-from service.common.cli_commands import db_create
+from service import app
+from service.common.cli_commands import db_create, db_indexes, db_seed, loadtest
 
 
 class TestFlaskCLI(TestCase):
     """Test Flask CLI Commands"""
 
     def setUp(self):
-        self.runner = CliRunner()
+        self.runner = app.test_cli_runner()
 
     @patch('service.common.cli_commands.db')
     def test_db_create(self, db_mock):
@@ -21,3 +21,46 @@ class TestFlaskCLI(TestCase):
         with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
             result = self.runner.invoke(db_create)
             self.assertEqual(result.exit_code, 0)
+
+    @patch('service.common.cli_commands.create_indexes')
+    def test_db_indexes(self, create_mock):
+        """It should call the db-indexes command"""
+        create_mock.return_value = ["ix_address_city"]
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(db_indexes)
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Created index ix_address_city", result.output)
+            create_mock.assert_called_once()
+
+    @patch('service.common.seed.seed')
+    def test_db_seed(self, seed_mock):
+        """It should call the db-seed command"""
+        seed_mock.return_value = (10, 20)
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(
+                db_seed, ["--customers", "10", "--addresses-per-customer", "2", "--seed", "7"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("Seeded 10 customers and 20 addresses", result.output)
+            self.assertEqual(seed_mock.call_args.args[:4], (10, 2, 7, 10000))
+
+    @patch('service.common.loadtest.LoadTest')
+    def test_loadtest(self, load_test_mock):
+        """It should call the loadtest command"""
+        row = {"endpoint": "GET /customers/{id}", "requests": 10, "errors": 0, "rps": 5.0,
+               "p50_ms": 1.0, "p90_ms": 2.0, "p99_ms": 3.0, "max_ms": 4.0}
+        load_test_mock.return_value.run.return_value = {"elapsed": 2.0, "endpoints": [row], "total": row}
+        with patch.dict(os.environ, {"FLASK_APP": "service:app"}, clear=True):
+            result = self.runner.invoke(loadtest, ["--workers", "2", "--operations", "10", "--mix", "get=3,list=1"])
+            self.assertEqual(result.exit_code, 0)
+            self.assertIn("GET /customers/{id}", result.output)
+            self.assertEqual(load_test_mock.call_args.args,
+                             ("http://localhost:8080", {"get": 3, "list": 1}, 2, 30.0, 10, 0))
+
+            result = self.runner.invoke(loadtest, ["--mix", "delete=1"])
+            self.assertEqual(result.exit_code, 2)
+            self.assertIn("unknown operation 'delete'", result.output)
+
+            load_test_mock.return_value.run.side_effect = ConnectionRefusedError("refused")
+            result = self.runner.invoke(loadtest, [])
+            self.assertEqual(result.exit_code, 1)
+            self.assertIn("Cannot load test http://localhost:8080", result.output)
@@ -0,0 +1,125 @@
+"""
+Test cases for the response compression
+"""
+import gzip
+import json
+import zlib
+from unittest import TestCase, skipIf
+from unittest.mock import patch
+from flask import Flask, Response, jsonify
+from service.common import compression
+from service.common.compression import Compression, compress_stream
+
+BIG = [{"id": number, "first_name": "Mary", "last_name": "Smith"} for number in range(100)]
+
+
+def create_test_app():
+    """Returns an app with a few responses to compress"""
+    app = Flask(__name__)
+    app.config.update(COMPRESS_MIN_SIZE=512)
+    Compression().init_app(app)
+    app.add_url_rule("/big", "big", lambda: jsonify(BIG))
+    app.add_url_rule("/small", "small", lambda: jsonify(id=1))
+    app.add_url_rule("/tagged", "tagged", lambda: (jsonify(BIG), 200, {"ETag": '"7"'}))
+    app.add_url_rule("/weak", "weak", lambda: (jsonify(BIG), 200, {"ETag": 'W/"7"'}))
+    app.add_url_rule("/empty", "empty", lambda: ("", 204))
+    app.add_url_rule("/binary", "binary", lambda: Response(b"\0" * 4096, mimetype="image/png"))
+    app.add_url_rule("/stream", "stream", lambda: Response(
+        (json.dumps(item) + "\n" for item in BIG), mimetype="application/x-ndjson"))
+    return app
+
+
+class TestCompression(TestCase):
+    """Test Cases for Compression"""
+
+    def setUp(self):
+        self.client = create_test_app().test_client()
+
+    def test_gzip(self):
+        """It should gzip large responses for clients that accept it"""
+        resp = self.client.get("/big", headers={"Accept-Encoding": "gzip, deflate"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(int(resp.headers["Content-Length"]), len(resp.data))
+        self.assertEqual(json.loads(gzip.decompress(resp.data)), BIG)
+
+    def test_etag(self):
+        """It should give every encoding of a response its own strong ETag"""
+        resp = self.client.get("/tagged", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["ETag"], '"7-gzip"')
+        self.assertEqual(self.client.get("/tagged").headers["ETag"], '"7"')
+        resp = self.client.get("/weak", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["ETag"], 'W/"7"')
+        self.assertEqual(compression.etag_variants("7"), ["7", "7-br", "7-gzip"])
+
+    def test_not_modified_etag(self):
+        """It should give a 304 the encoded ETag it revalidates"""
+        app = create_test_app()
+        app.add_url_rule("/unchanged", "unchanged", lambda: Response(status=304, headers={"ETag": '"7"'}))
+        client = app.test_client()
+        resp = client.get("/unchanged", headers={"Accept-Encoding": "gzip", "If-None-Match": '"7-gzip"'})
+        self.assertEqual(resp.headers["ETag"], '"7-gzip"')
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        resp = client.get("/unchanged", headers={"Accept-Encoding": "gzip", "If-None-Match": '"7"'})
+        self.assertEqual(resp.headers["ETag"], '"7"')
+
+    def test_identity(self):
+        """It should leave responses alone for clients without Accept-Encoding"""
+        resp = self.client.get("/big")
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(resp.get_json(), BIG)
+        resp = self.client.get("/big", headers={"Accept-Encoding": "gzip;q=0, identity"})
+        self.assertNotIn("Content-Encoding", resp.headers)
+
+    def test_skip(self):
+        """It should not compress small, empty and binary responses"""
+        for path in ("/small", "/empty", "/binary"):
+            resp = self.client.get(path, headers={"Accept-Encoding": "gzip"})
+            self.assertNotIn("Content-Encoding", resp.headers, path)
+
+    def test_stream(self):
+        """It should compress streamed responses chunk by chunk"""
+        resp = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertNotIn("Content-Length", resp.headers)
+        lines = gzip.decompress(resp.data).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines], BIG)
+
+    def test_stream_flushes_every_chunk(self):
+        """It should make every chunk decodable as soon as it is sent"""
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = compress_stream(iter([b"first\n", "second\n"]), "gzip", 6)
+        self.assertEqual(decompressor.decompress(next(chunks)), b"first\n")
+        self.assertEqual(decompressor.decompress(next(chunks)), b"second\n")
+        decompressor.decompress(b"".join(chunks))
+        self.assertTrue(decompressor.eof)
+
+    def test_brotli_preferred(self):
+        """It should prefer brotli when it is installed and accepted"""
+        with patch.object(compression, "brotli") as brotli:
+            brotli.compress.return_value = b"brotli"
+            resp = self.client.get("/big", headers={"Accept-Encoding": "gzip, br"})
+            self.assertEqual(resp.headers["Content-Encoding"], "br")
+            self.assertEqual(resp.data, b"brotli")
+            resp = self.client.get("/big", headers={"Accept-Encoding": "gzip, br;q=0.5"})
+            self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        with patch.object(compression, "brotli", None):
+            resp = self.client.get("/big", headers={"Accept-Encoding": "br"})
+            self.assertNotIn("Content-Encoding", resp.headers)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        """It should brotli large responses with the installed package"""
+        resp = self.client.get("/big", headers={"Accept-Encoding": "br"})
+        self.assertEqual(resp.headers["Content-Encoding"], "br")
+        self.assertEqual(json.loads(compression.brotli.decompress(resp.data)), BIG)
+
+    def test_disabled(self):
+        """It should not compress when turned off"""
+        app = Flask(__name__)
+        app.config.update(COMPRESS_RESPONSES=False)
+        Compression().init_app(app)
+        app.add_url_rule("/big", "big", lambda: jsonify(BIG))
+        resp = app.test_client().get("/big", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("Content-Encoding", resp.headers)
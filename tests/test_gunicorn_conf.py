@@ -0,0 +1,75 @@
+"""
+Test cases for the gunicorn configuration
+"""
+import importlib.util
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+spec = importlib.util.spec_from_file_location("gunicorn_conf", os.path.join(ROOT, "gunicorn.conf.py"))
+gunicorn_conf = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(gunicorn_conf)
+
+
+def write(root, path, text):
+    """Writes a cgroup file under root"""
+    os.makedirs(os.path.dirname(os.path.join(root, path)), exist_ok=True)
+    with open(os.path.join(root, path), "w", encoding="utf-8") as file:
+        file.write(text)
+
+
+class TestGunicornConf(TestCase):
+    """Test Cases for gunicorn.conf.py"""
+
+    def test_cgroup_v2_limits(self):
+        """It should read the CPU and memory limits of cgroup v2"""
+        with tempfile.TemporaryDirectory() as root:
+            write(root, "cpu.max", "20000 100000\n")
+            write(root, "memory.max", f"{64 * 2 ** 20}\n")
+            self.assertAlmostEqual(gunicorn_conf.cpu_limit(root), min(0.2, gunicorn_conf.cpu_limit("/nonexistent")))
+            self.assertEqual(gunicorn_conf.memory_limit_mb(root), 64)
+            write(root, "cpu.max", "max 100000\n")
+            write(root, "memory.max", "max\n")
+            self.assertEqual(gunicorn_conf.cpu_limit(root), gunicorn_conf.cpu_limit("/nonexistent"))
+            self.assertIsNone(gunicorn_conf.memory_limit_mb(root))
+
+    def test_cgroup_v1_limits(self):
+        """It should read the CPU and memory limits of cgroup v1"""
+        with tempfile.TemporaryDirectory() as root:
+            write(root, "cpu/cpu.cfs_quota_us", "50000\n")
+            write(root, "cpu/cpu.cfs_period_us", "100000\n")
+            write(root, "memory/memory.limit_in_bytes", f"{512 * 2 ** 20}\n")
+            self.assertAlmostEqual(gunicorn_conf.cpu_limit(root), min(0.5, gunicorn_conf.cpu_limit("/nonexistent")))
+            self.assertEqual(gunicorn_conf.memory_limit_mb(root), 512)
+            write(root, "cpu/cpu.cfs_quota_us", "-1\n")
+            write(root, "memory/memory.limit_in_bytes", "9223372036854771712\n")
+            self.assertEqual(gunicorn_conf.cpu_limit(root), gunicorn_conf.cpu_limit("/nonexistent"))
+            self.assertIsNone(gunicorn_conf.memory_limit_mb(root))
+        self.assertIsNone(gunicorn_conf.memory_limit_mb("/nonexistent"))
+
+    def test_concurrency(self):
+        """It should fit the workers into the limits and the threads into the pool"""
+        concurrency = gunicorn_conf.concurrency
+        self.assertEqual(concurrency(0.2, 64, {}), ("gthread", 1, 4))
+        self.assertEqual(concurrency(2, None, {}), ("gthread", 5, 4))
+        self.assertEqual(concurrency(2, 120, {}), ("gthread", 3, 4))
+        self.assertEqual(concurrency(2, 120, {"WEB_CONCURRENCY": "7", "GUNICORN_THREADS": "50"}), ("gthread", 7, 15))
+        self.assertEqual(concurrency(1, None, {"GUNICORN_THREADS": "50", "DB_POOL_SIZE": "20"}), ("gthread", 3, 30))
+        self.assertEqual(concurrency(1, None, {"GUNICORN_WORKER_CLASS": "gevent"}), ("gevent", 3, 1))
+
+    def test_post_fork(self):
+        """It should reset the pool counters of a worker forked from a preloaded app"""
+        server = SimpleNamespace(log=MagicMock())
+        with patch("service.models.dispose_engines") as dispose_mock, patch("service.models.pool_stats") as stats_mock:
+            gunicorn_conf.post_fork(server, SimpleNamespace(app=SimpleNamespace(callable=None)))
+            dispose_mock.assert_not_called()
+            app = object()
+            gunicorn_conf.post_fork(server, SimpleNamespace(app=SimpleNamespace(callable=app)))
+            dispose_mock.assert_called_once_with(app)
+            stats_mock.reset.assert_called_once()
+        with patch.object(gunicorn_conf, "worker_class", "gevent"):
+            gunicorn_conf.post_fork(server, SimpleNamespace(app=SimpleNamespace(callable=None)))
+        server.log.warning.assert_called_once()
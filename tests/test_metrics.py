@@ -0,0 +1,72 @@
+"""
+Test cases for the Prometheus metrics
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+from service import app
+from service.common import status
+from service.models import init_db
+
+# Serves requests from two forked workers, then scrapes /metrics in the parent
+MULTIPROCESS_SCRIPT = """
+import multiprocessing
+import os
+import sys
+os.environ["PROMETHEUS_MULTIPROC_DIR"] = sys.argv[1]
+os.environ["DB_CREATE_SCHEMA"] = "true"
+from service import app
+
+def work():
+    app.test_client().get("/health")
+    app.test_client().get("/api/customers/0")
+
+if __name__ == "__main__":
+    workers = [multiprocessing.get_context("fork").Process(target=work) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    sys.stdout.write(app.test_client().get("/metrics").get_data(as_text=True))
+"""
+
+
+def setUpModule():  # pylint: disable=invalid-name
+    """Creates the tables the requests read"""
+    init_db(app)
+
+
+class TestMetrics(TestCase):
+    """Test Cases for /metrics"""
+
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_metrics(self):
+        """It should count and time the requests of every resource"""
+        self.client.get("/health")
+        self.client.get("/api/customers/0")
+        resp = self.client.get("/metrics")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.content_type.startswith("text/plain"))
+        text = resp.get_data(as_text=True)
+        self.assertIn('http_requests_total{endpoint="health",method="GET",status="200"}', text)
+        self.assertIn('http_requests_total{endpoint="customer_resource",method="GET",status="404"}', text)
+        self.assertIn('http_request_duration_seconds_bucket{endpoint="customer_resource",le="0.005",method="GET"}',
+                      text)
+        self.assertIn("http_requests_in_progress 1.0", text)
+        self.assertIn('db_pool_events_total{event="checkouts"}', text)
+        self.assertIn('customer_cache_events_total{event="misses"}', text)
+
+    def test_multiprocess(self):
+        """It should add up the metrics of every worker process"""
+        with tempfile.TemporaryDirectory() as directory:
+            result = subprocess.run([sys.executable, "-c", MULTIPROCESS_SCRIPT, directory],
+                                    capture_output=True, text=True, check=True, env=dict(os.environ),
+                                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.assertIn('http_requests_total{endpoint="health",method="GET",status="200"} 2.0', result.stdout)
+        self.assertIn('http_requests_total{endpoint="customer_resource",method="GET",status="404"} 2.0',
+                      result.stdout)
+        self.assertIn('customer_cache_events_total{event="misses"} 2.0', result.stdout)
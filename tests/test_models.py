@@ -2,14 +2,22 @@
 Test cases for Customer Model
 
 """
+# pylint: disable=too-many-lines
+import base64
 import hashlib
+import itertools
+import json
 import os
 import logging
 import unittest
+from unittest.mock import patch
+from datetime import timezone
+from sqlalchemy import create_engine, event, inspect, text
 from werkzeug.exceptions import NotFound
-from service.models import Customer, Address, DataValidationError, db
+from service.models import (Customer, Address, CustomerTombstone, DataValidationError, db, create_indexes, customer_cache,
+                            customers_changed, rollup_cache)
 from service import app
-from tests.factories import CustomerFactory, AddressFactory
+from tests.factories import CustomerFactory, AddressFactory, create_customers_in_city
 
 
 DATABASE_URI = os.getenv(
@@ -454,3 +462,600 @@ class TestAddress(unittest.TestCase):
         # It should Find Addresses by Address ID
         found_address_id = Address.find(address.address_id)
         self.assertEqual(found_address_id.customer_id, address.customer_id)
+
+    def test_find_by_address_distinct(self):
+        """It should return each Customer once with its Addresses loaded"""
+        customer = CustomerFactory()
+        for street in ["1 Main St", "2 Main St"]:
+            customer.addresses.append(
+                Address(street=street, city="Springfield", state="IL",
+                        country="United States", pin_code="62701"))
+        customer.create()
+        other = CustomerFactory()
+        other.addresses.append(
+            Address(street="3 Elm St", city="Shelbyville", state="IL",
+                    country="United States", pin_code="62565"))
+        other.create()
+        customer_id = customer.id
+        db.session.expunge_all()
+
+        found = Address.find_by_city("Springfield").all()
+        self.assertEqual(len(found), 1)
+        self.assertEqual(found[0].id, customer_id)
+        # addresses were loaded eagerly along with the customer
+        self.assertIn("addresses", found[0].__dict__)
+        self.assertEqual(len(found[0].addresses), 2)
+
+
+class TestPagination(unittest.TestCase):
+    """ Test Cases for keyset pagination of Customers """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def _page_all(self, sort, limit):
+        """ Collects the ids of every page for the given sort """
+        ids = []
+        customers, cursor = Customer.paginate(Customer.query, sort, limit)
+        ids.extend(customer.id for customer in customers)
+        while cursor:
+            customers, cursor = Customer.paginate(Customer.query, sort, limit, cursor)
+            self.assertLessEqual(len(customers), limit)
+            ids.extend(customer.id for customer in customers)
+        return ids
+
+    def test_paginate_sorts(self):
+        """It should visit every Customer once for each sort order"""
+        customers = CustomerFactory.create_batch(7)
+        for i, customer in enumerate(customers):
+            customer.active = i % 2 == 0
+            customer.create()
+        rows = [(c.id, c.last_name, c.active) for c in customers]
+        cases = {
+            None: sorted(rows),
+            "-id": sorted(rows, reverse=True),
+            "last_name": sorted(rows, key=lambda r: (r[1], r[0])),
+            "active,-id": sorted(rows, key=lambda r: (r[2], -r[0])),
+            "-active,last_name": sorted(rows, key=lambda r: (not r[2], r[1], r[0])),
+        }
+        for sort, expected in cases.items():
+            with self.subTest(sort=sort):
+                self.assertEqual(self._page_all(sort, 3), [r[0] for r in expected])
+
+    def test_paginate_unlimited(self):
+        """It should return every Customer without a next cursor when no limit is given"""
+        for customer in CustomerFactory.create_batch(3):
+            customer.create()
+        customers, cursor = Customer.paginate(Customer.query, "-id")
+        self.assertEqual(len(customers), 3)
+        self.assertIsNone(cursor)
+
+    def test_paginate_bad_input(self):
+        """It should reject unknown sort keys and foreign cursors"""
+        self.assertRaises(DataValidationError, Customer.paginate, Customer.query, "password", 2)
+        self.assertRaises(DataValidationError, Customer.paginate, Customer.query, None, 2, "%%%")
+        for customer in CustomerFactory.create_batch(3):
+            customer.create()
+        _, cursor = Customer.paginate(Customer.query, "last_name", 1)
+        self.assertRaises(DataValidationError, Customer.paginate, Customer.query, "-id", 1, cursor)
+        # well-formed cursors holding values of the wrong types
+        for sort, values in ((None, ["1"]), (None, [True]), ("last_name", [5, 1]), ("active", ["yes", 1])):
+            payload = json.dumps({"s": sort or "", "k": values}).encode("UTF-8")
+            cursor = base64.urlsafe_b64encode(payload).decode("ascii")
+            self.assertRaises(DataValidationError, Customer.paginate, Customer.query, sort, 1, cursor)
+
+
+class TestFilters(unittest.TestCase):
+    """ Test Cases for combining Customer and Address filters """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+        rollup_cache.clear()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    @staticmethod
+    def _make_dataset():
+        """ Creates Customers whose fields overlap so every filter narrows differently """
+        rows = []
+        for i in range(8):
+            customer = Customer(
+                first_name=["Ann", "Bob"][i % 2],
+                last_name=["Lee", "Kim"][(i // 2) % 2],
+                email=["a@x.com", "b@x.com", "c@x.com"][i % 3],
+                password="secret",
+                active=i < 5,
+            )
+            for j in range(2):
+                k = i + j
+                customer.addresses.append(Address(
+                    street=["1 Main St", "2 Oak Ave"][k % 2],
+                    city=["Springfield", "Shelbyville"][(k // 2) % 2],
+                    state=["IL", "OR"][(k // 3) % 2],
+                    country=["US", "CA"][(k // 4) % 2],
+                    pin_code=["62701", "97001"][k % 3 % 2],
+                ))
+            customer.create()
+            rows.append((
+                customer.id,
+                {name: getattr(customer, name) for name in Customer.CUSTOMER_FILTERS},
+                [{name: getattr(address, name) for name in Customer.ADDRESS_FILTERS}
+                 for address in customer.addresses],
+            ))
+        return rows
+
+    def test_filter_matrix(self):
+        """It should AND every combination of Customer and Address filters"""
+        rows = self._make_dataset()
+        names = Customer.CUSTOMER_FILTERS + Customer.ADDRESS_FILTERS
+        # probe with the values of two different customers and addresses
+        probes = [dict(rows[0][1], **rows[0][2][0]), dict(rows[5][1], **rows[5][2][1])]
+        for probe in probes:
+            for size in range(1, len(names) + 1):
+                for combo in itertools.combinations(names, size):
+                    filters = {name: probe[name] for name in combo}
+                    expected = sorted(
+                        customer_id for customer_id, fields, addresses in rows
+                        if all(fields[n] == v for n, v in filters.items() if n in fields)
+                        and any(all(address[n] == v for n, v in filters.items() if n in address)
+                                for address in addresses)
+                    )
+                    with self.subTest(filters=filters):
+                        found = Customer.find_by_filters(**filters).all()
+                        self.assertEqual(sorted(customer.id for customer in found), expected)
+                        self.assertEqual(Customer.count(**filters), len(expected))
+
+    def test_filter_none(self):
+        """It should return every Customer when no filter is given"""
+        rows = self._make_dataset()
+        self.assertEqual(Customer.find_by_filters().count(), len(rows))
+        self.assertEqual(Customer.find_by_filters(city=None).count(), len(rows))
+
+    def test_filter_unknown(self):
+        """It should not filter on an unknown field"""
+        self.assertRaises(DataValidationError, Customer.find_by_filters, password="secret")
+
+    def test_count_by(self):
+        """It should count the matching Customers for every value of a column"""
+        rows = self._make_dataset()
+        self.assertEqual(Customer.count(), len(rows))
+        groups = dict(Customer.count_by("first_name"))
+        self.assertEqual(groups, {"Ann": 4, "Bob": 4})
+        self.assertEqual(Customer.count_by("active", last_name="Lee"), [(True, 3), (False, 1)])
+        # every Customer counts once per distinct city among its Addresses
+        expected = {}
+        for _, fields, addresses in rows:
+            if fields["active"]:
+                for city in {address["city"] for address in addresses}:
+                    expected[city] = expected.get(city, 0) + 1
+        self.assertEqual(dict(Customer.count_by("city", active=True)), expected)
+        # only the Addresses matching the address filters are grouped
+        state = rows[0][2][0]["state"]
+        expected = {}
+        for _, fields, addresses in rows:
+            for city in {address["city"] for address in addresses if address["state"] == state}:
+                expected[city] = expected.get(city, 0) + 1
+        self.assertEqual(dict(Customer.count_by("city", state=state)), expected)
+        stats = Customer.rollup(("city",), state=state)
+        self.assertEqual({group["city"]: group["customers"] for group in stats["groups"]}, expected)
+        self.assertEqual(len(Customer.count_by("city", limit=1)), 1)
+        self.assertRaises(DataValidationError, Customer.count_by, "email")
+        self.assertRaises(DataValidationError, Customer.count, password="secret")
+
+    def test_rollup(self):
+        """It should aggregate the Customers by country, state, city and active"""
+        rows = self._make_dataset()
+        Customer(first_name="No", last_name="Address", email="n@x.com", password="secret", active=False).create()
+        stats = Customer.rollup()
+        self.assertEqual((stats["customers"], stats["active_customers"]), (9, 5))
+        self.assertAlmostEqual(stats["active_ratio"], 5 / 9)
+        self.assertEqual(stats["addresses_per_customer"],
+                         [{"addresses": 0, "customers": 1}, {"addresses": 2, "customers": 8}])
+        self.assertNotIn("groups", stats)
+
+        stats = Customer.rollup(("state", "active"))
+        expected = {}
+        for _, fields, addresses in rows:
+            for state in {address["state"] for address in addresses}:
+                expected[(state, fields["active"])] = expected.get((state, fields["active"]), 0) + 1
+        self.assertEqual({(group["state"], group["active"]): group["customers"] for group in stats["groups"]}, expected)
+        for group in stats["groups"]:
+            self.assertEqual(group["active_customers"], group["customers"] if group["active"] else 0)
+        counts = [group["customers"] for group in stats["groups"]]
+        self.assertEqual(counts, sorted(counts, reverse=True))
+
+        stats = Customer.rollup(("active",), last_name="Lee")
+        self.assertEqual(stats["groups"], [{"active": True, "customers": 3, "active_customers": 3, "active_ratio": 1.0},
+                                           {"active": False, "customers": 1, "active_customers": 0, "active_ratio": 0.0}])
+        self.assertEqual(len(Customer.rollup(("country", "state", "city"), limit=2)["groups"]), 2)
+        self.assertRaises(DataValidationError, Customer.rollup, ("email",))
+
+    def test_rollup_cached(self):
+        """It should serve rollups from the cache until the next write"""
+        self._make_dataset()
+        first = Customer.rollup(("city",))
+        self.assertIs(Customer.rollup(("city",)), first)
+        self.assertIsNot(Customer.rollup(("state",)), first)
+        Customer.bulk_delete([Customer.find_by_filters().first().id])
+        second = Customer.rollup(("city",))
+        self.assertIsNot(second, first)
+        self.assertEqual(second["customers"], first["customers"] - 1)
+
+
+class TestChanges(unittest.TestCase):
+    """ Test Cases for the timestamps and the changes feed """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.query(CustomerTombstone).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def test_timestamps(self):
+        """It should stamp Customers in UTC when created and on every change"""
+        customer = CustomerFactory()
+        customer.create()
+        self.assertEqual(customer.created_at.tzinfo, timezone.utc)
+        self.assertEqual(customer.created_at, customer.updated_at)
+        created, change = customer.created_at, customer.change_seq
+        customer.first_name = "Renamed"
+        customer.update()
+        db.session.expire_all()
+        customer = Customer.find(customer.id)
+        self.assertEqual(customer.created_at, created)
+        self.assertGreater(customer.updated_at, created)
+        self.assertGreater(customer.change_seq, change)
+        self.assertEqual(customer.serialize()["created_at"], created.isoformat())
+
+    def test_changes(self):
+        """It should list the changes after a cursor in commit order"""
+        customers = CustomerFactory.create_batch(3)
+        for customer in customers:
+            customer.create()
+        first, second, third = [customer.id for customer in customers]
+        customers[0].first_name = "Renamed"
+        customers[0].update()
+        Customer.bulk_delete([second])
+
+        entries, cursor, more = Customer.changes(limit=2)
+        self.assertEqual([entry.id for entry in entries], [third, first])
+        self.assertTrue(more)
+        entries, cursor, more = Customer.changes(cursor, limit=2)
+        self.assertEqual(len(entries), 1)
+        self.assertIsInstance(entries[0], CustomerTombstone)
+        self.assertEqual(entries[0].customer_id, second)
+        self.assertFalse(more)
+        # nothing new keeps the cursor, the next write shows up after it
+        self.assertEqual(Customer.changes(cursor), ([], cursor, False))
+        address = AddressFactory(customer_id=third)
+        address.address_id = None
+        address.create()
+        entries, _, _ = Customer.changes(cursor)
+        self.assertEqual([entry.id for entry in entries], [third])
+        self.assertEqual(len(entries[0].addresses), 1)
+
+    def test_changes_bulk(self):
+        """It should move bulk writes to the end of the feed"""
+        customers = CustomerFactory.create_batch(3)
+        Customer.bulk_create(customers)
+        entries, cursor, _ = Customer.changes()
+        self.assertEqual(len({entry.change_seq for entry in entries}), 1)
+        Customer.bulk_set_active(False, ids=[customers[1].id])
+        entries, _, _ = Customer.changes(cursor)
+        self.assertEqual([entry.id for entry in entries], [customers[1].id])
+
+    def test_counter_taken_last(self):
+        """It should lock the change counter after the customer rows in every write"""
+        customer = CustomerFactory()
+        customer.create()
+        statements = []
+
+        def record(conn, cursor, statement, *args):  # pylint: disable=unused-argument
+            statements.append(statement.split()[:4])
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            for write in (lambda: AddressFactory(customer_id=customer.id, address_id=None).create(),
+                          lambda: Customer.bulk_set_active(False, ids=[customer.id]),
+                          lambda: Customer.bulk_create(CustomerFactory.create_batch(2), atomic=False)):
+                statements.clear()
+                write()
+                taken = [i for i, words in enumerate(statements) if "change_sequence" in words]
+                self.assertEqual(len(taken), 1)
+                # only the stamp of the changed rows may follow, reads take no locks
+                for words in statements[taken[0] + 1:]:
+                    if words[0] != "SELECT":
+                        self.assertEqual(words[:3], ["UPDATE", "customer", "SET"])
+                        self.assertTrue(words[3].startswith("change_seq="))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+    def test_changes_invalid_cursor(self):
+        """It should reject cursors that are not from the feed"""
+        self.assertRaises(DataValidationError, Customer.changes, "bogus")
+        for customer in CustomerFactory.create_batch(2):
+            customer.create()
+        _, cursor = Customer.paginate(Customer.query, limit=1)
+        self.assertRaises(DataValidationError, Customer.changes, cursor)
+
+
+class TestIndexes(unittest.TestCase):
+    """ Test Cases for the lookup indexes """
+
+    @classmethod
+    def setUpClass(cls):
+        """ Builds the schema in a scratch SQLite database to read query plans from """
+        cls.engine = create_engine("sqlite://")
+        db.metadata.create_all(cls.engine)
+
+    @classmethod
+    def tearDownClass(cls):
+        """ Releases the scratch database """
+        cls.engine.dispose()
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def _plan(self, query):
+        """ Returns the SQLite query plan of an ORM query as one string """
+        sql = str(query.statement.compile(dialect=self.engine.dialect, compile_kwargs={"literal_binds": True}))
+        with self.engine.connect() as conn:
+            rows = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).all()
+        return "\n".join(row[-1] for row in rows)
+
+    def test_lookups_use_indexes(self):
+        """It should use an index for every lookup column"""
+        cases = {
+            "ix_customer_first_name_id": Customer.find_by_first_name("Ann"),
+            "ix_customer_last_name_id": Customer.find_by_last_name("Lee"),
+            "ix_customer_email_lower": Customer.find_by_email("Ann@Example.com"),
+            "ix_customer_active_id": Customer.find_by_active(False),
+            "ix_address_street": Address.find_by_street("1 Main St"),
+            "ix_address_city": Address.find_by_city("Springfield"),
+            "ix_address_state": Address.find_by_state("IL"),
+            "ix_address_country_state_city_customer_id": Address.find_by_country("US"),
+            "ix_address_pin_code": Address.find_by_pin_code("62701"),
+            "ix_address_customer_id": Address.query.filter(Address.customer_id == 1),
+        }
+        for index, query in cases.items():
+            with self.subTest(index=index):
+                self.assertIn(f"INDEX {index}", self._plan(query))
+
+    def test_find_by_email_ignores_case(self):
+        """It should Find a Customer by Email in any case"""
+        customer = CustomerFactory(email="Ann.Lee@Example.com")
+        customer.create()
+        found = Customer.find_by_email("ann.lee@example.COM").all()
+        self.assertEqual([c.id for c in found], [customer.id])
+
+    def test_create_missing_indexes(self):
+        """It should create only the indexes that are missing"""
+        self.assertEqual(create_indexes(), [])
+        with db.engine.connect() as conn:
+            conn.execute(text("DROP INDEX ix_address_city"))
+            conn.commit()
+        self.assertEqual(create_indexes(), ["ix_address_city"])
+        self.assertEqual(create_indexes(), [])
+
+
+class TestVersion(unittest.TestCase):
+    """ Test Cases for the Customer row version """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def test_version_bumps(self):
+        """It should bump the version on every Customer and Address write"""
+        customer = CustomerFactory()
+        customer.create()
+        self.assertEqual(customer.version, 1)
+        self.assertEqual(Customer.find_version(customer.id), 1)
+
+        customer.first_name = "Changed"
+        customer.update()
+        self.assertEqual(customer.version, 2)
+
+        address = AddressFactory(customer_id=customer.id)
+        address.address_id = None
+        address.create()
+        self.assertEqual(customer.version, 3)
+        address.city = "Elsewhere"
+        address.update()
+        self.assertEqual(customer.version, 4)
+        address.delete()
+        self.assertEqual(customer.version, 5)
+        self.assertEqual(Customer.find_version(customer.id), 5)
+
+    def test_find_version_not_found(self):
+        """It should not find the version of a missing Customer"""
+        self.assertIsNone(Customer.find_version(0))
+
+
+######################################################################
+#  B U L K   T E S T   C A S E S
+######################################################################
+class TestBulk(unittest.TestCase):
+    """ Test Cases for set-based changes of many Customers """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+        customer_cache.clear()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def test_bulk_set_active(self):
+        """It should change only the matching Customers whose state differs"""
+        customers = CustomerFactory.create_batch(4, active=True)
+        for customer in customers:
+            customer.create()
+        ids = [customer.id for customer in customers]
+        Customer.find_serialized(ids[0])
+        self.assertEqual(Customer.bulk_set_active(False, ids[:2]), 2)
+        self.assertEqual(Customer.bulk_set_active(False, ids[:3]), 1)
+        self.assertEqual(Customer.bulk_set_active(False, ids[:3]), 0)
+        db.session.expire_all()
+        self.assertEqual([Customer.find(i).active for i in ids], [False, False, False, True])
+        self.assertEqual(Customer.find(ids[0]).version, 2)
+        self.assertFalse(Customer.find_serialized(ids[0])["active"])
+
+    def test_bulk_set_active_by_filter(self):
+        """It should change the Customers matching Customer and Address filters"""
+        create_customers_in_city(3, "Springfield", active=True)
+        self.assertEqual(Customer.bulk_set_active(False, city="Springfield"), 1)
+        self.assertEqual(Customer.bulk_set_active(False, active=True), 2)
+        self.assertEqual(Customer.find_by_active(False).count(), 3)
+
+    def test_bulk_refuses_everything(self):
+        """It should refuse a bulk change with neither ids nor filters"""
+        self.assertRaises(DataValidationError, Customer.bulk_set_active, True)
+        self.assertRaises(DataValidationError, Customer.bulk_delete)
+        self.assertRaises(DataValidationError, Customer.bulk_delete, password="x")
+
+    def test_bulk_delete(self):
+        """It should delete the matching Customers and their Addresses"""
+        customers = CustomerFactory.create_batch(3)
+        for customer in customers:
+            customer.create()
+        for customer in customers[:2]:
+            address = AddressFactory(customer_id=customer.id)
+            address.address_id = None
+            address.create()
+        ids = [customers[0].id, customers[1].id]
+        Customer.find_serialized(ids[0])
+        self.assertEqual(Customer.bulk_delete(ids), (2, 2))
+        self.assertEqual(Customer.bulk_delete(ids), (0, 0))
+        db.session.expire_all()
+        self.assertEqual(len(Customer.all()), 1)
+        self.assertEqual(db.session.query(Address).count(), 0)
+        self.assertIsNone(Customer.find_serialized(ids[0]))
+
+    def test_bulk_delete_binds_no_ids(self):
+        """It should delete any number of matching Customers without sending their ids"""
+        Customer.bulk_create(CustomerFactory.create_batch(40, active=False))
+        parameters = []
+
+        def record(conn, cursor, statement, params, *args):  # pylint: disable=unused-argument
+            parameters.append(len(params))
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            self.assertEqual(Customer.bulk_delete(active=False), (40, 0))
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        self.assertLess(max(parameters), 5)
+        # the staged tombstones got the change of the delete
+        tombstones = db.session.query(CustomerTombstone.change_seq).all()
+        self.assertNotIn(0, {change_seq for change_seq, in tombstones})
+        last = max(change_seq for change_seq, in tombstones)
+        self.assertEqual(sum(1 for change_seq, in tombstones if change_seq == last), 40)
+
+    def test_cache_skips_reads_racing_a_write(self):
+        """It should not cache a Customer read before a concurrent write committed"""
+        customer = CustomerFactory()
+        customer.create()
+        find = Customer.find
+
+        def find_then_write(customer_id):
+            found = find(customer_id)
+            # another request commits a change before this read is cached
+            customers_changed(customer_id)
+            return found
+
+        with patch.object(Customer, "find", side_effect=find_then_write):
+            self.assertEqual(Customer.find_serialized(customer.id)["id"], customer.id)
+        self.assertIsNone(customer_cache.get(customer.id))
+        Customer.find_serialized(customer.id)
+        self.assertIsNotNone(customer_cache.get(customer.id))
+
+
+######################################################################
+#  F I E L D S   T E S T   C A S E S
+######################################################################
+class TestFields(unittest.TestCase):
+    """ Test Cases for sparse fieldsets """
+
+    def setUp(self):
+        """ This runs before each test """
+        db.session.query(Address).delete()
+        db.session.query(Customer).delete()
+        db.session.commit()
+
+    def tearDown(self):
+        """ This runs after each test """
+        db.session.remove()
+
+    def test_parse_fields(self):
+        """It should parse fields into serialization order and reject unknown ones"""
+        self.assertIsNone(Customer.parse_fields(None))
+        self.assertIsNone(Customer.parse_fields(" , "))
+        self.assertEqual(Customer.parse_fields("email, id,email"), ("id", "email"))
+        self.assertRaises(DataValidationError, Customer.parse_fields, "id,secret")
+
+    def test_project_columns(self):
+        """It should load only the requested columns and skip the addresses"""
+        customer = CustomerFactory()
+        customer.create()
+        address = AddressFactory(customer_id=customer.id, city="Springfield")
+        address.address_id = None
+        address.create()
+        expected = {"id": customer.id, "email": customer.email, "active": customer.active}
+        db.session.expunge_all()
+
+        for filters in ({}, {"city": "Springfield"}):
+            found = Customer.find_by_filters(("id", "email", "active"), **filters).all()
+            self.assertEqual(len(found), 1)
+            self.assertEqual(inspect(found[0]).unloaded,
+                             {"first_name", "last_name", "password", "version", "created_at", "updated_at",
+                              "change_seq", "addresses"})
+            self.assertEqual(found[0].serialize(("id", "email", "active")), expected)
+            db.session.expunge_all()
+
+        found = Customer.find_by_filters(("email", "addresses")).all()
+        self.assertNotIn("addresses", inspect(found[0]).unloaded)
+        self.assertEqual(len(found[0].serialize(("email", "addresses"))["addresses"]), 1)
+
+    def test_project_sort_keys(self):
+        """It should page a projection sorted on a column left out of it"""
+        for customer in CustomerFactory.create_batch(3):
+            customer.create()
+        query = Customer.find_by_filters(("id",))
+        page, cursor = Customer.paginate(query, "last_name", 2)
+        self.assertEqual(len(page), 2)
+        self.assertIsNotNone(cursor)
+        self.assertNotIn("last_name", inspect(page[-1]).unloaded)
@@ -0,0 +1,61 @@
+"""
+Test cases for the connection pool telemetry
+"""
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from service.common.pool_stats import PoolStats
+
+
+class TestPoolStats(TestCase):
+    """Test Cases for PoolStats"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        path = os.path.join(self.directory.name, "pool.db")
+        self.engine = create_engine(f"sqlite:///{path}", pool_size=1, max_overflow=0, pool_timeout=0.01)
+        self.stats = PoolStats()
+        self.stats.attach(self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_checkouts(self):
+        """It should count checkouts, connects and the connections in use"""
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            stats = self.stats.stats()
+            self.assertEqual(stats["in_use"], 1)
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        stats = self.stats.stats()
+        self.assertEqual(stats["pool"], "QueuePool")
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["connects"], 1)
+        self.assertEqual(stats["size"], 1)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["overflow"], 0)
+        self.assertGreaterEqual(stats["checkout_ms_max"], stats["checkout_ms_avg"])
+
+    def test_timeouts(self):
+        """It should count checkouts that timed out waiting for a connection"""
+        with self.engine.connect():
+            self.assertRaises(PoolTimeoutError, self.engine.connect)
+        self.assertEqual(self.stats.stats()["timeouts"], 1)
+
+    def test_dispose(self):
+        """It should keep counting after the pool is replaced"""
+        self.stats.attach(self.engine)
+        with self.engine.connect():
+            pass
+        self.engine.dispose()
+        with self.engine.connect():
+            pass
+        stats = self.stats.stats()
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["connects"], 2)
+        self.stats.reset()
+        self.assertEqual(self.stats.stats()["checkouts"], 0)
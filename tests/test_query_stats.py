@@ -0,0 +1,103 @@
+"""
+Test cases for the per-request query counting
+"""
+import os
+import re
+from unittest import TestCase
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from service import app
+from service.models import db
+from service.common.query_stats import QueryBudgetExceeded, query_budget, query_stats
+
+README = os.path.join(os.path.dirname(__file__), "..", "README.md")
+
+
+def run_statements(count):
+    """Issues count statements"""
+    with app.app_context(), db.engine.connect() as conn:
+        for _ in range(count):
+            conn.execute(text("SELECT 1"))
+    return "done"
+
+
+class TestQueryStats(TestCase):
+    """Test Cases for QueryStats"""
+
+    def setUp(self):
+        self.settings = (query_stats.slow_query_ms, query_stats.enforce_budgets)
+
+    def tearDown(self):
+        query_stats.slow_query_ms, query_stats.enforce_budgets = self.settings
+        query_stats.stop()
+
+    def test_server_timing(self):
+        """It should count the statements of a request and report them"""
+        with app.test_request_context("/"):
+            query_stats.start()
+            run_statements(2)
+            self.assertEqual(query_stats.current().count, 2)
+            response = query_stats.add_server_timing(app.response_class())
+        timing = response.headers.getlist("Server-Timing")
+        self.assertTrue(timing[0].startswith('db;desc="2 queries";dur='))
+        self.assertTrue(timing[1].startswith("total;dur="))
+        query_stats.stop()
+        run_statements(1)
+        self.assertIsNone(query_stats.current())
+
+    def test_failed_statement(self):
+        """It should keep timing statements after one failed"""
+        with app.test_request_context("/"):
+            query_stats.start()
+            with db.engine.connect() as conn:
+                self.assertRaises(OperationalError, conn.execute, text("SELECT * FROM missing"))
+                conn.execute(text("SELECT 1"))
+                self.assertEqual(conn.info["query_started"], [])
+            self.assertEqual(query_stats.current().count, 1)
+
+    def test_budget(self):
+        """It should log, or raise when enforcing, a route over its budget"""
+        route = query_budget(1)(run_statements)
+        with app.test_request_context("/api/customers"):
+            query_stats.start()
+            query_stats.enforce_budgets = False
+            with self.assertLogs("flask.app", "WARNING") as logs:
+                self.assertEqual(route(2), "done")
+            self.assertIn("GET /api/customers issued 2 queries, its budget is 1", logs.output[0])
+            query_stats.start()
+            query_stats.enforce_budgets = True
+            self.assertEqual(route(1), "done")
+            self.assertRaises(QueryBudgetExceeded, route, 1)
+        route = query_budget(1, count=1)(run_statements)
+        with app.test_request_context("/api/customers?count=true"):
+            query_stats.start()
+            self.assertEqual(route(2), "done")
+            self.assertRaises(QueryBudgetExceeded, route, 1)
+        with app.test_request_context("/api/customers?count=false"):
+            query_stats.start()
+            self.assertRaises(QueryBudgetExceeded, route, 2)
+
+    def test_readme_budgets(self):
+        """It should document the query budget of every route as declared"""
+        with open(README, encoding="utf-8") as file:
+            rows = re.findall(r"^\| ([A-Z]+) `(/customers[^`]*)` \| ([^|]+) \|$", file.read(), re.MULTILINE)
+        documented = {(method, path): budget.strip() for method, path, budget in rows}
+        declared = {}
+        for rule in app.url_map.iter_rules():
+            view_class = getattr(app.view_functions[rule.endpoint], "view_class", None)
+            path = re.sub(r"<([^>]+)>", r"{\1}", rule.rule.removeprefix("/api"))
+            for method in rule.methods:
+                budget = getattr(getattr(view_class, method.lower(), None), "query_budget", None)
+                if budget is not None:
+                    limit, extra = budget
+                    declared[(method, path)] = f"{limit}" + "".join(
+                        f", {limit + more} with `{name}=true`" for name, more in extra.items())
+        self.assertIn(("GET", "/customers"), declared)
+        self.assertEqual(documented, declared)
+
+    def test_slow_query_log(self):
+        """It should log the statements slower than the threshold"""
+        query_stats.slow_query_ms = 1e-6
+        with self.assertLogs("flask.app", "WARNING") as logs:
+            run_statements(1)
+        self.assertIn("Slow query", logs.output[0])
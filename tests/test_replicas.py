@@ -0,0 +1,68 @@
+"""
+Test cases for the read replica router
+"""
+import os
+import tempfile
+from unittest import TestCase
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from service.common.replicas import ReplicaRouter
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    """A clock that only moves when told to"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestReplicaRouter(TestCase):
+    """Test Cases for ReplicaRouter"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.uris = [f"sqlite:///{os.path.join(self.directory.name, name)}" for name in ("a.db", "b.db")]
+        self.clock = FakeClock()
+        self.router = ReplicaRouter(clock=self.clock)
+        self.router.configure(self.uris, eject_seconds=10)
+
+    def tearDown(self):
+        self.router.dispose()
+        self.directory.cleanup()
+
+    def test_round_robin(self):
+        """It should hand out the replicas in turn"""
+        first, second = self.router.engines
+        self.assertEqual([self.router.choose() for _ in range(4)], [first, second, first, second])
+        self.assertEqual([replica["reads"] for replica in self.router.stats()], [2, 2])
+
+    def test_reading(self):
+        """It should expose the replica of the current block only inside it"""
+        self.assertIsNone(ReplicaRouter.current())
+        with self.router.reading():
+            self.assertIs(ReplicaRouter.current(), self.router.engines[0])
+            with self.router.using(None):
+                self.assertIsNone(ReplicaRouter.current())
+        self.assertIsNone(ReplicaRouter.current())
+
+    def test_ejection(self):
+        """It should skip a failing replica until its ejection expires"""
+        first, second = self.router.engines
+        with first.connect() as conn:
+            self.assertRaises(OperationalError, conn.execute, text("SELECT * FROM missing"))
+        self.assertEqual([self.router.choose() for _ in range(3)], [second, second, second])
+        self.assertEqual([replica["healthy"] for replica in self.router.stats()], [False, True])
+        self.assertEqual(self.router.stats()[0]["errors"], 1)
+        self.router.eject(second)
+        self.assertIsNone(self.router.choose())
+        self.clock.now = 10
+        self.assertIsNotNone(self.router.choose())
+
+    def test_no_replicas(self):
+        """It should read from the primary when there are no replicas"""
+        self.router.configure([])
+        self.assertIsNone(self.router.choose())
+        self.assertEqual(self.router.stats(), [])
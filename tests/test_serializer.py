@@ -0,0 +1,65 @@
+"""
+Test cases for the compiled serializer
+"""
+import json
+from datetime import datetime, timezone
+from unittest import TestCase
+from unittest.mock import patch
+from flask_restx import Model, fields, marshal
+from service.common import serializer
+from service.common.serializer import compile_serializer, dumps
+from service.models import Address, Customer
+from service.routes import customer_model, serialize_customer
+
+ITEM = Model("Item", {"name": fields.String, "count": fields.Integer})
+BOX = Model("Box", {
+    "label": fields.String,
+    "items": fields.List(fields.Nested(ITEM)),
+    "lid": fields.Nested(ITEM, allow_null=True),
+})
+
+
+class Thing:  # pylint: disable=too-few-public-methods
+    """A plain object with attributes"""
+
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class TestSerializer(TestCase):
+    """Test Cases for compile_serializer and dumps"""
+
+    def test_nested_models(self):
+        """It should follow nested models and lists of them"""
+        box = Thing(label="box", lid=None, items=[Thing(name="a", count=1), Thing(name="b", count=2)])
+        self.assertEqual(compile_serializer(BOX)(box), marshal(box, BOX))
+        box = Thing(label="box", lid=Thing(name="lid", count=0), items=None)
+        self.assertEqual(compile_serializer(BOX)(box), {"label": "box", "items": [], "lid": {"name": "lid", "count": 0}})
+
+    def test_only(self):
+        """It should keep only the selected fields"""
+        box = Thing(label="box", lid=None, items=[])
+        self.assertEqual(compile_serializer(BOX, ("label",))(box), {"label": "box"})
+        self.assertEqual(compile_serializer(BOX, ())(box), {})
+
+    def test_customer_matches_marshal(self):
+        """It should build the same Customer as serialize() + marshal"""
+        address = Address(address_id=7, street="1 Main St", city="Springfield", state="IL",
+                          country="USA", pin_code="62701", customer_id=1)
+        customer = Customer(id=1, first_name="Ada", last_name="Lovelace", email="ada@example.com",
+                            password="x" * 64, active=True, version=3, addresses=[address],
+                            created_at=datetime(2023, 4, 1, 12, 30, tzinfo=timezone.utc),
+                            updated_at=datetime(2023, 4, 2, 8, 0, 5, 250, tzinfo=timezone.utc))
+        self.assertEqual(serialize_customer(customer), dict(marshal(customer.serialize(), customer_model)))
+        self.assertEqual(serialize_customer(customer)["created_at"], "2023-04-01T12:30:00+00:00")
+
+    def test_dumps(self):
+        """It should encode compact JSON bytes with or without orjson"""
+        data = {"id": 1, "name": "Ada", "tags": [True, None]}
+        self.assertIsInstance(dumps(data), bytes)
+        self.assertEqual(json.loads(dumps(data)), data)
+        with patch.object(serializer, "orjson", None):
+            self.assertEqual(dumps(data), b'{"id":1,"name":"Ada","tags":[true,null]}')
+            self.assertEqual(dumps({"at": datetime(2023, 4, 1, tzinfo=timezone.utc)}),
+                             b'{"at":"2023-04-01T00:00:00+00:00"}')
+            self.assertRaises(TypeError, dumps, {"id": object()})
@@ -0,0 +1,122 @@
+"""
+Test cases for the single flight coalescing of concurrent reads
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from service.common.single_flight import SingleFlight
+
+
+class BlockingRead:  # pylint: disable=too-few-public-methods
+    """A read that runs until released, counting its runs"""
+
+    def __init__(self, result="value", error=None):
+        self.result = result
+        self.error = error
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def __call__(self):
+        self.runs += 1
+        self.started.set()
+        self.release.wait(5)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight(TestCase):
+    """Test Cases for SingleFlight"""
+
+    def setUp(self):
+        self.flights = SingleFlight()
+        self.executor = ThreadPoolExecutor(max_workers=4)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=True)
+
+    def wait_for_followers(self, count):
+        """Waits until count callers joined the running read"""
+        for _ in range(500):
+            if self.flights.stats()["coalesced"] >= count:
+                return
+            threading.Event().wait(0.01)
+        self.fail(f"{count} followers never joined")
+
+    def test_coalesce_concurrent_calls(self):
+        """It should run one read for concurrent calls of a key and share its result"""
+        read = BlockingRead(result={"id": 1})
+        leader = self.executor.submit(self.flights.do, ("customer", 1), read)
+        read.started.wait(5)
+        followers = [self.executor.submit(self.flights.do, ("customer", 1), read) for _ in range(3)]
+        self.wait_for_followers(3)
+        read.release.set()
+        results = [future.result(5) for future in [leader] + followers]
+        self.assertEqual(read.runs, 1)
+        self.assertTrue(all(result is results[0] for result in results))
+        stats = self.flights.stats()
+        self.assertEqual(stats["calls"], 4)
+        self.assertEqual(stats["executions"], 1)
+        self.assertEqual(stats["coalesced"], 3)
+        self.assertEqual(stats["coalesced_ratio"], 0.75)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_sequential_calls_run_again(self):
+        """It should not keep results once a read finished"""
+        self.assertEqual(self.flights.do(("customer", 1), lambda: 1), 1)
+        self.assertEqual(self.flights.do(("customer", 1), lambda: 2), 2)
+        self.assertEqual(self.flights.do(("customer", 2), lambda: 3), 3)
+        self.assertEqual(self.flights.stats()["executions"], 3)
+        self.assertEqual(self.flights.stats()["coalesced"], 0)
+
+    def test_share_errors(self):
+        """It should raise the error of the read in every waiting caller"""
+        read = BlockingRead(error=ValueError("boom"))
+        leader = self.executor.submit(self.flights.do, ("customer", 1), read)
+        read.started.wait(5)
+        follower = self.executor.submit(self.flights.do, ("customer", 1), read)
+        self.wait_for_followers(1)
+        read.release.set()
+        self.assertRaises(ValueError, leader.result, 5)
+        self.assertRaises(ValueError, follower.result, 5)
+        self.assertEqual(self.flights.stats()["errors"], 1)
+        self.assertEqual(self.flights.do(("customer", 1), lambda: "retried"), "retried")
+
+    def test_invalidate(self):
+        """It should start a new read for calls made after an invalidation"""
+        read = BlockingRead(result="before")
+        leader = self.executor.submit(self.flights.do, ("customer", 1), read)
+        read.started.wait(5)
+        self.flights.invalidate(("customer", 1))
+        self.assertEqual(self.flights.do(("customer", 1), lambda: "after"), "after")
+        read.release.set()
+        self.assertEqual(leader.result(5), "before")
+        stats = self.flights.stats()
+        self.assertEqual(stats["invalidations"], 1)
+        self.assertEqual(stats["executions"], 2)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_invalidate_group(self):
+        """It should drop every running read of a group"""
+        reads = [BlockingRead() for _ in range(3)]
+        keys = [("list", "a"), ("list", "b"), ("customer", 1)]
+        futures = [self.executor.submit(self.flights.do, key, read) for key, read in zip(keys, reads)]
+        for read in reads:
+            read.started.wait(5)
+        self.flights.invalidate_group("list")
+        stats = self.flights.stats()
+        self.assertEqual(stats["invalidations"], 2)
+        self.assertEqual(stats["in_flight"], 1)
+        for read in reads:
+            read.release.set()
+        for future in futures:
+            future.result(5)
+
+    def test_disabled(self):
+        """It should run every call when disabled"""
+        self.flights.enabled = False
+        self.assertEqual(self.flights.do(("customer", 1), lambda: 1), 1)
+        self.assertEqual(self.flights.stats()["calls"], 0)
+        self.flights.reset()
+        self.assertEqual(self.flights.stats()["coalesced_ratio"], 0.0)
@@ -0,0 +1,81 @@
+"""
+Test cases for the fingerprinted, precompressed static files
+"""
+import gzip
+import os
+import tempfile
+from unittest import TestCase
+from flask import Flask
+from service.common.static_assets import StaticAssets, fingerprint
+
+PAGE = b'<link href="static/css/site.css"><script src="static/js/app.js"></script><a href="static/missing.js">'
+SCRIPT = b"function hello() { return 'hello'; }\n" * 20
+
+
+class TestStaticAssets(TestCase):
+    """Test Cases for StaticAssets"""
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        files = {"index.html": PAGE, "css/site.css": b"body {}", "js/app.js": SCRIPT, "logo.png": b"\x89PNG" * 100}
+        for name, data in files.items():
+            path = os.path.join(self.folder.name, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as file:
+                file.write(data)
+        app = Flask(__name__, static_folder=self.folder.name, static_url_path="/static")
+        self.assets = StaticAssets()
+        self.assets.init_app(app)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_fingerprint(self):
+        """It should put the digest before the extension"""
+        self.assertEqual(fingerprint("js/app.min.js", "abc"), "js/app.min.abc.js")
+        self.assertEqual(fingerprint("LICENSE", "abc"), "LICENSE.abc")
+
+    def test_rewrite_pages(self):
+        """It should point the pages at the fingerprinted files"""
+        page = self.assets.assets["index.html"][0].bodies[None]
+        self.assertIn(f'href="static/{self.assets.manifest["css/site.css"]}"'.encode(), page)
+        self.assertIn(f'src="static/{self.assets.manifest["js/app.js"]}"'.encode(), page)
+        self.assertIn(b'href="static/missing.js"', page)
+        self.assertNotIn("index.html", self.assets.manifest)
+
+    def test_fingerprinted(self):
+        """It should serve fingerprinted files precompressed and cached for a year"""
+        path = f"/static/{self.assets.manifest['js/app.js']}"
+        resp = self.client.get(path, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.headers["Content-Encoding"], "gzip")
+        self.assertEqual(resp.headers["Cache-Control"], "public, max-age=31536000, immutable")
+        self.assertIn("Accept-Encoding", resp.headers["Vary"])
+        self.assertEqual(gzip.decompress(resp.data), SCRIPT)
+        resp = self.client.get(path, headers={"Accept-Encoding": "gzip", "If-None-Match": resp.headers["ETag"]})
+        self.assertEqual(resp.status_code, 304)
+
+    def test_plain_names(self):
+        """It should still serve the plain names, revalidated on every use"""
+        resp = self.client.get("/static/js/app.js")
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotIn("Content-Encoding", resp.headers)
+        self.assertEqual(resp.headers["Cache-Control"], "no-cache")
+        self.assertEqual(resp.data, SCRIPT)
+        identity_etag = resp.headers["ETag"]
+        resp = self.client.get("/static/js/app.js", headers={"Accept-Encoding": "gzip"})
+        self.assertNotEqual(resp.headers["ETag"], identity_etag)
+
+    def test_not_compressed(self):
+        """It should not compress binary or tiny files"""
+        for name in ("logo.png", "css/site.css"):
+            resp = self.client.get(f"/static/{name}", headers={"Accept-Encoding": "gzip"})
+            self.assertEqual(resp.status_code, 200)
+            self.assertNotIn("Content-Encoding", resp.headers)
+            self.assertNotIn("Vary", resp.headers)
+
+    def test_not_found(self):
+        """It should return 404 for unknown files"""
+        self.assertEqual(self.client.get("/static/nope.js").status_code, 404)
+        self.assertEqual(self.client.get("/static/../secret").status_code, 404)